@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# Benchmarks the single-threaded (zlib) and parallel gzip engines of convert_source on synthetic NifTi data.
+#
+# Usage:
+#   python benchmarks/bench_gzip.py [--size-mb 256] [--threads 0] [--level 6] [--repeat 3]
+#
+
+# Import packages and modules
+import os
+import sys
+import time
+import gzip
+import json
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import nibabel as nib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "convert_source"))
+
+import utils
+
+# Define functions
+
+def make_nii(out_dir, size_mb=256):
+    '''
+    Writes an uncompressed synthetic 4D (fMRI-like) NifTi file of roughly the requested size.
+
+    Arguments:
+        out_dir (string): Output directory
+        size_mb (int): Approximate size of the image data in MB
+
+    Returns:
+        nii_file (string): NifTi file
+    '''
+
+    rng = np.random.default_rng(0)
+
+    # Smooth background with noise, which compresses roughly like real int16 MR data
+    x, y, z = np.meshgrid(np.linspace(-1, 1, 96), np.linspace(-1, 1, 96), np.linspace(-1, 1, 60), indexing="ij")
+    brain = (1000 * np.exp(-(x**2 + y**2 + z**2) * 2)).astype(np.float32)
+    n_frames = max(1, int(size_mb * 1024 * 1024 // brain.nbytes * 2))
+
+    data = np.empty(brain.shape + (n_frames,), dtype=np.int16)
+    for frame in range(n_frames):
+        data[..., frame] = brain + rng.normal(0, 20, brain.shape)
+
+    nii_file = os.path.join(out_dir, "bench.nii")
+    nib.save(nib.Nifti1Image(data, np.eye(4)), nii_file)
+
+    return nii_file
+
+def run_engine(nii_file, engine, threads=0, level=6):
+    '''
+    Gzips a copy of the NifTi file with the selected engine.
+
+    Arguments:
+        nii_file (string): Uncompressed NifTi file
+        engine (string): 'zlib' or 'parallel'
+        threads (int): Number of threads of the parallel engine
+        level (int): Compression level
+
+    Returns:
+        out_file (string): Gzipped file
+        elapsed (float): Time (in seconds) taken to gzip the file
+    '''
+
+    work_file = nii_file[:-4] + f"_{engine}.nii"
+    shutil.copyfile(nii_file, work_file)
+
+    start = time.perf_counter()
+    if engine == "parallel":
+        out_file = utils.pgzip_file(work_file, cprss_lvl=level, threads=threads)
+    else:
+        out_file = utils.gzip_file(work_file, cprss_lvl=level)
+    elapsed = time.perf_counter() - start
+
+    return out_file, elapsed
+
+def verify(nii_file, gz_file):
+    '''
+    Verifies that the gzipped file decompresses (with gzip and nibabel) to the original file.
+
+    Arguments:
+        nii_file (string): Uncompressed NifTi file
+        gz_file (string): Gzipped NifTi file
+
+    Returns:
+        ok (boolean): True if the contents match
+    '''
+
+    with open(nii_file, "rb") as f:
+        orig = f.read()
+    with gzip.open(gz_file, "rb") as f:
+        ok = f.read() == orig
+
+    img = nib.load(gz_file)
+    ok = ok and np.array_equal(np.asanyarray(img.dataobj), np.asanyarray(nib.load(nii_file).dataobj))
+
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the throughput (MB/s) of the zlib and parallel gzip engines.")
+    parser.add_argument("--size-mb", type=int, default=256, help="Approximate size of the synthetic NifTi file in MB [default: 256]")
+    parser.add_argument("--threads", type=int, default=0, help="Threads of the parallel engine, the number of CPUs if 0 [default: 0]")
+    parser.add_argument("--level", type=int, default=6, help="Compression level [default: 6]")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of repetitions, the best time is reported [default: 3]")
+    parser.add_argument("--json", type=str, default="", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_gzip_")
+
+    try:
+        nii_file = make_nii(tmp_dir, args.size_mb)
+        size_mb = os.path.getsize(nii_file) / (1024 * 1024)
+
+        results = dict()
+        for engine in ["zlib", "parallel"]:
+            times = list()
+            for _ in range(args.repeat):
+                gz_file, elapsed = run_engine(nii_file, engine, threads=args.threads, level=args.level)
+                times.append(elapsed)
+            best = min(times)
+            results[engine] = {"seconds": best,
+                               "mb_per_s": size_mb / best,
+                               "ratio": os.path.getsize(gz_file) / os.path.getsize(nii_file),
+                               "verified": verify(nii_file, gz_file)}
+
+        print(f"Input: {size_mb:.1f} MB, level {args.level}, {os.cpu_count()} CPUs, threads {args.threads or os.cpu_count()}")
+        for engine, res in results.items():
+            print(f"{engine:>9}: {res['mb_per_s']:8.1f} MB/s  {res['seconds']:7.2f} s  ratio {res['ratio']:.3f}  verified {res['verified']}")
+        print(f"  speedup: {results['zlib']['seconds'] / results['parallel']['seconds']:.2f}x")
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"size_mb": size_mb, "level": args.level, "cpus": os.cpu_count(), "results": results}, f, indent=2)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# Startup (import time) benchmark of convert_source. Runs convert_source.py --version and --help, and imports each
+# module in a fresh interpreter with 'python -X importtime', and reports the wall clock time, the import time, the
+# slowest imports, and which heavy dependencies (numpy, nibabel, pydicom) were imported.
+#
+# Usage:
+#   python benchmarks/bench_import.py [--repeat 10] [--top 5] [--max-ms 100] [--json results.json]
+#
+
+# Import packages and modules
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+import fixtures
+
+CONVERT_SOURCE = os.path.join(fixtures.SRC_DIR, "convert_source.py")
+
+# Dependencies that should only be imported when they are used
+HEAVY_MODULES = ["numpy", "nibabel", "pydicom", "yaml", "asyncio", "sqlite3"]
+
+# Scenarios: name, and interpreter arguments
+SCENARIOS = [("--version", [CONVERT_SOURCE, "--version"]),
+             ("--help", [CONVERT_SOURCE, "--help"]),
+             ("import utils", ["-c", "import utils"]),
+             ("import convert_source_dcm", ["-c", "import convert_source_dcm"]),
+             ("import convert_source_par", ["-c", "import convert_source_par"]),
+             ("import convert_source_nii", ["-c", "import convert_source_nii"]),
+             ("import convert_source_backend", ["-c", "import convert_source_backend"])]
+
+# Define functions
+
+def parse_importtime(stderr):
+    '''
+    Parses the output of 'python -X importtime'.
+
+    Arguments:
+        stderr (string): Standard error of the interpreter
+
+    Returns:
+        imports (list): List of (module, self time, cumulative time, depth) tuples, times in microseconds
+    '''
+
+    imports = list()
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        [self_us, cumulative_us, name] = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+
+    return imports
+
+def run_scenario(args, env, repeat=10):
+    '''
+    Runs a scenario in fresh interpreters.
+
+    Arguments:
+        args (list): Interpreter arguments
+        env (dict): Environment variables
+        repeat (int): Number of repetitions, the best time is reported
+
+    Returns:
+        seconds (float): Best wall clock time
+        imports (list): Imports of the last repetition (see 'parse_importtime')
+    '''
+
+    times = list()
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, env=env, cwd=fixtures.SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + args, env=env, cwd=fixtures.SRC_DIR,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    return min(times), parse_importtime(proc.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup (import time) benchmark of convert_source.py and its modules.")
+    parser.add_argument("--repeat", type=int, default=10, help="Number of repetitions, the best time is reported [default: 10]")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest (cumulative) imports printed per scenario [default: 5]")
+    parser.add_argument("--max-ms", type=float, default=0, help="Exit with a non-zero status if '--version' takes longer (in ms), no limit if 0 [default: 0]")
+    parser.add_argument("--json", type=str, default="", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    # Bytecode is cached as in an installed package (a first run writes the cache)
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    subprocess.run([sys.executable, "-c", "import utils, convert_source_dcm, convert_source_par, convert_source_nii, convert_source_backend"],
+                   env=env, cwd=fixtures.SRC_DIR, check=True)
+
+    [baseline, _] = run_scenario(["-c", "pass"], env, repeat=args.repeat)
+    print(f"{'python -c pass':<30} {baseline * 1000:8.1f} ms")
+
+    results = {"python": platform.python_version(),
+               "platform": platform.platform(),
+               "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "interpreter_ms": baseline * 1000,
+               "scenarios": dict()}
+
+    for name, scenario_args in SCENARIOS:
+        [seconds, imports] = run_scenario(scenario_args, env, repeat=args.repeat)
+        import_us = sum(cumulative for _, _, cumulative, depth in imports if depth == 0)
+        heavy = [module for module in HEAVY_MODULES if module in [imported for imported, _, _, _ in imports]]
+
+        print(f"{name:<30} {seconds * 1000:8.1f} ms (imports {import_us / 1000:6.1f} ms), heavy modules: {', '.join(heavy) or 'none'}")
+        for module, _, cumulative, _ in sorted(imports, key=lambda item: item[2], reverse=True)[:args.top]:
+            print(f"{'':<32}{cumulative / 1000:8.1f} ms  {module}")
+
+        results["scenarios"][name] = {"ms": seconds * 1000,
+                                      "import_ms": import_us / 1000,
+                                      "heavy_modules": heavy}
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    version_ms = results["scenarios"]["--version"]["ms"]
+    if args.max_ms and version_ms > args.max_ms:
+        print(f"--version took {version_ms:.1f} ms (limit: {args.max_ms:.1f} ms)")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
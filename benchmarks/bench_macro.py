@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+# End-to-end (macro) benchmark of convert_source.py. Generates a synthetic session (see fixtures.make_session),
+# puts a stand-in dcm2niix (fake_dcm2niix.py) on the PATH, and runs convert_source.py on the session. Reports
+# series/s, bytes/s (of source data), and the peak RSS of the child processes, and compares the results to a
+# stored baseline.
+#
+# Usage:
+#   python benchmarks/bench_macro.py [--file-type PAR] [--n-bold 4] [--jobs 2] [--baseline baseline.json] [--save-baseline]
+#
+
+# Import packages and modules
+import os
+import sys
+import glob
+import json
+import stat
+import time
+import shutil
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import fixtures
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CONVERT_SOURCE = os.path.join(fixtures.SRC_DIR, "convert_source.py")
+
+# Define functions
+
+def make_fake_bin(bin_dir):
+    '''
+    Creates a 'dcm2niix' executable in a directory that runs the stand-in dcm2niix (fake_dcm2niix.py).
+
+    Arguments:
+        bin_dir (string): Directory to put on the PATH
+
+    Returns:
+        exe (string): Stand-in dcm2niix executable
+    '''
+
+    os.makedirs(bin_dir, exist_ok=True)
+    exe = os.path.join(bin_dir, "dcm2niix")
+    with open(exe, "w") as file:
+        file.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCH_DIR, "fake_dcm2niix.py")}" "$@"\n')
+    os.chmod(exe, os.stat(exe).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    return exe
+
+def run_convert(data_dir, out_dir, bin_dir, file_type="PAR", jobs=1, extra_args=[]):
+    '''
+    Runs convert_source.py on a session, with the stand-in dcm2niix on the PATH.
+
+    Arguments:
+        data_dir (string): Session (source data) directory
+        out_dir (string): Output BIDS directory (removed first)
+        bin_dir (string): Directory of the stand-in dcm2niix
+        file_type (string): Source data format: PAR or DCM
+        jobs (int): Number of series converted in parallel
+        extra_args (list): Additional command line arguments for convert_source.py
+
+    Returns:
+        seconds (float): Wall clock time
+    '''
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    env = dict(os.environ)
+    env["PATH"] = bin_dir + os.pathsep + env.get("PATH", "")
+
+    cmd = [sys.executable, CONVERT_SOURCE, "-s", "001", "-o", out_dir, "-d", data_dir, "-c", fixtures.CONFIG_FILE,
+           "-f", file_type, "-j", str(jobs)] + list(extra_args)
+
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, env=env, cwd=fixtures.SRC_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    seconds = time.perf_counter() - start
+
+    if proc.returncode != 0 or "Failed to convert" in proc.stdout:
+        raise RuntimeError(f"convert_source.py failed:\n{proc.stdout}")
+
+    return seconds
+
+def compare(results, baseline, tolerance=0.1):
+    '''
+    Compares results to a baseline. Results are only compared to a baseline recorded with the same benchmark 
+    configuration, as the throughput of different configurations is not comparable.
+
+    Arguments:
+        results (dict): Benchmark results
+        baseline (dict): Baseline results
+        tolerance (float): Relative slowdown that is reported as a regression
+
+    Returns:
+        regression (bool): True if the throughput dropped by more than the tolerance, False if the configurations differ
+    '''
+
+    if baseline.get("config") != results["config"]:
+        print(f"Config mismatch: baseline was recorded with {baseline.get('config')}, not compared (use --save-baseline to record one for this configuration).")
+        return False
+
+    regression = False
+    for key in ["series_per_s", "bytes_per_s"]:
+        ratio = results[key] / baseline[key]
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  REGRESSION"
+            regression = True
+        print(f"{key:>14}: {results[key]:12.2f} vs baseline {baseline[key]:12.2f} ({ratio:.2f}x){flag}")
+
+    ratio = results["peak_rss_mb"] / baseline["peak_rss_mb"]
+    print(f"{'peak_rss_mb':>14}: {results['peak_rss_mb']:12.1f} vs baseline {baseline['peak_rss_mb']:12.1f} ({ratio:.2f}x)")
+
+    return regression
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of convert_source.py with a synthetic session and a stand-in dcm2niix.")
+    parser.add_argument("--file-type", type=str, default="PAR", choices=["PAR", "DCM"], help="Source data format [default: PAR]")
+    parser.add_argument("--n-anat", type=int, default=2, help="Number of anatomical scans [default: 2]")
+    parser.add_argument("--n-bold", type=int, default=4, help="Number of multiband BOLD scans [default: 4]")
+    parser.add_argument("--n-dwi", type=int, default=1, help="Number of DWI scans [default: 1]")
+    parser.add_argument("--n-fmap", type=int, default=1, help="Number of fieldmaps [default: 1]")
+    parser.add_argument("--matrix", type=int, default=64, help="In-plane matrix size [default: 64]")
+    parser.add_argument("--slices", type=int, default=32, help="Number of slices [default: 32]")
+    parser.add_argument("--dyns", type=int, default=20, help="Number of BOLD dynamics [default: 20]")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of series converted in parallel (convert_source.py --jobs) [default: 1]")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of repetitions, the best time is reported [default: 3]")
+    parser.add_argument("--args", type=str, nargs=argparse.REMAINDER, default=[], help="Additional arguments for convert_source.py (must be last)")
+    parser.add_argument("--json", type=str, default="", help="Write results to this JSON file")
+    parser.add_argument("--baseline", type=str, default=os.path.join(BENCH_DIR, "baseline_macro.json"), help="Baseline JSON file [default: benchmarks/baseline_macro.json]")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression [default: 0.1]")
+    args = parser.parse_args()
+
+    config = {"file_type": args.file_type, "n_anat": args.n_anat, "n_bold": args.n_bold, "n_dwi": args.n_dwi, "n_fmap": args.n_fmap,
+              "matrix": args.matrix, "slices": args.slices, "dyns": args.dyns, "jobs": args.jobs, "args": args.args}
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_macro_")
+
+    try:
+        data_dir = os.path.join(tmp_dir, "source")
+        out_dir = os.path.join(tmp_dir, "bids")
+        bin_dir = os.path.join(tmp_dir, "bin")
+        make_fake_bin(bin_dir)
+
+        [source_files, source_bytes] = fixtures.make_session(data_dir, file_type=args.file_type, n_anat=args.n_anat, n_bold=args.n_bold,
+                                                             n_dwi=args.n_dwi, n_fmap=args.n_fmap, matrix=args.matrix, slices=args.slices,
+                                                             dyns=args.dyns)
+        n_series = args.n_anat + args.n_bold + args.n_dwi + args.n_fmap
+
+        times = [run_convert(data_dir, out_dir, bin_dir, file_type=args.file_type, jobs=args.jobs, extra_args=args.args) for _ in range(args.repeat)]
+        seconds = min(times)
+
+        n_outputs = len(glob.glob(os.path.join(out_dir, "sub-*", "ses-*", "*", "*.nii*")))
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+        results = {"config": config,
+                   "python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "cpus": os.cpu_count(),
+                   "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "series": n_series,
+                   "outputs": n_outputs,
+                   "source_bytes": source_bytes,
+                   "seconds": seconds,
+                   "series_per_s": n_series / seconds,
+                   "bytes_per_s": source_bytes / seconds,
+                   "peak_rss_mb": peak_rss_mb}
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print(f"{n_series} series ({source_bytes / 1024**2:.1f} MB, {n_outputs} NifTi outputs) in {seconds:.2f} s: "
+          f"{results['series_per_s']:.2f} series/s, {results['bytes_per_s'] / 1024**2:.2f} MB/s, peak RSS {peak_rss_mb:.1f} MB")
+
+    regression = False
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            regression = compare(results, json.load(file), tolerance=args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if regression:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+#
+# Microbenchmarks of the convert_source hot paths on synthetic fixtures (see fixtures.py). Runs offline,
+# without dcm2niix or FSL.
+#
+# Usage:
+#   python benchmarks/bench_micro.py [--sizes 10 100 1000] [--repeat 3] [--only NAME ...] [--json results.json]
+#
+
+# Import packages and modules
+import os
+import json
+import time
+import shutil
+import random
+import platform
+import argparse
+import tempfile
+
+import fixtures
+
+import utils
+import convert_source as cs
+import convert_source_nii as csn
+
+# Define functions
+
+def best_time(func, repeat=3):
+    '''
+    Times a function call.
+
+    Arguments:
+        func (function): Function without arguments
+        repeat (int): Number of repetitions
+
+    Returns:
+        seconds (float): Best (lowest) time of the repetitions
+    '''
+
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+def bench_create_file_list(tmp_dir, n):
+    dcm_dir = fixtures.make_dcm_tree(os.path.join(tmp_dir, "dcm"), n_series=n, n_instances=4)
+    par_dir = os.path.join(tmp_dir, "par")
+    fixtures.make_par_dir(par_dir, n_series=n)
+    nii_dir = os.path.join(tmp_dir, "nii")
+    fixtures.make_nii_dir(nii_dir, n_series=n)
+    index_file = os.path.join(tmp_dir, "index.json")
+
+    return {"dcm": lambda: cs.create_file_list(dcm_dir, "dcm"),
+            "dcm_indexed": lambda: cs.create_file_list(dcm_dir, "dcm", index_file=index_file),
+            "par": lambda: cs.create_file_list(par_dir, "PAR"),
+            "nii": lambda: cs.create_file_list(nii_dir, "nii")}
+
+def bench_file_exclude(tmp_dir, n):
+    [_, exclusion_list, _] = cs.read_config(fixtures.CONFIG_FILE)
+    data_dir = os.path.join(tmp_dir, "data")
+    file_list = [os.path.join(data_dir, f"sub_{fixtures.SERIES_TYPES[i % len(fixtures.SERIES_TYPES)][0]}_{i:05d}.PAR") for i in range(n)]
+    os.makedirs(data_dir, exist_ok=True)
+
+    return {"par": lambda: cs.file_exclude(file_list, data_dir, exclusion_list)}
+
+def bench_classification(tmp_dir, n):
+    [search_dict, _, _] = cs.read_config(fixtures.CONFIG_FILE)
+    files = [f"/data/sub_{fixtures.SERIES_TYPES[i % len(fixtures.SERIES_TYPES)][1].replace(' ', '_')}_{i:05d}.PAR" for i in range(n)]
+    terms = [term for scan_type in search_dict.values() if isinstance(scan_type, dict)
+             for scan in scan_type.values() if isinstance(scan, list) for term in scan]
+
+    return {"search_modality": lambda: [utils.search_modality(search_dict, file) for file in files],
+            "list_in_substr": lambda: [utils.list_in_substr(terms, file) for file in files]}
+
+def bench_get_metadata(tmp_dir, n):
+    [_, _, meta_dict] = cs.read_config(fixtures.CONFIG_FILE)
+    scan_types = [("anat", ""), ("func", "rest"), ("dwi", ""), ("fmap", "")]
+
+    return {"config": lambda: [utils.get_metadata(meta_dict, *scan_types[i % len(scan_types)]) for i in range(n)]}
+
+def _make_sources(tmp_dir, n, etl=1):
+    dcm_dir = fixtures.make_dcm_tree(os.path.join(tmp_dir, "dcm"), n_series=n, n_instances=1)
+    dcm_files = cs.create_file_list(dcm_dir, "dcm", order="none")
+    par_files = fixtures.make_par_dir(os.path.join(tmp_dir, "par"), n_series=n, etl=etl)
+    nii_files = fixtures.make_nii_dir(os.path.join(tmp_dir, "nii"), n_series=n)
+    json_files = [file[:-7] + ".json" for file in nii_files]
+
+    return dcm_files, par_files, nii_files, json_files
+
+def bench_get_data_params(tmp_dir, n):
+    [dcm_files, par_files, nii_files, json_files] = _make_sources(tmp_dir, n)
+
+    return {"dcm": lambda: [csn.get_data_params(file, json_file) for file, json_file in zip(dcm_files, json_files)],
+            "par": lambda: [csn.get_data_params(file, json_file) for file, json_file in zip(par_files, json_files)],
+            "nii": lambda: [csn.get_data_params(file, json_file) for file, json_file in zip(nii_files, json_files)]}
+
+def bench_calc_read_time(tmp_dir, n):
+    [dcm_files, par_files, _, json_files] = _make_sources(tmp_dir, n, etl=35)
+
+    return {"dcm": lambda: [utils.calc_read_time(file, json_file) for file, json_file in zip(dcm_files, json_files)],
+            "par": lambda: [utils.calc_read_time(file, json_file) for file, json_file in zip(par_files, json_files)]}
+
+def bench_gzip_file(tmp_dir, n):
+    # Image size of about n/10 MB (at least 2 MB, the default sizes give 2, 10 and 100 MB)
+    size_mb = max(1, n // 10)
+    shape = (128, 128, 64, max(1, size_mb // 2))
+    [nii_file, _] = fixtures.make_nii(os.path.join(tmp_dir, "image.nii"), shape=shape)
+    work_file = os.path.join(tmp_dir, "work.nii")
+
+    def run():
+        shutil.copyfile(nii_file, work_file)
+        utils.gzip_file(work_file)
+
+    return {f"{os.path.getsize(nii_file) // (1024 * 1024)}MB": run}
+
+def bench_update_json(tmp_dir, n):
+    nii_files = fixtures.make_nii_dir(os.path.join(tmp_dir, "nii"), n_series=min(n, 100), shape=(2, 2, 2))
+    json_files = [file[:-7] + ".json" for file in nii_files]
+    info = {"Manufacturer": "Philips", "MagneticFieldStrength": 3, "TaskName": "rest", "SliceTiming": [i * 0.05 for i in range(60)]}
+
+    return {"update": lambda: [utils.update_json(json_files[i % len(json_files)], info) for i in range(n)]}
+
+def bench_get_num_runs(tmp_dir, n):
+    out_dir = os.path.join(tmp_dir, "sub-001", "ses-001", "anat")
+    os.makedirs(out_dir)
+    for i in range(n):
+        for ext in [".nii.gz", ".json"]:
+            open(os.path.join(out_dir, f"sub-001_ses-001_run-{i + 1:02d}_T1w{ext}"), "w").close()
+
+    return {"T1w": lambda: utils.get_num_runs(out_dir, "T1w", ses="001")}
+
+def bench_nii_header(tmp_dir, n):
+    # 4D images, so that reading the header only (rather than the image) matters
+    nii_files = fixtures.make_nii_dir(os.path.join(tmp_dir, "nii"), n_series=n, shape=(64, 64, 32, 10))
+
+    def run():
+        csn._read_nii_header.cache_clear()
+        return [(csn.get_nii_tr(file), csn.get_num_frames(file)) for file in nii_files]
+
+    return {"cold": run,
+            "cached": lambda: [(csn.get_nii_tr(file), csn.get_num_frames(file)) for file in nii_files]}
+
+# Benchmarks: name, setup function (returns a dictionary of cases), and the sizes
+# used for the benchmark (capped at the given maximum)
+BENCHMARKS = [("create_file_list", bench_create_file_list, 1000),
+              ("file_exclude", bench_file_exclude, 100000),
+              ("classification", bench_classification, 100000),
+              ("get_metadata", bench_get_metadata, 100000),
+              ("get_data_params", bench_get_data_params, 1000),
+              ("calc_read_time", bench_calc_read_time, 1000),
+              ("gzip_file", bench_gzip_file, 1000),
+              ("update_json", bench_update_json, 10000),
+              ("get_num_runs", bench_get_num_runs, 1000),
+              ("nii_header", bench_nii_header, 100)]
+
+def run_benchmarks(sizes=[10, 100, 1000], repeat=3, only=[]):
+    '''
+    Runs the benchmarks at each size. Each benchmark is set up in a fresh temporary directory.
+
+    Arguments:
+        sizes (list): Data sizes (number of series/files/calls)
+        repeat (int): Number of repetitions, the best time is reported
+        only (list): Names of the benchmarks to run, all if empty
+
+    Returns:
+        results (list): List of dictionaries with the keys: name, case, size, seconds, and per_item
+    '''
+
+    results = list()
+
+    for name, setup, max_size in BENCHMARKS:
+        if only and not name in only:
+            continue
+        for size in sorted(set(min(size, max_size) for size in sizes)):
+            tmp_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+            try:
+                cases = setup(tmp_dir, size)
+                for case, func in cases.items():
+                    # Warm up (e.g. imports, file system cache)
+                    func()
+                    seconds = best_time(func, repeat)
+                    results.append({"name": name, "case": case, "size": size, "seconds": seconds, "per_item": seconds / size})
+                    print(f"{name:>17} {case:>16} n={size:<6} {seconds * 1e3:10.3f} ms  {seconds / size * 1e6:10.2f} us/item", flush=True)
+            finally:
+                shutil.rmtree(tmp_dir)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the convert_source hot paths (offline, synthetic data).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Data sizes [default: 10 100 1000]")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of repetitions, the best time is reported [default: 3]")
+    parser.add_argument("--only", type=str, nargs="+", default=[], help=f"Only run these benchmarks: {', '.join(name for name, _, _ in BENCHMARKS)}")
+    parser.add_argument("--json", type=str, default="", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    random.seed(0)
+
+    results = run_benchmarks(sizes=args.sizes, repeat=args.repeat, only=args.only)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "cpus": os.cpu_count(),
+                       "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "sizes": args.sizes,
+                       "repeat": args.repeat,
+                       "results": results}, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Stand-in for dcm2niix, used by the macro benchmark (bench_macro.py). Accepts the dcm2niix command line used by
+# convert_source ('-f basename', '-o out_dir', '-z y|n', last argument the source file), and writes deterministic
+# NifTi, JSON, bval, and bvec outputs. The image size is derived from the size of the source data, and the outputs
+# mimic dcm2niix for DWI (bval/bvec) and Philips B0 fieldmaps (magnitude and '_real' fieldmap images).
+#
+
+# Import packages and modules
+import os
+import sys
+import glob
+import json
+import numpy as np
+import nibabel as nib
+
+# Define functions
+
+def source_bytes(src):
+    '''
+    Returns the size of the source data: the REC file of a PAR file, or the DICOM files in the directory of a DICOM file.
+    '''
+
+    if src.upper().endswith(".PAR"):
+        recs = glob.glob(src[:-4] + ".[Rr][Ee][Cc]")
+        return os.path.getsize(recs[0]) if recs else os.path.getsize(src)
+    if os.path.isdir(src):
+        src_dir = src
+    else:
+        src_dir = os.path.dirname(src)
+    return sum(entry.stat().st_size for entry in os.scandir(src_dir) if entry.is_file())
+
+def write_image(file, n_bytes, is_4d, vol_shape=(64, 64, 32)):
+    '''
+    Writes an int16 NifTi image of about 'n_bytes' bytes.
+    '''
+
+    vol_voxels = int(np.prod(vol_shape))
+    n_vols = max(1, -(-(n_bytes // 2) // vol_voxels))
+    shape = vol_shape + (n_vols,) if is_4d and n_vols > 1 else vol_shape[:2] + (vol_shape[2] * n_vols,)
+    data = (np.arange(int(np.prod(shape)), dtype=np.int64) % 4000).astype(np.int16).reshape(shape)
+    img = nib.Nifti1Image(data, np.eye(4))
+    img.header.set_xyzt_units('mm', 'sec')
+    if len(shape) > 3:
+        img.header.set_zooms((1.0, 1.0, 1.0, 2.0))
+    nib.save(img, file)
+
+    return shape[3] if len(shape) > 3 else 1
+
+def main(argv):
+    basename = argv[argv.index('-f') + 1]
+    out_dir = argv[argv.index('-o') + 1]
+    gz = '-z' in argv and argv[argv.index('-z') + 1] == 'y'
+    src = argv[-1]
+
+    name = os.path.basename(src) if not os.path.isdir(src) else os.path.basename(src.rstrip(os.sep))
+    if not src.upper().endswith(".PAR"):
+        name = os.path.basename(os.path.dirname(src)) + name
+
+    ext = '.nii.gz' if gz else '.nii'
+    is_dwi = any(key in name for key in ('DTI', 'dwi', 'DWI'))
+    is_func = any(key in name for key in ('rsfMRI', 'rest', 'bold', 'FEEPI'))
+    is_fmap = 'map' in name
+    n_bytes = source_bytes(src)
+
+    if is_fmap:
+        n_bytes = n_bytes // 2
+
+    n_vols = write_image(os.path.join(out_dir, basename + ext), n_bytes, is_dwi or is_func)
+    sidecar = {"Modality": "MR", "Manufacturer": "Philips", "EchoTime": 0.03, "RepetitionTime": 2.0,
+               "ReconMatrixPE": 64, "PixelBandwidth": 30.0, "ConversionSoftware": "fake_dcm2niix"}
+    with open(os.path.join(out_dir, basename + '.json'), 'w') as file:
+        json.dump(sidecar, file, indent=4)
+
+    if is_dwi:
+        bvals = [0] + [1000] * (n_vols - 1)
+        vecs = [[0, 0, 0]] + [[(i % 3 == 0) * 1, (i % 3 == 1) * 1, (i % 3 == 2) * 1] for i in range(n_vols - 1)]
+        with open(os.path.join(out_dir, basename + '.bval'), 'w') as file:
+            file.write(" ".join(str(b) for b in bvals) + "\n")
+        with open(os.path.join(out_dir, basename + '.bvec'), 'w') as file:
+            for axis in range(3):
+                file.write(" ".join(str(vec[axis]) for vec in vecs) + "\n")
+
+    if is_fmap:
+        write_image(os.path.join(out_dir, basename + '_real' + ext), n_bytes, False)
+        with open(os.path.join(out_dir, basename + '_real.json'), 'w') as file:
+            json.dump(dict(sidecar, EchoTime=0.003), file, indent=4)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+'''
+Synthetic fixtures for the convert_source benchmarks: DICOM instances (pydicom), PAR/REC pairs, and NifTi files
+with JSON sidecars. All fixtures are deterministic and are generated offline.
+'''
+
+# Import packages and modules
+import os
+import sys
+import json
+import numpy as np
+import nibabel as nib
+from pydicom.dataset import FileDataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+# Make the convert_source modules importable
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "convert_source")
+if not SRC_DIR in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+# Default config file
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config.default.yml")
+
+# Series of a typical (Philips) neonatal session: (name, description/protocol, technique, scan type)
+SERIES_TYPES = [("T1_TFE", "T1 TFE SENSE 2", "T1TFE", "anat"),
+                ("T2_TSE", "T2 TSE SENSE 2", "TSE", "anat"),
+                ("rsfMRI", "rsfMRI SENSE 2 MB 6", "FEEPI", "func"),
+                ("DTI", "DTI SENSE 2", "DwiSE", "dwi"),
+                ("B0map", "B0map", "FFE", "fmap"),
+                ("SURVEY", "SURVEY", "FFE", "anat")]
+
+# Define functions
+
+def make_uid(*args):
+    '''
+    Creates a deterministic DICOM UID from the arguments.
+
+    Arguments:
+        *args: Values the UID is derived from
+
+    Returns:
+        uid (string): DICOM UID
+    '''
+
+    return generate_uid(entropy_srcs=[str(arg) for arg in args])
+
+def make_dcm(file, desc="T1 TFE SENSE 2", tech="T1TFE", series_uid="", inst=1, n=64, etl=1, wfs=10.5):
+    '''
+    Writes a (Philips style) MR DICOM instance, with the private technique (2001,1020) and water fat shift
+    (2001,1022) tags.
+
+    Arguments:
+        file (string): Output DICOM file
+        desc (string): Series description and protocol name
+        tech (string): Scan technique
+        series_uid (string): SeriesInstanceUID, derived from the description if left empty
+        inst (int): Instance number
+        n (int): Number of rows and columns of the (blank) image
+        etl (int): Echo train length
+        wfs (float): Water fat shift (pixels)
+
+    Returns:
+        file (string): Output DICOM file
+    '''
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.4'
+    meta.MediaStorageSOPInstanceUID = make_uid(file, inst)
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = FileDataset(file, {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Modality = 'MR'
+    ds.Manufacturer = 'Philips'
+    ds.SeriesInstanceUID = series_uid or make_uid(desc)
+    ds.SeriesDescription = desc
+    ds.ProtocolName = desc
+    ds.ImageType = ['ORIGINAL', 'PRIMARY', 'M_FFE', 'M', 'FFE']
+    ds.SeriesNumber = 1
+    ds.InstanceNumber = inst
+    ds.AcquisitionDuration = 120.5
+    ds.EchoTrainLength = etl
+    ds.add_new((0x2001, 0x1020), 'LO', tech)
+    ds.add_new((0x2001, 0x1022), 'FL', wfs)
+    ds.add_new((0x2001, 0x1083), 'DS', '127.7')
+    ds.Rows = n
+    ds.Columns = n
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.PixelRepresentation = 0
+    ds.PixelData = np.zeros((n, n), np.uint16).tobytes()
+    ds.save_as(file, enforce_file_format=True)
+
+    return file
+
+PAR_GENERAL = """# === DATA DESCRIPTION FILE ======================================================
+#
+# Dataset name: {name}
+#
+# CLINICAL TRYOUT             Research image export tool     V4.2
+#
+# === GENERAL INFORMATION ========================================================
+#
+.    Patient name                       :   bench
+.    Examination name                   :   bench
+.    Protocol name                      :   {protocol}
+.    Examination date/time              :   2019.01.01 / 10:00:00
+.    Series Type                        :   Image   MRSERIES
+.    Acquisition nr                     :   3
+.    Reconstruction nr                  :   1
+.    Scan Duration [sec]                :   {duration}
+.    Max. number of cardiac phases      :   1
+.    Max. number of echoes              :   1
+.    Max. number of slices/locations    :   {slices}
+.    Max. number of dynamics            :   {dyns}
+.    Max. number of mixes               :   1
+.    Patient position                   :   Head First Supine
+.    Preparation direction              :   Anterior-Posterior
+.    Technique                          :  {tech}
+.    Scan resolution  (x, y)            :   {nx}  {ny}
+.    Scan mode                          :   MS
+.    Repetition time [ms]               :   2000.000
+.    FOV (ap,fh,rl) [mm]                :   240.000  {fh}  240.000
+.    Water Fat shift [pixels]           :   {wfs}
+.    Angulation midslice(ap,fh,rl)[degr]:   0.000  0.000  0.000
+.    Off Centre midslice(ap,fh,rl) [mm] :   0.000  0.000  0.000
+.    Flow compensation <0=no 1=yes> ?   :   0
+.    Presaturation     <0=no 1=yes> ?   :   0
+.    Phase encoding velocity [cm/sec]   :   0.000000  0.000000  0.000000
+.    MTC               <0=no 1=yes> ?   :   0
+.    SPIR              <0=no 1=yes> ?   :   1
+.    EPI factor        <0,1=no EPI>     :   {etl}
+.    Dynamic scan      <0=no 1=yes> ?   :   {isdyn}
+.    Diffusion         <0=no 1=yes> ?   :   {isdiff}
+.    Diffusion echo time [ms]           :   0.0000
+.    Max. number of diffusion values    :   {nb}
+.    Max. number of gradient orients    :   {ng}
+.    Number of label types   <0=no ASL> :   0
+#
+# === PIXEL VALUES =============================================================
+#
+# === IMAGE INFORMATION DEFINITION =============================================
+#
+# === IMAGE INFORMATION ==========================================================
+#  sl ec  dyn ph ty    idx pix scan% rec size                (re)scale              window        angulation              offcentre        thick   gap   info      spacing     echo     dtime   ttime    diff  avg  flip    freq   RR-int  turbo delay b grad cont anis         diffusion       L.ty
+
+"""
+
+def make_par(file, protocol="WIP T1W SENSE 2", tech="T1TFE", slices=4, dyns=1, bvals=(0,), nx=16, ny=16, etl=1, wfs=10.5, duration=300, types=(0,)):
+    '''
+    Writes a (V4.2) PAR header and the corresponding (uint16) REC file.
+
+    Arguments:
+        file (string): Output PAR file
+        protocol (string): Protocol name
+        tech (string): Scan technique
+        slices (int): Number of slices
+        dyns (int): Number of dynamics
+        bvals (tuple): b-values (a single b-value for non-diffusion scans), three gradient directions are used per non-zero b-value
+        nx (int): Number of columns
+        ny (int): Number of rows
+        etl (int): EPI factor
+        wfs (float): Water fat shift (pixels)
+        duration (float): Scan duration (sec)
+        types (tuple): Image types (0: magnitude, 1: real, 2: imaginary, 3: phase), e.g. (0, 1) for a B0 map
+
+    Returns:
+        file (string): Output PAR file
+    '''
+
+    grads = [(1, 0, 0), (0, 1, 0), (0, 0, 1)]
+
+    vols = list()
+    for dyn in range(1, dyns + 1):
+        if len(bvals) > 1:
+            vols.append((dyn, 1, 1, bvals[0], (0, 0, 0)))
+            for b_num, bval in enumerate(bvals[1:], start=2):
+                for g_num, grad in enumerate(grads, start=2):
+                    vols.append((dyn, b_num, g_num, bval, grad))
+        else:
+            vols.append((dyn, 1, 1, 0.0, (0, 0, 0)))
+
+    lines = list()
+    idx = 0
+    for type_, (dyn, b_num, g_num, bval, grad) in [(type_, vol) for type_ in types for vol in vols]:
+        for sl in range(1, slices + 1):
+            lines.append(f" {sl} 1 {dyn} 1 {type_} 2 {idx} 16 100 {nx} {ny} 0.00000 2.00000 0.50000 1070 1860 0.00 0.00 0.00 0.00 0.00 {sl*2.0:.2f} 2.000 0.000 0 1 0 2 1.500 1.500 10.00 {dyn*2.0:.2f} 0.00 {bval:.2f} 1 8.00 0 0 0 {etl} 0.0 {b_num} {g_num} 0 0 {grad[0]:.3f} {grad[1]:.3f} {grad[2]:.3f} 1")
+            idx = idx + 1
+
+    text = PAR_GENERAL.format(name=os.path.basename(file), protocol=protocol, duration=duration, slices=slices, dyns=dyns, tech=tech,
+                              nx=nx, ny=ny, fh=slices * 2.0, wfs=wfs, etl=etl, isdyn=int(dyns > 1), isdiff=int(len(bvals) > 1),
+                              nb=len(bvals), ng=len(grads) + 1 if len(bvals) > 1 else 1)
+    text = text + "\n".join(lines) + "\n\n# === END OF DATA DESCRIPTION FILE ===============================================\n"
+
+    with open(file, "w") as par:
+        par.write(text)
+
+    rec = os.path.splitext(file)[0] + ".REC"
+    (np.arange(idx * nx * ny) % 4000).astype("<u2").tofile(rec)
+
+    return file
+
+def make_nii(file, shape=(16, 16, 8), tr=2.0, sidecar=dict()):
+    '''
+    Writes a NifTi file (int16 ramp data) and a JSON sidecar.
+
+    Arguments:
+        file (string): Output NifTi file (.nii or .nii.gz)
+        shape (tuple): Image shape (3D or 4D)
+        tr (float): Repetition time (s), stored in the NifTi header and in the sidecar
+        sidecar (dict): Additional sidecar fields
+
+    Returns:
+        file (string): Output NifTi file
+        json_file (string): Output JSON sidecar
+    '''
+
+    data = (np.arange(int(np.prod(shape))) % 4000).astype(np.int16).reshape(shape)
+    img = nib.Nifti1Image(data, np.eye(4))
+    img.header.set_xyzt_units('mm', 'sec')
+    zooms = list(img.header.get_zooms())
+    if len(shape) > 3:
+        zooms[3] = tr
+    img.header.set_zooms(zooms)
+    nib.save(img, file)
+
+    json_file = file[:-7] if file.endswith('.nii.gz') else file[:-4]
+    json_file = json_file + '.json'
+    info = {"RepetitionTime": tr, "EchoTime": 0.03, "ReconMatrixPE": 64, "PixelBandwidth": 30.0, "EchoTrainLength": 35}
+    info.update(sidecar)
+    with open(json_file, "w") as out:
+        json.dump(info, out, indent=4)
+
+    return file, json_file
+
+def make_dcm_tree(out_dir, n_series=10, n_instances=4):
+    '''
+    Writes a DICOM directory with one sub-directory per series, cycling through 'SERIES_TYPES'.
+
+    Arguments:
+        out_dir (string): Output directory
+        n_series (int): Number of series
+        n_instances (int): Number of instances per series
+
+    Returns:
+        out_dir (string): Output directory
+    '''
+
+    for series in range(n_series):
+        [name, desc, tech, _] = SERIES_TYPES[series % len(SERIES_TYPES)]
+        series_dir = os.path.join(out_dir, f"{name}_{series:04d}")
+        os.makedirs(series_dir, exist_ok=True)
+        uid = make_uid(out_dir, series)
+        for inst in range(1, n_instances + 1):
+            make_dcm(os.path.join(series_dir, f"IM_{inst:04d}.dcm"), desc=desc, tech=tech, series_uid=uid, inst=inst, n=16)
+
+    return out_dir
+
+def make_par_dir(out_dir, n_series=10, **kwargs):
+    '''
+    Writes a PAR REC directory, cycling through 'SERIES_TYPES'.
+
+    Arguments:
+        out_dir (string): Output directory
+        n_series (int): Number of series
+        **kwargs: Additional keyword arguments for 'make_par'
+
+    Returns:
+        par_files (list): List of PAR files
+    '''
+
+    os.makedirs(out_dir, exist_ok=True)
+    par_files = list()
+
+    for series in range(n_series):
+        [name, desc, tech, _] = SERIES_TYPES[series % len(SERIES_TYPES)]
+        par_files.append(make_par(os.path.join(out_dir, f"sub_{name}_{series:04d}.PAR"), protocol=desc, tech=tech, **kwargs))
+
+    return par_files
+
+def make_nii_dir(out_dir, n_series=10, shape=(16, 16, 8)):
+    '''
+    Writes a directory of gzipped NifTi files with JSON sidecars, cycling through 'SERIES_TYPES'.
+
+    Arguments:
+        out_dir (string): Output directory
+        n_series (int): Number of series
+        shape (tuple): Image shape
+
+    Returns:
+        nii_files (list): List of NifTi files
+    '''
+
+    os.makedirs(out_dir, exist_ok=True)
+    nii_files = list()
+
+    for series in range(n_series):
+        [name, desc, tech, _] = SERIES_TYPES[series % len(SERIES_TYPES)]
+        [nii_file, _] = make_nii(os.path.join(out_dir, f"sub_{name}_{series:04d}.nii.gz"), shape=shape)
+        nii_files.append(nii_file)
+
+    return nii_files
+
+def make_session(out_dir, file_type="PAR", n_anat=2, n_bold=2, n_dwi=1, n_fmap=1, matrix=64, slices=32, dyns=20, n_dirs=6):
+    '''
+    Writes a synthetic (Philips style) session: T1w/T2w anatomical scans, multiband BOLD scans, DWI scans, 
+    B0 fieldmaps, and a survey (which is excluded by the default config file).
+
+    Arguments:
+        out_dir (string): Output directory
+        file_type (string): Source data format: 'PAR' (PAR REC pairs) or 'DCM' (one DICOM directory per series, one instance per slice)
+        n_anat (int): Number of anatomical scans (alternating T1w and T2w)
+        n_bold (int): Number of BOLD scans
+        n_dwi (int): Number of DWI scans
+        n_fmap (int): Number of fieldmaps
+        matrix (int): In-plane matrix size
+        slices (int): Number of slices
+        dyns (int): Number of dynamics of the BOLD scans
+        n_dirs (int): Number of gradient directions of the DWI scans (rounded up to a multiple of three)
+
+    Returns:
+        source_files (list): List of source files (PAR files, or DICOM directories)
+        source_bytes (int): Total size (in bytes) of the source data
+    '''
+
+    # (name, protocol, technique, number of volumes, extra PAR options)
+    series = list()
+    for i in range(n_anat):
+        series.append(("T1_TFE", "T1 TFE SENSE 2", "T1TFE", 1, dict()) if i % 2 == 0 else ("T2_TSE", "T2 TSE SENSE 2", "TSE", 1, dict()))
+    for i in range(n_bold):
+        series.append(("rsfMRI", "rsfMRI SENSE 2 MB 6", "FEEPI", dyns, {"etl": 35}))
+    for i in range(n_dwi):
+        n_b = max(1, -(-n_dirs // 3))
+        series.append(("DTI", "DTI SENSE 2", "DwiSE", 1 + 3 * n_b, {"etl": 35, "bvals": (0,) + (1000,) * n_b}))
+    for i in range(n_fmap):
+        series.append(("B0map", "B0map", "FFE", 1, {"types": (0, 1)}))
+    series.append(("SURVEY", "SURVEY", "FFE", 1, dict()))
+
+    os.makedirs(out_dir, exist_ok=True)
+    source_files = list()
+
+    for num, (name, protocol, tech, vols, opts) in enumerate(series):
+        if file_type.upper() == "PAR":
+            par_file = os.path.join(out_dir, f"sub_{name}_{num:03d}.PAR")
+            dyn = vols if "bvals" not in opts else 1
+            source_files.append(make_par(par_file, protocol=protocol, tech=tech, slices=slices, dyns=dyn, nx=matrix, ny=matrix, **opts))
+        else:
+            series_dir = os.path.join(out_dir, f"{name}_{num:03d}")
+            os.makedirs(series_dir, exist_ok=True)
+            uid = make_uid(out_dir, num)
+            for inst in range(1, slices * vols + 1):
+                make_dcm(os.path.join(series_dir, f"IM_{inst:05d}.dcm"), desc=protocol, tech=tech, series_uid=uid, inst=inst, n=matrix, etl=opts.get("etl", 1))
+            source_files.append(series_dir)
+
+    source_bytes = 0
+    for root, dirs, files in os.walk(out_dir):
+        source_bytes = source_bytes + sum(os.path.getsize(os.path.join(root, file)) for file in files if not "SURVEY" in root + file)
+
+    return source_files, source_bytes
@@ -15,8 +15,10 @@
 # Import packages and modules
 import os
 import sys
+import csv
+import re
 import glob
-import yaml
+import random
 import argparse
 
 
@@ -24,6 +26,7 @@ import argparse
 import convert_source_dcm as cdm
 import convert_source_par as csp
 import convert_source_nii as csn
+import convert_source_backend as csb
 import utils
 
 # Define functions
@@ -42,11 +45,13 @@ def read_config(config_file, verbose = False):
         verbose (boolean): Prints additional information to screen.
     
     Returns: 
-        data_map (dict): Nested dictionary of search terms for BIDS modalities
+        data_map (SearchDict): Nested dictionary of search terms for BIDS modalities, with the search terms compiled (see utils.SearchDict)
         exclusion_list (list): List of exclusion terms
         meta_dict (dict): Nested dictionary of metadata terms to write to JSON file(s)
     '''
     
+    import yaml
+    
     with open(config_file) as file:
         data_map = yaml.safe_load(file)
         if verbose:
@@ -71,10 +76,13 @@ def read_config(config_file, verbose = False):
         if verbose:
             print("no metadata settings")
         meta_dict = dict()
+
+    # Compile search terms for single pass modality searches
+    data_map = utils.SearchDict(data_map)
         
     return data_map,exclusion_list,meta_dict
 
-def create_file_list(data_dir, file_ext="", order="size"):
+def create_file_list(data_dir, file_ext="", order="size", index_file="", headers=None):
     '''
     Creates a file list by globbing a directory for a specific file
     extension and sorting by some determined order. A file list is 
@@ -84,12 +92,15 @@ def create_file_list(data_dir, file_ext="", order="size"):
         data_dir (string): Absolute path to data directory (must be a directory dump of image data)
         file_ext (string): File extension to glob. Built-in options include:
             - 'par' or 'PAR': Searches for PAR headers
-            - 'dcm' or 'DICOM': Searches for DICOM directories, then searches for one file from each DICOM directory
+            - 'dcm' or 'DICOM': Searches for DICOM series (grouped by SeriesInstanceUID), then selects one file from each DICOM series
             - 'nii', or 'Nifti': Searches for nifti files (including gzipped nifti files)
         order (string): Order to sort the list. Valid options are: 'size' and 'time':
             - 'size': sorts by file size in ascending order (default)
             - 'time': sorts by file modification time in ascending order
             - 'none': no sorting is applied and the list is generated as the system finds the files
+        index_file (string): JSON index file of DICOM headers, which is reused between runs (see 'convert_source_dcm.index_dcm_dir')
+        headers (dict): If given, the DICOM header fields of the listed DICOM files are added to this dictionary (keyed 
+            by filename), e.g. for 'file_exclude'. Left empty for other file types.
     
     Returns: 
         file_list (list): List of filenames, complete with their absolute paths.
@@ -121,20 +132,29 @@ def create_file_list(data_dir, file_ext="", order="size"):
         print("Unrecognized keyword option. Using default.")
     
     # Create file list
-    if file_ext == ".dcm":
-        file_list = sorted(cdm.get_dcm_files(data_dir), key=order_key, reverse=False)
-    elif file_ext != ".dcm":
-        file_names = os.path.join(data_dir, f"*{file_ext}")
-        file_list = sorted(glob.glob(file_names, recursive=True), key=order_key, reverse=False)
+    with utils.trace_span('create_file_list', data_dir):
+        if file_ext == ".dcm":
+            file_list = sorted(cdm.get_dcm_files(data_dir, index_file=index_file, headers=headers), key=order_key, reverse=False)
+        elif file_ext != ".dcm":
+            file_names = os.path.join(data_dir, f"*{file_ext}")
+            file_list = sorted(glob.glob(file_names, recursive=True), key=order_key, reverse=False)
     
     return file_list
 
-def file_exclude(file_list, data_dir, exclusion_list = [], verbose = False):
+# DICOM header fields that exclusion terms are matched against (with the '--exclude-headers' option)
+EXCLUDE_HEADER_FIELDS = ['SeriesDescription', 'ImageType']
+
+def file_exclude(file_list, data_dir, exclusion_list = [], verbose = False, header_fields = [], headers = None):
     '''
     Excludes files from the conversion process by removing filenames
     that contain words that match those found in the 'exclusion_list'
     from the 'read_config' function - should any files need/want to be 
-    excluded.
+    excluded. Words are matched (not case sensitive) against the path of
+    each file relative to 'data_dir' (i.e. the sub-directories and the
+    filename), and optionally against the DICOM header fields read when 
+    the file list was created (see 'create_file_list'). All words are 
+    matched with a single compiled pattern, and the file system is not 
+    accessed.
     
     If 'exclusion_list' is empty, then the original 'file_list' is returned.
     
@@ -143,50 +163,50 @@ def file_exclude(file_list, data_dir, exclusion_list = [], verbose = False):
         data_dir (string): Absolute path to parent directory that contains the image data
         exclusion_list (list): List of words to be matched. Filenames that contain these words will be excluded.
         verbose (bool): Boolean - True or False.
+        header_fields (list): DICOM header fields (e.g. SeriesDescription, ImageType) to also match the words against (default: none)
+        headers (dict): DICOM header fields keyed by filename (see 'create_file_list'), required for 'header_fields'. A warning
+            is printed if header fields are given without any headers, as only the filenames can then be matched.
     
     Returns: 
         currated_list (list): Currated list of filenames, with unwanted filenames removed.
     '''
-            
-    # Check file extension in file list
-    if 'dcm' in file_list[0]:
-        file_ext = "dcm"
-        file_ext = f".{file_ext.lower()}"
-    elif 'PAR' in file_list[0]:
-        file_ext = "PAR"
-        file_ext = f".{file_ext.upper()}"
-    elif 'nii' in file_list[0]:
-        file_ext = "nii"
-        file_ext = f".{file_ext.lower()}*" # Add wildcard for globbling gzipped files
-    else:
-        file_ext = ""
-        file_ext = f".{file_ext.lower()}"
     
-    # create set of lists
-    file_set = set(file_list)
+    if len(exclusion_list) == 0:
+        return list(file_list)
     
-    # create empty sets
-    currated_set = set()
-    exclusion_set = set()
+    with utils.trace_span('file_exclude', data_dir):
+        pattern = re.compile("|".join(re.escape(str(word)) for word in exclusion_list), re.IGNORECASE)
     
-    if len(exclusion_list) == 0:
-        currated_set = file_set
-    else:
-        for file in exclusion_list:
-            if file_ext == '.dcm':
-                dir_ = os.path.join(data_dir, f"*{file}*",f"*{file_ext}")
+        # Header fields of the DICOM files
+        if header_fields and not headers:
+            print(f"Warning: no DICOM headers to match the exclusion terms against, only filenames are matched: {data_dir}", file=sys.stderr)
+        if not headers:
+            headers = dict()
+    
+        data_dir = os.path.abspath(data_dir)
+    
+        currated_list = list()
+        excluded_list = list()
+    
+        # Preserve the order of the input file list (which determines run numbers)
+        for file in file_list:
+            [path, filename, ext] = utils.file_parts(os.path.relpath(file, data_dir))
+            strings = [os.path.join(path, filename)]
+        
+            fields = headers.get(file) or dict()
+            for field in header_fields:
+                value = fields.get(field, "")
+                if isinstance(value, list):
+                    value = "\\".join(value)
+                strings.append(str(value))
+        
+            if any(pattern.search(str_) for str_ in strings):
+                excluded_list.append(file)
             else:
-                dir_ = os.path.join(data_dir, f"*{file}*{file_ext}")
-            f_names = glob.glob(dir_, recursive=True)        
-            f_names_set = set(f_names)
-            if verbose:
-                if len(f_names_set) != 0:
-                    print(f"Excluded files: {f_names_set} \n")
-            exclusion_set.update(f_names_set)
-            
-        currated_set = file_set.difference(exclusion_set)
-
-    currated_list = list(currated_set)
+                currated_list.append(file)
+    
+    if verbose and excluded_list:
+        print(f"Excluded files: {excluded_list} \n")
     
     return currated_list
 
@@ -206,7 +226,7 @@ def get_scan_tech(bids_out_dir, sub, file, search_dict, meta_dict=dict(), ses=1,
         verbose (bool): Prints the scan_type, modality, and search terms used (e.g. func - bold - rest - ['rest', 'FFE'])
     
     Returns: 
-        None
+        converted_files (tuple): Converted (BIDS named) files
     '''
     
     if not meta_dict:
@@ -214,12 +234,12 @@ def get_scan_tech(bids_out_dir, sub, file, search_dict, meta_dict=dict(), ses=1,
 
     converted_files = list()
     
-    # Check file extension in file
+    # Check file type
     # Perform Scanning Techniqe Search
-    if '.dcm' in file.lower():
-        converted_files = cdm.get_dcm_scan_tech(bids_out_dir=bids_out_dir, sub=sub, dcm_file=file, search_dict=search_dict, meta_dict=meta_dict, ses=1, keep_unknown=keep_unknown, verbose=verbose)
+    if utils.is_dcm_file(file):
+        converted_files = cdm.get_dcm_scan_tech(bids_out_dir=bids_out_dir, sub=sub, dcm_file=file, search_dict=search_dict, meta_dict=meta_dict, ses=ses, keep_unknown=keep_unknown, verbose=verbose)
     elif '.PAR' in file.upper():
-        converted_files = csp.get_par_scan_tech(bids_out_dir=bids_out_dir, sub=sub, par_file=file, search_dict=search_dict, meta_dict=meta_dict, ses=1, keep_unknown=keep_unknown, verbose=verbose)
+        converted_files = csp.get_par_scan_tech(bids_out_dir=bids_out_dir, sub=sub, par_file=file, search_dict=search_dict, meta_dict=meta_dict, ses=ses, keep_unknown=keep_unknown, verbose=verbose)
     else:
         if verbose:
             print("unknown modality")
@@ -250,68 +270,365 @@ def convert_modality(bids_out_dir, sub, file, search_dict, meta_dict=dict(), ses
         keep_unknown (bool): Convert modalities/scans which cannot be identified (default: True)
         verbose (bool): Prints the scan_type, modality, and search terms used (e.g. func - bold - rest - ['rest', 'FFE'])
     
+    Returns: 
+        converted_files (tuple): Converted (BIDS named) files
+    '''
+    
+    converted_files = list()
+    
+    with utils.trace_span('convert_modality', file):
+        # Check file type
+        if utils.is_dcm_file(file):
+            if not cdm.is_valid_dcm(file,verbose):
+                sys.exit(f"Invalid DICOM file. Please check {file}")
+        
+        # Search filename with the (compiled) search terms
+        with utils.trace_span('search_modality', file):
+            hit = utils.search_modality(search_dict, file)
+        
+        if hit:
+            [scan_type, scan, task] = hit
+            if verbose:
+                print(f"{scan_type} - {scan} - {task}: {file}")
+            converted_files = csn.data_to_bids(bids_out_dir=bids_out_dir,file=file,sub=sub,scan_type=scan_type,scan=scan,task=task,meta_dict=meta_dict,ses=ses)
+        else:
+            converted_files = get_scan_tech(bids_out_dir=bids_out_dir, sub=sub, file=file, search_dict=search_dict, meta_dict=meta_dict, ses=ses, keep_unknown=keep_unknown, verbose=verbose)
+    
+    return converted_files
+
+def plan_modality(bids_out_dir, sub, file, search_dict, meta_dict=dict(), ses=1, keep_unknown=True, verbose=False, runs=None):
+    '''
+    Plans the conversion of an image file as 'convert_modality' would convert it (see 'convert_source_nii.plan_series'): 
+    the file is classified with the same search terms (filename, then DICOM or PAR header), but only the headers of 
+    the source data are read, and nothing is written.
+    
+    Arguments:
+        bids_out_dir (string): Output BIDS directory
+        sub (int or string): Subject ID
+        file (string): Source image filename with absolute filepath
+        search_dict (dict): Nested dictionary from the 'read_config' function
+        meta_dict (dict): Nested metadata dictionary
+        ses (int or string): Session ID
+        keep_unknown (bool): Convert modalities/scans which cannot be identified (default: True)
+        verbose (bool): Prints the scan_type, modality, and search terms used (e.g. func - bold - rest - ['rest', 'FFE'])
+        runs (utils.RunPlan): Run plan shared by the series of the conversion
+    
+    Returns: 
+        job (SeriesJob or None): Planned conversion job (see 'convert_source_nii.SeriesJob'), None if the file would not be converted
+    '''
+    
+    if not meta_dict:
+        meta_dict = dict()
+    
+    job = None
+    
+    with utils.trace_span('plan_modality', file):
+        # Check file type
+        if utils.is_dcm_file(file):
+            if not cdm.is_valid_dcm(file,verbose):
+                sys.exit(f"Invalid DICOM file. Please check {file}")
+        
+        # Search filename, then the DICOM or PAR header, with the (compiled) search terms
+        hit = utils.search_modality(search_dict, file)
+        search_str = file
+        
+        if not hit and utils.is_dcm_file(file):
+            [hit, search_str] = cdm.find_dcm_scan_tech(file, search_dict)
+        elif not hit and '.PAR' in file.upper():
+            [hit, search_str] = csp.find_par_scan_tech(file, search_dict)
+        
+        if hit:
+            [scan_type, scan, task] = hit
+            if verbose:
+                print(f"{scan_type} - {scan} - {task}: {search_str}")
+            job = csn.plan_to_bids(bids_out_dir=bids_out_dir,file=file,sub=sub,scan_type=scan_type,scan=scan,task=task,meta_dict=meta_dict,ses=ses,runs=runs)
+        elif keep_unknown:
+            if verbose:
+                print("unknown modality")
+            scan_type = 'unknown_modality'
+            scan = 'unknown'
+            if utils.is_dcm_file(file) or '.PAR' in file.upper():
+                [com_param_dict, scan_param_dict] = [dict(), dict()]
+            else:
+                [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type)
+            job = csn.plan_series(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_scan=scan_param_dict,ses=ses,scan_type=scan_type,runs=runs)
+    
+    return job
+
+def _init_worker(condition, done, conversion_opts=dict()):
+    '''
+    Initializes a worker process of the process pool used by 'batch_convert'.
+    
+    Arguments:
+        condition (multiprocessing Condition): Condition shared between all worker processes
+        done (multiprocessing Array): Shared array of flags (one per series) for the ordered commit gate
+        conversion_opts (dict): Conversion options of the parent process (see 'utils.set_conversion_opts')
     
     Returns: 
         None
     '''
     
-    mod_found = False
+    # Re-seed random number generator so that forked workers do not share temporary directory names
+    random.seed()
+    utils.init_commit_gate(condition, done)
+    utils.set_conversion_opts(**conversion_opts)
+    
+    return None
 
+def _convert_series(index, group_start, bids_out_dir, sub, file, search_dict, meta_dict=dict(), ses=1, keep_unknown=True, verbose=False):
+    '''
+    Converts a single series (see 'convert_modality'), and collects any error instead of raising it. 
+    
+    Arguments:
+        index (int): Index of the series in the batch
+        group_start (int): Index of the first series of the same subject session in the batch
+        bids_out_dir (string): Output BIDS directory
+        sub (int or string): Subject ID
+        file (string): Source image filename with absolute filepath
+        search_dict (dict): Nested dictionary from the 'read_config' function
+        meta_dict (dict): Nested metadata dictionary
+        ses (int or string): Session ID
+        keep_unknown (bool): Convert modalities/scans which cannot be identified (default: True)
+        verbose (bool): Prints the scan_type, modality, and search terms used (e.g. func - bold - rest - ['rest', 'FFE'])
+    
+    Returns: 
+        file (string): Source image filename
+        converted_files (list): List of converted (BIDS named) files
+        error (string): Error message, empty if the series was converted
+    '''
+    
+    utils.set_commit_task(index, group_start)
+    utils.set_trace_series(file)
+    
     converted_files = list()
+    error = ""
     
-    # Check file type
-    if 'dcm' in file:
-        if not cdm.is_valid_dcm(file,verbose):
-            sys.exit(f"Invalid DICOM file. Please check {file}")
-    
-    for key,item in search_dict.items():
-        for dict_key,dict_item in search_dict[key].items():
-            if isinstance(dict_item,list):
-                if utils.list_in_substr(dict_item,file):
-                    mod_found = True
-                    if verbose:
-                        print(f"{key} - {dict_key}: {dict_item}")
-                    scan_type = key
-                    scan = dict_key
-                    [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type)
-                    if scan_type.lower() == 'dwi':
-                        converted_files = csn.data_to_bids_dwi(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_dwi=scan_param_dict,ses=ses,scan_type=scan_type)
-                    elif scan_type.lower() == 'fmap':
-                        converted_files = csn.data_to_bids_fmap(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_fmap=scan_param_dict,ses=ses,scan_type=scan_type)
-                    else:
-                        converted_files = csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_anat=scan_param_dict,ses=ses,scan_type=scan_type)
-                    if mod_found:
-                        break
-            elif isinstance(dict_item,dict):
-                tmp_dict = search_dict[key]
-                for d_key,d_item in tmp_dict[dict_key].items():
-                    if utils.list_in_substr(d_item,file):
-                        mod_found = True
-                        if verbose:
-                            print(f"{key} - {dict_key} - {d_key}: {d_item}")
-                        scan_type = key
-                        scan = dict_key
-                        task = d_key
-                        [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type,task=task)
-                        if scan_type.lower() == 'func':
-                            converted_files = csn.data_to_bids_func(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,task=task,meta_dict_com=com_param_dict,meta_dict_func=scan_param_dict,ses=ses,scan_type=scan_type)
-                        elif scan_type.lower() == 'dwi':
-                            converted_files = csn.data_to_bids_dwi(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_dwi=scan_param_dict,ses=ses,scan_type=scan_type)
-                        elif scan_type.lower() == 'fmap':
-                            converted_files = csn.data_to_bids_fmap(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_fmap=scan_param_dict,ses=ses,scan_type=scan_type)
-                        else:
-                            converted_files = csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_anat=scan_param_dict,ses=ses,scan_type=scan_type)
-                        if mod_found:
-                            break
-                        
-    if not mod_found:
-        converted_files = get_scan_tech(bids_out_dir=bids_out_dir, sub=sub, file=file, search_dict=search_dict, meta_dict=dict(), ses=ses, keep_unknown=keep_unknown, verbose=verbose)
+    try:
+        files = convert_modality(bids_out_dir=bids_out_dir, sub=sub, file=file, search_dict=search_dict, meta_dict=meta_dict, ses=ses, keep_unknown=keep_unknown, verbose=verbose)
+        if files:
+            converted_files = list(files)
+    except SystemExit as err:
+        error = str(err)
+    except Exception as err:
+        error = f"{type(err).__name__}: {err}"
+    finally:
+        utils.release_commit_turn()
+        utils.set_trace_series()
     
-    return converted_files
+    return file, converted_files, error
+
+def _run_series(tasks, jobs=1, cfg_hash=None, force=False):
+    '''
+    Converts a list of series, either serially or in a pool of worker processes. Series of the same subject session
+    are named (and allocated run numbers) in list order in either case.
+    
+    If a configuration hash is given, the conversion state of each series is kept in the state database of the 
+    BIDS output directory (see 'utils.series_state'). Series that are current (unchanged since they were last 
+    converted with the same configuration) are then skipped, and their previous outputs are returned. Series that 
+    have changed are converted again with the run numbers of their previous outputs (see 'utils.release_runs'), 
+    which are replaced (and removed if not overwritten) only once the series has been converted. The previous 
+    outputs of series that fail to convert are kept.
+    
+    Arguments:
+        tasks (list): List of dictionaries of keyword arguments for '_convert_series' (without 'index' and 'group_start'),
+            series of the same subject session must be adjacent in the list
+        jobs (int): Number of worker processes. Series are converted serially if 1 (default).
+        cfg_hash (string): Configuration hash (see 'utils.config_hash'). If None (default), conversion state is not kept.
+        force (bool): Convert all series, even if they are current (default: False)
+    
+    Returns: 
+        results (list): List of (file, converted_files, error) tuples, in the same order as 'tasks'
+    '''
+    
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    results = [None] * len(tasks)
+    pending = list()
+    previous = dict()
+    
+    # Skip series that are current
+    for index, task in enumerate(tasks):
+        if cfg_hash is not None:
+            [current, outputs] = utils.series_state(task['bids_out_dir'], task['file'], task['sub'], task['ses'], cfg_hash)
+            if current and not force:
+                results[index] = (task['file'], outputs, "")
+                continue
+            previous[index] = outputs
+            utils.release_runs(task['bids_out_dir'], task['file'], outputs)
+        pending.append(index)
+    
+    # Determine the first series of each subject session
+    group_starts = list()
+    group_start = 0
+    for pos, index in enumerate(pending):
+        if pos > 0:
+            task = tasks[index]
+            prev = tasks[pending[pos - 1]]
+            if (task['bids_out_dir'], str(task['sub']), str(task['ses'])) != (prev['bids_out_dir'], str(prev['sub']), str(prev['ses'])):
+                group_start = pos
+        group_starts.append(group_start)
+    
+    if jobs <= 1 or len(pending) <= 1:
+        converted = [_convert_series(index=pos, group_start=group_starts[pos], **tasks[index]) for pos, index in enumerate(pending)]
+    else:
+        ctx = multiprocessing.get_context()
+        condition = ctx.Condition()
+        done = ctx.Array('b', len(pending), lock=False)
+        
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx, initializer=_init_worker, initargs=(condition, done, utils.get_conversion_opts())) as pool:
+            futures = [pool.submit(_convert_series, index=pos, group_start=group_starts[pos], **tasks[index]) for pos, index in enumerate(pending)]
+            converted = [future.result() for future in futures]
+    
+    # Record the outputs of converted series
+    for index, result in zip(pending, converted):
+        results[index] = result
+        [file, files, error] = result
+        if cfg_hash is not None and files and not error:
+            task = tasks[index]
+            # Remove the previous outputs that were not replaced
+            new_files = set(os.path.abspath(out) for out in files)
+            utils.remove_outputs(task['bids_out_dir'], [out for out in previous.get(index, list()) if not os.path.abspath(out) in new_files])
+            utils.record_series(task['bids_out_dir'], file, task['sub'], task['ses'], files, cfg_hash)
+    
+    return results
+
+def plan_convert(tasks, cfg_hash=None, force=False):
+    '''
+    Plans the conversion of a list of series (see '_run_series') from the headers of the source data only (see 
+    'plan_modality'): nothing is converted or written. Run numbers are planned as they would be allocated, i.e. 
+    in list order, after the existing runs in the output directories. Series that are current would be skipped, 
+    and the other series would be given the run numbers of their previous outputs (see 'utils.RunPlan.release'). 
+    The state database is only read if it exists.
+    
+    Arguments:
+        tasks (list): List of dictionaries of keyword arguments for '_convert_series' (without 'index' and 'group_start')
+        cfg_hash (string): Configuration hash (see 'utils.config_hash'). If None (default), conversion state is not read.
+        force (bool): Convert all series, even if they are current (default: False)
+    
+    Returns: 
+        plan (list): List of dictionaries (one per series, in the same order as 'tasks') with the keys: sub, ses, file,
+            status ('convert', 'unresolved' if the series would be converted but part of its BIDS name cannot be 
+            determined from the headers (marked '?', see 'convert_source_nii.inspect_series'), 'current', 'skip' for 
+            unknown modalities, or 'error'), scan_type, scan, task, frames, 
+            outputs (list of (BIDS named) files), and error (error message, empty if none)
+    '''
+    
+    states = list()
+    for task in tasks:
+        if cfg_hash is not None and os.path.exists(os.path.join(task['bids_out_dir'], utils.STATE_DB)):
+            states.append(utils.series_state(task['bids_out_dir'], task['file'], task['sub'], task['ses'], cfg_hash))
+        else:
+            states.append((False, list()))
+    
+    # Series that would be converted again reuse the run numbers of their previous outputs
+    runs = utils.RunPlan()
+    for task, (current, outputs) in zip(tasks, states):
+        if force or not current:
+            runs.release(task['file'], outputs)
+    
+    plan = list()
+    
+    for task, (current, outputs) in zip(tasks, states):
+        entry = {"sub": task['sub'], "ses": task['ses'], "file": task['file'], "status": "", "scan_type": "", "scan": "", 
+                 "task": "", "frames": "", "outputs": list(), "error": ""}
+        plan.append(entry)
+        
+        if current and not force:
+            entry.update({"status": "current", "outputs": outputs})
+            continue
+        
+        try:
+            job = plan_modality(runs=runs, **task)
+        except SystemExit as err:
+            entry.update({"status": "error", "error": str(err)})
+            continue
+        except Exception as err:
+            entry.update({"status": "error", "error": f"{type(err).__name__}: {err}"})
+            continue
+        
+        if job is None:
+            entry['status'] = "skip"
+        else:
+            entry.update({"status": "unresolved" if job.unresolved else "convert", 
+                          "scan_type": job.scan_type, 
+                          "scan": job.scan, 
+                          "task": job.task, 
+                          "frames": job.frames, 
+                          "outputs": list(job.outputs)})
+    
+    return plan
+
+def format_plan(plan, bids_out_dir):
+    '''
+    Formats a conversion plan (see 'plan_convert') as a tab separated table, with one row per series and a header row.
+    The NifTi images of each series are listed relative to the BIDS output directory (or the error message).
+    
+    Arguments:
+        plan (list): Conversion plan from 'plan_convert'
+        bids_out_dir (string): Output BIDS directory
+    
+    Returns: 
+        lines (list): Lines of the table
+    '''
+    
+    columns = ['sub', 'ses', 'file', 'status', 'scan_type', 'scan', 'task', 'frames']
+    lines = ["\t".join(columns + ['images'])]
+    
+    for entry in plan:
+        images = [os.path.relpath(out, bids_out_dir) for out in entry['outputs'] if '.nii' in out]
+        lines.append("\t".join([str(entry[column]) for column in columns] + [entry['error'] or ",".join(images)]))
+    
+    return lines
+
+def _config_hash(search_dict, meta_dict, keep_unknown=True):
+    '''
+    Computes the configuration hash of a conversion (see 'utils.config_hash'), from the configuration file and 
+    the conversion options that affect the outputs (i.e. not the gzip, link, cache, trace, or dcm2niix timeout/retry 
+    options, which only affect how the outputs are written).
+    
+    Arguments:
+        search_dict (dict): Nested dictionary from the 'read_config' function
+        meta_dict (dict): Nested metadata dictionary
+        keep_unknown (bool): Convert modalities/scans which cannot be identified
+    
+    Returns: 
+        cfg_hash (string): Configuration hash
+    '''
+    
+    opts = {key: item for key, item in utils.get_conversion_opts().items() if not key.startswith(('gzip_', 'link_', 'cache_', 'trace_', 'dcm2niix_'))}
+    cfg_hash = utils.config_hash(search_dict, meta_dict, keep_unknown=keep_unknown, **opts)
+    
+    return cfg_hash
+
+def series_tasks(bids_out_dir, sub, file_list, search_dict, meta_dict=dict(), ses=1, keep_unknown=True, verbose=False):
+    '''
+    Creates the list of series (tasks) to convert (see '_run_series') or plan (see 'plan_convert') for a subject session.
+
+    Arguments:
+        bids_out_dir (string): Output BIDS directory
+        sub (int or string): Subject ID
+        file_list (list): List of image files with absolute paths
+        search_dict (dict): Nested dictionary from the 'read_config' function
+        meta_dict (dict): Nested metadata dictionary
+        ses (int or string): Session ID
+        keep_unknown (bool): Convert modalities/scans which cannot be identified (default: True)
+        verbose (bool): Prints the scan_type, modality, and search terms used (e.g. func - bold - rest - ['rest', 'FFE'])
 
-def batch_convert(bids_out_dir,sub,file_list, search_dict, meta_dict=dict(), ses=1, keep_unknown=True,verbose=False):
+    Returns: 
+        tasks (list): List of dictionaries of keyword arguments for '_convert_series' (without 'index' and 'group_start')
     '''
-    Batch conversion function for image files.
+
+    tasks = [dict(bids_out_dir=bids_out_dir, sub=sub, file=file, search_dict=search_dict, meta_dict=meta_dict, ses=ses, keep_unknown=keep_unknown, verbose=verbose) for file in file_list]
+
+    return tasks
+
+def batch_convert(bids_out_dir,sub,file_list, search_dict, meta_dict=dict(), ses=1, keep_unknown=True,verbose=False,jobs=1,force=False):
+    '''
+    Batch conversion function for image files. Series can be converted in parallel with a pool of worker processes,
+    in which case the BIDS run numbers are the same as those in serial mode. Errors are collected per series.
+    Series that were converted before (with the same configuration), and have not changed since, are skipped
+    unless 'force' is set.
     
     Note: This function is still undergoing active development.
 
@@ -324,20 +641,196 @@ def batch_convert(bids_out_dir,sub,file_list, search_dict, meta_dict=dict(), ses
         ses (int or string): Session ID
         keep_unknown (bool): Convert modalities/scans which cannot be identified (default: True)
         verbose (bool): Prints the scan_type, modality, and search terms used (e.g. func - bold - rest - ['rest', 'FFE'])
+        jobs (int): Number of series to convert in parallel (default: 1)
+        force (bool): Convert all series, including those that have not changed since they were last converted (default: False)
 
     Returns: 
-        None
+        converted_files (list): List of all converted (BIDS named) files
+        failed_files (list): List of (file, error message) tuples for the series that could not be converted
     '''
 
     converted_files = list()
+    failed_files = list()
     
-    for file in file_list:
-        try:
-            converted_files = convert_modality(bids_out_dir=bids_out_dir, sub=sub, file=file, search_dict=search_dict, meta_dict=meta_dict, ses=ses, keep_unknown=keep_unknown, verbose=verbose)
-        except SystemExit:
-            pass
+    # Index existing run numbers of the session from scratch
+    utils.init_run_index(bids_out_dir, sessions=[(sub, ses)], sources=file_list)
     
-    return converted_files
+    tasks = series_tasks(bids_out_dir, sub, file_list, search_dict, meta_dict=meta_dict, ses=ses, keep_unknown=keep_unknown, verbose=verbose)
+    
+    cfg_hash = _config_hash(search_dict, meta_dict, keep_unknown)
+    
+    for file, files, error in _run_series(tasks, jobs=jobs, cfg_hash=cfg_hash, force=force):
+        converted_files.extend(files)
+        if error:
+            failed_files.append((file, error))
+            if verbose:
+                print(f"Unable to convert {file}: {error}")
+    
+    return converted_files, failed_files
+
+def get_file_ext(file_type):
+    '''
+    Maps the file type option (DCM, PAR, or NII) to the file extension used by 'create_file_list'.
+    
+    Arguments:
+        file_type (string): File type. Acceptable choices include: DCM, PAR, or, NII.
+    
+    Returns: 
+        file_ext (string): File extension, empty if the file type is not recognized
+    '''
+    
+    if file_type.upper() == 'PAR':
+        file_ext = "PAR"
+    elif file_type.upper() == 'DCM':
+        file_ext = "dcm"
+    elif file_type.upper() == 'NII':
+        file_ext = "nii"
+    else:
+        file_ext = ""
+        
+    return file_ext
+
+def read_manifest(manifest_file):
+    '''
+    Reads a tab separated (TSV) manifest file of subjects/sessions to convert. The manifest must have a header
+    row with the columns: sub, data_dir, file_type, and optionally ses. Empty lines and lines starting with '#'
+    are ignored.
+    
+    Example:
+    
+        sub     ses     data_dir                file_type
+        001     1       /data/sub-001/ses-1     PAR
+        002     1       /data/sub-002/ses-1     DCM
+    
+    Arguments:
+        manifest_file (string): File path to TSV manifest file
+    
+    Returns: 
+        manifest (list): List of dictionaries with the keys: sub, ses, data_dir, and file_type
+    '''
+    
+    manifest = list()
+    
+    with open(manifest_file) as file:
+        lines = [line for line in file if line.strip() and not line.startswith('#')]
+    
+    for row in csv.DictReader(lines, delimiter='\t'):
+        row = {key.strip().lower(): (item or "").strip() for key, item in row.items() if key}
+        for key in ['sub', 'data_dir', 'file_type']:
+            if not row.get(key):
+                raise ValueError(f"Manifest {manifest_file} is missing the '{key}' column/value: {row}")
+        manifest.append({"sub": row['sub'],
+                         "ses": row.get('ses') or 1,
+                         "data_dir": row['data_dir'],
+                         "file_type": row['file_type']})
+    
+    return manifest
+
+def batch_convert_manifest(bids_out_dir, manifest, search_dict, exclusion_list=[], meta_dict=dict(), keep_unknown=True, verbose=False, jobs=1, force=False, header_fields=[]):
+    '''
+    Converts every subject/session listed in a manifest (see 'read_manifest') with a single scheduler. The series 
+    of all subjects share one pool of worker processes, so 'jobs' is a global cap on the number of concurrent 
+    conversions. Run numbers are the same as when each subject is converted on its own. As in 'batch_convert',
+    series that have not changed since they were last converted are skipped unless 'force' is set.
+
+    Arguments:
+        bids_out_dir (string): Output BIDS directory
+        manifest (list): List of dictionaries with the keys: sub, ses, data_dir, and file_type
+        search_dict (dict): Nested dictionary from the 'read_config' function
+        exclusion_list (list): List of exclusion terms from the 'read_config' function
+        meta_dict (dict): Nested metadata dictionary
+        keep_unknown (bool): Convert modalities/scans which cannot be identified (default: True)
+        verbose (bool): Prints additional information to screen
+        jobs (int): Number of series to convert in parallel (default: 1)
+        force (bool): Convert all series, including those that have not changed since they were last converted (default: False)
+        header_fields (list): DICOM header fields to also match the exclusion terms against (see 'file_exclude')
+
+    Returns: 
+        report (list): List of dictionaries (one per manifest row) with the keys: sub, ses, converted_files, 
+            failed_files (list of (file, error message) tuples) and success (bool)
+    '''
+
+    [report, tasks] = manifest_tasks(bids_out_dir=bids_out_dir,
+                                     manifest=manifest,
+                                     search_dict=search_dict,
+                                     exclusion_list=exclusion_list,
+                                     meta_dict=meta_dict,
+                                     keep_unknown=keep_unknown,
+                                     verbose=verbose,
+                                     header_fields=header_fields)
+    
+    # Index existing run numbers of the sessions from scratch
+    utils.init_run_index(bids_out_dir, sessions=[(task['sub'], task['ses']) for _, task in tasks], sources=[task['file'] for _, task in tasks])
+    
+    # Convert all series in one scheduler
+    cfg_hash = _config_hash(search_dict, meta_dict, keep_unknown)
+    results = _run_series([task for _, task in tasks], jobs=jobs, cfg_hash=cfg_hash, force=force)
+    
+    for (entry, _), (file, files, error) in zip(tasks, results):
+        entry['converted_files'].extend(files)
+        if error:
+            entry['failed_files'].append((file, error))
+            
+    for entry in report:
+        entry['success'] = len(entry['failed_files']) == 0
+    
+    return report
+
+def manifest_tasks(bids_out_dir, manifest, search_dict, exclusion_list=[], meta_dict=dict(), keep_unknown=True, verbose=False, header_fields=[]):
+    '''
+    Discovers the series of every subject/session listed in a manifest (see 'read_manifest'), and creates the list of 
+    series (tasks) to convert (see 'batch_convert_manifest') or plan (see 'plan_convert'). Series of the same subject 
+    session are adjacent in the list.
+
+    Arguments:
+        bids_out_dir (string): Output BIDS directory
+        manifest (list): List of dictionaries with the keys: sub, ses, data_dir, and file_type
+        search_dict (dict): Nested dictionary from the 'read_config' function
+        exclusion_list (list): List of exclusion terms from the 'read_config' function
+        meta_dict (dict): Nested metadata dictionary
+        keep_unknown (bool): Convert modalities/scans which cannot be identified (default: True)
+        verbose (bool): Prints additional information to screen
+        header_fields (list): DICOM header fields to also match the exclusion terms against (see 'file_exclude')
+
+    Returns: 
+        report (list): List of dictionaries (one per manifest row) with the keys: sub, ses, converted_files, 
+            failed_files (list of (file, error message) tuples, e.g. for missing data directories) and success (bool)
+        tasks (list): List of (report entry, task) tuples, where each task is a dictionary of keyword arguments for 
+            '_convert_series' (without 'index' and 'group_start')
+    '''
+
+    report = list()
+    
+    # Series grouped by subject session, so that series of the same session are adjacent
+    session_tasks = dict()
+    
+    # Discover the series of every subject/session
+    for row in manifest:
+        entry = {"sub": row['sub'], "ses": row['ses'], "converted_files": list(), "failed_files": list(), "success": True}
+        report.append(entry)
+        tasks = session_tasks.setdefault((row['sub'], str(row['ses'])), list())
+        
+        file_ext = get_file_ext(row['file_type'])
+        if not file_ext:
+            entry['failed_files'].append((row['data_dir'], f"Unrecognized file type: {row['file_type']}"))
+            continue
+        if not os.path.isdir(row['data_dir']):
+            entry['failed_files'].append((row['data_dir'], "Data directory does not exist"))
+            continue
+        
+        headers = dict()
+        file_list_all = create_file_list(data_dir=row['data_dir'], file_ext=file_ext, index_file=os.path.join(bids_out_dir, utils.DCM_INDEX), headers=headers)
+        if file_list_all:
+            file_list = file_exclude(file_list_all, data_dir=row['data_dir'], exclusion_list=exclusion_list, verbose=verbose, header_fields=header_fields, headers=headers)
+        else:
+            file_list = list()
+        
+        for task in series_tasks(bids_out_dir, row['sub'], file_list, search_dict, meta_dict=meta_dict, ses=row['ses'], keep_unknown=keep_unknown, verbose=verbose):
+            tasks.append((entry, task))
+    
+    tasks = [task for tasks in session_tasks.values() for task in tasks]
+    
+    return report, tasks
 
 if __name__ == "__main__":
 
@@ -356,8 +849,8 @@ if __name__ == "__main__":
                             type=str,
                             dest="sub",
                             metavar="subject_ID",
-                            required=True,
-                            help="Unique subject identifier given to each participant. This indentifier CAN contain letters and numbers. This identifier CANNOT contain: underscores, hyphens, colons, semi-colons, spaces, or any other special characters.")
+                            required=False,
+                            help="Unique subject identifier given to each participant. This indentifier CAN contain letters and numbers. This identifier CANNOT contain: underscores, hyphens, colons, semi-colons, spaces, or any other special characters. Not required with '--manifest'.")
     reqoptions.add_argument('-o', '-out', '--out',
                             type=str,
                             dest="out_bids",
@@ -368,8 +861,8 @@ if __name__ == "__main__":
                             type=str,
                             dest="data_dir",
                             metavar="data_directory",
-                            required=True,
-                            help="Parent directory that contains that subuject's unconverted source data. This directory can contain either all the PAR REC files, or all the directories of the DICOM files. NOTE: filepaths with spaces either need to replaced with underscores or placed in quotes. NOTE: The PAR REC directory is rename PAR_REC automaticaly.")
+                            required=False,
+                            help="Parent directory that contains that subuject's unconverted source data. This directory can contain either all the PAR REC files, or all the directories of the DICOM files. NOTE: filepaths with spaces either need to replaced with underscores or placed in quotes. NOTE: The PAR REC directory is rename PAR_REC automaticaly. Not required with '--manifest'.")
     reqoptions.add_argument('-c', '-config', '--config',
                             type=str,
                             dest="conf",
@@ -380,8 +873,8 @@ if __name__ == "__main__":
                             type=str,
                             dest="conv",
                             metavar="file_type",
-                            required=True,
-                            help="File type that is to be used with the converter. Acceptable choices include: DCM, PAR, or, NII.")
+                            required=False,
+                            help="File type that is to be used with the converter. Acceptable choices include: DCM, PAR, or, NII. Not required with '--manifest'.")
 
     # Optional Arguments
     optoptions = parser.add_argument_group('Optional arguments')
@@ -398,17 +891,112 @@ if __name__ == "__main__":
                             default=True,
                             action="store_true",
                             help="Keep or remove unknown modalities [default: True].")
-    optoptions.add_argument('-v', '-verbose', '--verbose',
-                            dest="verbose",
+    optoptions.add_argument('-exclude-headers', '--exclude-headers',
+                            dest="exclude_headers",
                             required=False,
                             default=False,
                             action="store_true",
-                            help="Prints additional information to screen. [default: False]")
-    optoptions.add_argument('-version', '--version',
-                            dest="vers",
+                            help="Also match the exclusion terms of the config file against the DICOM SeriesDescription and ImageType header fields. [default: False]")
+    optoptions.add_argument('-m', '-manifest', '--manifest',
+                            type=str,
+                            dest="manifest",
+                            metavar="manifest.tsv",
+                            required=False,
+                            default="",
+                            help="Tab separated manifest file with the columns: sub, ses, data_dir, and file_type (one row per subject session). All rows are converted with one scheduler (see '--jobs'), and '--sub', '--data', '--ses' and '--file-type' are ignored.")
+    optoptions.add_argument('-j', '-jobs', '--jobs',
+                            type=int,
+                            dest="jobs",
+                            metavar="N",
+                            required=False,
+                            default=1,
+                            help="Number of series to convert in parallel. [default: 1]")
+    optoptions.add_argument('-gzip-engine', '--gzip-engine',
+                            type=str,
+                            dest="gzip_engine",
+                            metavar="ENGINE",
+                            required=False,
+                            default="zlib",
+                            choices=["zlib", "parallel"],
+                            help="Engine used to gzip NifTi files: 'zlib' (single-threaded) or 'parallel' (multi-threaded, dcm2niix output is gzipped in blocks on several threads). [default: zlib]")
+    optoptions.add_argument('-gzip-threads', '--gzip-threads',
+                            type=int,
+                            dest="gzip_threads",
+                            metavar="N",
+                            required=False,
+                            default=0,
+                            help="Number of threads used by the 'parallel' gzip engine, the number of CPUs if 0. [default: 0]")
+    optoptions.add_argument('-link', '--link',
+                            type=str,
+                            dest="link_strategy",
+                            metavar="STRATEGY",
+                            required=False,
+                            default="copy",
+                            choices=["copy", "hardlink", "reflink", "symlink"],
+                            help="How existing NifTi (NII) images are placed in the BIDS directory: 'copy', 'hardlink', 'reflink' (copy-on-write clone), or 'symlink'. Falls back to 'copy' if the image cannot be linked (e.g. across file systems). [default: copy]")
+    optoptions.add_argument('-cache-dir', '--cache-dir',
+                            type=str,
+                            dest="cache_dir",
+                            metavar="DIR",
+                            required=False,
+                            default="",
+                            help="Cache dcm2niix outputs in this directory, keyed by the source data and dcm2niix options, so that series are not converted by dcm2niix again (e.g. when tuning the configuration file). [default: no cache]")
+    optoptions.add_argument('-cache-size', '--cache-size',
+                            type=float,
+                            dest="cache_size",
+                            metavar="GB",
+                            required=False,
+                            default=0,
+                            help="Maximum size of the dcm2niix output cache in GB, the least recently used entries are evicted. Unbounded if 0. [default: 0]")
+    optoptions.add_argument('-backend', '--backend',
+                            type=str,
+                            dest="backend",
+                            metavar="BACKEND",
+                            required=False,
+                            default="dcm2niix",
+                            help="Converter backend(s): a backend name used for all source data, or comma separated TYPE=NAME pairs (e.g. 'PAR=python,DCM=dcm2niix'). Valid backends: 'dcm2niix', 'python' (in-process, PAR REC only), and 'fake' (test outputs). Falls back to dcm2niix for source data the backend does not support. [default: dcm2niix]")
+    optoptions.add_argument('-timeout', '--timeout',
+                            type=float,
+                            dest="timeout",
+                            metavar="SECONDS",
+                            required=False,
+                            default=0,
+                            help="Wall-clock timeout of dcm2niix for each series. dcm2niix is killed after the timeout, and the series is reported as failed. No timeout if 0. [default: 0]")
+    optoptions.add_argument('-retries', '--retries',
+                            type=int,
+                            dest="retries",
+                            metavar="N",
+                            required=False,
+                            default=0,
+                            help="Number of times dcm2niix is retried after a transient failure (e.g. killed by a signal, or the output could not be written). [default: 0]")
+    optoptions.add_argument('-trace', '--trace',
+                            type=str,
+                            dest="trace",
+                            metavar="FILE",
+                            required=False,
+                            default="",
+                            help="Write a timing trace (one JSON line per stage per series) to this file. Summarize with trace_summary.py. [default: no trace]")
+    optoptions.add_argument('-force', '--force',
+                            dest="force",
+                            required=False,
+                            default=False,
+                            action="store_true",
+                            help="Convert all series, including those that have not changed since they were last converted (the previous outputs are replaced). [default: False]")
+    optoptions.add_argument('-plan', '--plan',
+                            dest="plan",
                             required=False,
                             default=False,
                             action="store_true",
+                            help="Plan the conversion without converting: only the headers of the source data are read, and the BIDS names (and run numbers) of the series that would be converted are printed as a tab separated table. Nothing is written to the BIDS directory (other than the DICOM header index). [default: False]")
+    optoptions.add_argument('-v', '-verbose', '--verbose',
+                            dest="verbose",
+                            required=False,
+                            default=False,
+                            action="store_true",
+                            help="Prints additional information to screen, and the output of dcm2niix as it is written (each line prefixed with the source file of the series). [default: False]")
+    optoptions.add_argument('-version', '--version',
+                            action="version",
+                            version=f"convert_source v{version}",
                             help=f"Prints version to screen and exits. convert_source v{version}")
 
     args = parser.parse_args()
@@ -421,43 +1009,120 @@ if __name__ == "__main__":
         if err.code == 2:
             parser.print_help()
 
-    # version flag
-    if args.vers:
-        print("")
-        print(f"convert_source v{version}")
-        print("")
-        sys.exit()
-
     # Verbose flag
     if args.verbose:
         args.verbose = True
 
-    # Convert Source Data Files
-    if args.conv.upper() == 'PAR':
-        file_ext = "PAR"
-    elif args.conv.upper() == 'DCM':
-        file_ext = "dcm"
-    elif args.conv.upper() == 'NII':
-        file_ext = "nii"
-    else:
-        print(
-            "Option not recognized. Please use the \'--fileType\' option with either \'PAR\' or \'DCM\' as specified.")
+    # Conversion options
+    utils.set_conversion_opts(gzip_engine=args.gzip_engine, 
+                              gzip_threads=args.gzip_threads, 
+                              link_strategy=args.link_strategy,
+                              cache_dir=os.path.abspath(args.cache_dir) if args.cache_dir else "",
+                              cache_size=int(args.cache_size * 1024**3),
+                              backends=csb.parse_backends(args.backend),
+                              trace_file=os.path.abspath(args.trace) if args.trace else "",
+                              dcm2niix_timeout=args.timeout,
+                              dcm2niix_retries=args.retries,
+                              dcm2niix_stream=args.verbose)
+
+    # Start a new trace
+    if args.trace:
+        open(args.trace, "w").close()
 
     # Read config file
     [search_dict, exclude_list, meta_dict] = read_config(config_file=args.conf, verbose=args.verbose)
 
+    # Header fields matched by the exclusion terms
+    if args.exclude_headers:
+        header_fields = EXCLUDE_HEADER_FIELDS
+    else:
+        header_fields = list()
+
+    # Manifest mode: convert every subject/session in one scheduler
+    if args.manifest and args.plan:
+        manifest = read_manifest(args.manifest)
+        [report, tasks] = manifest_tasks(bids_out_dir=args.out_bids,
+                                         manifest=manifest,
+                                         search_dict=search_dict,
+                                         exclusion_list=exclude_list,
+                                         meta_dict=meta_dict,
+                                         keep_unknown=args.keep_unknown,
+                                         verbose=args.verbose,
+                                         header_fields=header_fields)
+        plan = plan_convert([task for _, task in tasks], cfg_hash=_config_hash(search_dict, meta_dict, args.keep_unknown), force=args.force)
+        
+        print("\n".join(format_plan(plan, args.out_bids)))
+        
+        for entry in report:
+            for file, error in entry['failed_files']:
+                print(f"Failed to plan {file}: {error}", file=sys.stderr)
+        
+        if any(entry['failed_files'] for entry in report) or any(entry['status'] == 'error' for entry in plan):
+            sys.exit(1)
+        sys.exit()
+    elif args.manifest:
+        manifest = read_manifest(args.manifest)
+        report = batch_convert_manifest(bids_out_dir=args.out_bids,
+                                        manifest=manifest,
+                                        search_dict=search_dict,
+                                        exclusion_list=exclude_list,
+                                        meta_dict=meta_dict,
+                                        keep_unknown=args.keep_unknown,
+                                        verbose=args.verbose,
+                                        jobs=args.jobs,
+                                        force=args.force,
+                                        header_fields=header_fields)
+        
+        for entry in report:
+            for file, error in entry['failed_files']:
+                print(f"Failed to convert {file}: {error}")
+        
+        for entry in report:
+            status = "Completed" if entry['success'] else "FAILED"
+            print(f"{status} sub-{entry['sub']} ses-{entry['ses']}: {len(entry['converted_files'])} files converted, {len(entry['failed_files'])} failed")
+        
+        if not all(entry['success'] for entry in report):
+            sys.exit(1)
+        sys.exit()
+
+    if not (args.sub and args.data_dir and args.conv):
+        parser.error("the following arguments are required: -s/-sub/--sub, -d/-data/--data, -f/-file/--file-type (or -m/--manifest)")
+
+    # Convert Source Data Files
+    file_ext = get_file_ext(args.conv)
+    if not file_ext:
+        print(
+            "Option not recognized. Please use the \'--fileType\' option with either \'PAR\' or \'DCM\' as specified.")
+
     # Create file list
-    file_list_all = create_file_list(data_dir=args.data_dir,file_ext=file_ext)
-    file_list = file_exclude(file_list_all, data_dir=args.data_dir, exclusion_list=exclude_list, verbose=args.verbose)
+    headers = dict()
+    file_list_all = create_file_list(data_dir=args.data_dir,file_ext=file_ext,index_file=os.path.join(args.out_bids, utils.DCM_INDEX),headers=headers)
+    file_list = file_exclude(file_list_all, data_dir=args.data_dir, exclusion_list=exclude_list, verbose=args.verbose, header_fields=header_fields, headers=headers)
+
+    # Plan the conversion (header reads only)
+    if args.plan:
+        tasks = series_tasks(args.out_bids, args.sub, file_list, search_dict, meta_dict=meta_dict, ses=args.ses, keep_unknown=args.keep_unknown, verbose=args.verbose)
+        plan = plan_convert(tasks, cfg_hash=_config_hash(search_dict, meta_dict, args.keep_unknown), force=args.force)
+        
+        print("\n".join(format_plan(plan, args.out_bids)))
+        
+        if any(entry['status'] == 'error' for entry in plan):
+            sys.exit(1)
+        sys.exit()
 
     # Batch convert files in file list
-    batch_convert(bids_out_dir=args.out_bids,
-                  sub=args.sub,
-                  file_list=file_list,
-                  search_dict=search_dict,
-                  meta_dict=meta_dict,
-                  ses=args.ses,
-                  keep_unknown=args.keep_unknown,
-                  verbose=args.verbose)
+    [converted_files, failed_files] = batch_convert(bids_out_dir=args.out_bids,
+                                                    sub=args.sub,
+                                                    file_list=file_list,
+                                                    search_dict=search_dict,
+                                                    meta_dict=meta_dict,
+                                                    ses=args.ses,
+                                                    keep_unknown=args.keep_unknown,
+                                                    verbose=args.verbose,
+                                                    jobs=args.jobs,
+                                                    force=args.force)
+
+    for file, error in failed_files:
+        print(f"Failed to convert {file}: {error}")
 
     print(f"Completed sub-{args.sub}")
\ No newline at end of file
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+'''
+Converter backends for convert_source. A backend converts raw image data (DICOM, PAR REC) to NifTi, and returns
+a structured result (see 'ConversionResult') with the output images, sidecars, and bval/bvec files. The backend
+used for each source data type is selected with the 'backends' conversion option (see 'utils.set_conversion_opts').
+'''
+
+# Import packages and modules
+import os
+import json
+import time
+from collections import namedtuple
+
+# Import third party packages and modules
+import utils
+import convert_source_par as csp
+
+# Define functions
+
+# Result of a conversion:
+#   images (list): Output NifTi (or NRRD) images
+#   sidecars (list): Output JSON sidecars
+#   bvals (list): Output bval files
+#   bvecs (list): Output bvec files
+#   status (int): Exit status, 0 if the conversion succeeded
+#   elapsed (float): Time (in seconds) taken by the conversion
+ConversionResult = namedtuple('ConversionResult', ['images', 'sidecars', 'bvals', 'bvecs', 'status', 'elapsed'])
+
+def collect_outputs(out_dir, basename, status=0, elapsed=0.0):
+    '''
+    Lists the output files of a conversion (the files in the output directory that start with the output
+    basename) and sorts them into a conversion result.
+
+    Arguments:
+        out_dir (string): Absolute path to output directory
+        basename (string): Output file(s) basename
+        status (int): Exit status of the conversion
+        elapsed (float): Time (in seconds) taken by the conversion
+
+    Returns:
+        result (ConversionResult): Conversion result, with sorted file lists
+    '''
+
+    outputs = dict(images=list(), sidecars=list(), bvals=list(), bvecs=list())
+
+    for entry in os.scandir(out_dir):
+        if not entry.is_file() or not entry.name.startswith(basename):
+            continue
+        if '.nii' in entry.name or entry.name.endswith('.nrrd') or entry.name.endswith('.nhdr'):
+            outputs['images'].append(entry.path)
+        elif entry.name.endswith('.json'):
+            outputs['sidecars'].append(entry.path)
+        elif '.bval' in entry.name:
+            outputs['bvals'].append(entry.path)
+        elif '.bvec' in entry.name:
+            outputs['bvecs'].append(entry.path)
+
+    result = ConversionResult(images=sorted(outputs['images']),
+                              sidecars=sorted(outputs['sidecars']),
+                              bvals=sorted(outputs['bvals']),
+                              bvecs=sorted(outputs['bvecs']),
+                              status=status,
+                              elapsed=elapsed)
+
+    return result
+
+def sidecar_for(image, result):
+    '''
+    Finds the JSON sidecar of an output image in a conversion result.
+
+    Arguments:
+        image (string): Output image
+        result (ConversionResult): Conversion result
+
+    Returns:
+        json_file (string): JSON sidecar, empty if the image has no sidecar
+    '''
+
+    [path, filename, ext] = utils.file_parts(image)
+    json_file = os.path.join(path, filename + '.json')
+
+    if json_file in result.sidecars:
+        return json_file
+
+    return ""
+
+def file_type(file):
+    '''
+    Determines the source data type of a raw image data file: 'DCM' (DICOM), 'PAR' (PAR REC), or 'OTHER'.
+
+    Arguments:
+        file (string): Raw image data file
+
+    Returns:
+        type_ (string): Source data type
+    '''
+
+    [path, filename, ext] = utils.file_parts(file)
+
+    if utils.is_dcm_file(file):
+        type_ = 'DCM'
+    elif ext.upper() == '.PAR':
+        type_ = 'PAR'
+    else:
+        type_ = 'OTHER'
+
+    return type_
+
+class Backend(object):
+    '''
+    Base class of converter backends. Backends implement 'supports' and '_convert', and are registered with
+    'register_backend'.
+    '''
+
+    name = ""
+
+    def supports(self, file):
+        '''
+        Returns True if the backend can convert the raw image data file.
+        '''
+        return True
+
+    def _convert(self, file, basename, out_dir):
+        '''
+        Converts the raw image data file to NifTi in the output directory, and returns the exit status.
+        '''
+        raise NotImplementedError
+
+    def convert(self, file, basename, out_dir):
+        '''
+        Converts raw image data to NifTi.
+
+        Arguments:
+            file (string): Absolute path to raw image data file
+            basename (string): Output file(s) basename
+            out_dir (string): Absolute path to output directory (must exist at runtime)
+
+        Returns:
+            result (ConversionResult): Conversion result
+        '''
+
+        start = time.perf_counter()
+        status = self._convert(file, basename, out_dir)
+        elapsed = time.perf_counter() - start
+
+        return collect_outputs(out_dir, basename, status=status, elapsed=elapsed)
+
+class Dcm2niixBackend(Backend):
+    '''
+    Converts DICOM and PAR REC data with dcm2niix (see 'utils.convert_image_data').
+    '''
+
+    name = "dcm2niix"
+
+    def _convert(self, file, basename, out_dir):
+        return utils.convert_image_data(file, basename, out_dir)
+
+class PythonBackend(Backend):
+    '''
+    Converts PAR REC data in process, without dcm2niix (see 'convert_source_par.par_to_nii'). Writes gzipped NifTi images, 
+    JSON sidecars with the acquisition parameters in the PAR header, and (for diffusion data) FSL-style bval and bvec files.
+    This avoids starting a dcm2niix process per series, and reading the whole REC file into memory.
+    '''
+
+    name = "python"
+
+    def supports(self, file):
+        return file_type(file) == 'PAR'
+
+    def _convert(self, file, basename, out_dir):
+        import numpy as np
+
+        with utils.trace_span('par_to_nii', file) as span:
+            if span:
+                span.bytes = sum(os.path.getsize(src) for src in utils.source_files(file))
+            [nii_files, bvals, bvecs] = csp.par_to_nii(file, basename, out_dir)
+
+        if bvals is not None and bvecs is not None and len(np.unique(bvals)) > 1:
+            write_bvals_bvecs(os.path.join(out_dir, basename), bvals, bvecs)
+
+        return 0
+
+class FakeBackend(Backend):
+    '''
+    Writes small, deterministic outputs without reading the source data, for testing. Sources named like DWI (DTI, dwi)
+    get bval and bvec files, sources named like BOLD (rest, bold, FEEPI) and DWI get 4D images, and fieldmaps (map) get
+    an additional '_real' image, as dcm2niix writes for Philips B0 maps.
+    '''
+
+    name = "fake"
+
+    def _convert(self, file, basename, out_dir):
+        import numpy as np
+        import nibabel as nib
+
+        name = os.path.basename(os.path.dirname(file)) + os.path.basename(file)
+        is_dwi = any(key in name for key in ('DTI', 'dwi', 'DWI'))
+        is_func = any(key in name for key in ('rest', 'bold', 'FEEPI', 'rsfMR'))
+
+        shape = (4, 4, 3, 5) if is_dwi or is_func else (4, 4, 3)
+        img = nib.Nifti1Image(np.zeros(shape, np.int16), np.eye(4))
+        img.header.set_xyzt_units('mm', 'sec')
+        if len(shape) > 3:
+            img.header.set_zooms((1.0, 1.0, 1.0, 2.0))
+
+        images = [basename]
+        if 'map' in name:
+            images.append(basename + '_real')
+
+        for image in images:
+            nib.save(img, os.path.join(out_dir, image + '.nii.gz'))
+            with open(os.path.join(out_dir, image + '.json'), 'w') as json_file:
+                json.dump({"EchoTime": 0.03, "RepetitionTime": 2.0, "ConversionSoftware": "fake"}, json_file, indent=4)
+
+        if is_dwi:
+            bvals = np.array([0, 1000, 1000, 1000, 1000])
+            bvecs = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 0, 0]])
+            write_bvals_bvecs(os.path.join(out_dir, basename), bvals, bvecs)
+
+        return 0
+
+def write_bvals_bvecs(out_prefix, bvals, bvecs):
+    '''
+    Writes FSL-style bval and bvec files.
+
+    Arguments:
+        out_prefix (string): Output file prefix (path and basename)
+        bvals (array): b-values (one per volume)
+        bvecs (array): Gradient directions (one row per volume)
+
+    Returns:
+        bval_file (string): bval file
+        bvec_file (string): bvec file
+    '''
+
+    import numpy as np
+
+    bval_file = out_prefix + '.bval'
+    bvec_file = out_prefix + '.bvec'
+
+    np.savetxt(bval_file, np.atleast_2d(bvals), fmt='%g')
+    np.savetxt(bvec_file, np.asarray(bvecs).T, fmt='%.6g')
+
+    return bval_file, bvec_file
+
+# Registry of backends, keyed by name
+BACKENDS = dict()
+
+def register_backend(backend):
+    '''
+    Registers a backend, so that it can be selected by name (see 'get_backend').
+
+    Arguments:
+        backend (Backend): Backend instance
+
+    Returns:
+        None
+    '''
+
+    BACKENDS[backend.name] = backend
+
+    return None
+
+for backend in [Dcm2niixBackend(), PythonBackend(), FakeBackend()]:
+    register_backend(backend)
+
+def get_backend(file):
+    '''
+    Selects the backend for a raw image data file: the backend configured for its source data type (see
+    'file_type') in the 'backends' conversion option, else the backend configured as 'default', else dcm2niix.
+    If the selected backend does not support the file, dcm2niix is used.
+
+    Arguments:
+        file (string): Absolute path to raw image data file
+
+    Returns:
+        backend (Backend): Backend
+    '''
+
+    backends = utils.CONVERSION_OPTS['backends']
+    name = backends.get(file_type(file), backends.get('default', 'dcm2niix'))
+
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise KeyError(f"Unknown converter backend: {name}. Valid options are: {list(BACKENDS.keys())}")
+
+    if not backend.supports(file):
+        backend = BACKENDS['dcm2niix']
+
+    return backend
+
+def convert(file, basename, out_dir):
+    '''
+    Converts raw image data to NifTi with the selected backend (see 'get_backend').
+
+    Arguments:
+        file (string): Absolute path to raw image data file
+        basename (string): Output file(s) basename
+        out_dir (string): Absolute path to output directory (must exist at runtime)
+
+    Returns:
+        result (ConversionResult): Conversion result
+    '''
+
+    return get_backend(file).convert(file, basename, out_dir)
+
+def parse_backends(spec):
+    '''
+    Parses a backend specification: a backend name (used for all source data types), or comma separated
+    TYPE=NAME pairs (e.g. 'PAR=python,DCM=dcm2niix').
+
+    Arguments:
+        spec (string): Backend specification
+
+    Returns:
+        backends (dict): Backend names, keyed by source data type ('default' for all types)
+    '''
+
+    backends = dict()
+
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '=' in item:
+            [type_, name] = item.split('=', 1)
+            type_ = type_.strip().upper()
+        else:
+            [type_, name] = ['default', item]
+        name = name.strip()
+        if not name in BACKENDS:
+            raise ValueError(f"Unknown converter backend: {name}. Valid options are: {list(BACKENDS.keys())}")
+        backends[type_] = name
+
+    return backends
@@ -4,17 +4,59 @@ DICOM specific functions for convert_source. Primarily intended for converting a
 '''
 
 # Import packages and modules
-import pydicom
 import re
 import os
-import glob
+import sys
+import json
+from functools import lru_cache
 
 # Import third party packages and modules
 import utils
-import convert_source_nii as csn
 
 # Define functions
 
+@lru_cache(maxsize=512)
+def _read_dcm_header(dcm_file, mtime):
+    '''
+    Reads (and memoizes) a DICOM header with the pixel data skipped. The modification time is part of the
+    cache key so that files that are re-written on disk are read again.
+
+    Arguments:
+        dcm_file (string): Absolute path to DICOM file
+        mtime (int): Modification time (in ns) of the DICOM file
+
+    Returns:
+        ds (pydicom Dataset): DICOM header (without pixel data)
+    '''
+
+    import pydicom
+
+    return pydicom.dcmread(dcm_file, stop_before_pixels=True)
+
+def read_dcm_header(dcm_file):
+    '''
+    Reads the DICOM header once (pixel data is not read) and returns the header object. Headers are
+    memoized in a bounded LRU cache keyed by the file path and modification time, so repeated lookups
+    of the same file by the DICOM helper functions do not re-read the file. If a header object is passed
+    instead of a filename, it is returned as is.
+
+    Arguments:
+        dcm_file (string or pydicom Dataset): Absolute path to DICOM file, or a previously read DICOM header
+
+    Returns:
+        ds (pydicom Dataset): DICOM header (without pixel data)
+    '''
+
+    import pydicom
+
+    if isinstance(dcm_file, pydicom.Dataset):
+        return dcm_file
+
+    dcm_file = os.path.abspath(dcm_file)
+    mtime = os.stat(dcm_file).st_mtime_ns
+
+    return _read_dcm_header(dcm_file, mtime)
+
 def get_scan_time(dcm_file):
     '''
     Reads the scan time from the DICOM header.
@@ -27,7 +69,7 @@ def get_scan_time(dcm_file):
     '''
 
     # Load data
-    ds = pydicom.dcmread(dcm_file)
+    ds = read_dcm_header(dcm_file)
 
     # Gets scan time
     try:
@@ -38,39 +80,302 @@ def get_scan_time(dcm_file):
 
     return scan_time
 
-def get_dcm_files(dcm_dir):
+# DICOM header fields read when indexing a DICOM directory (see 'index_dcm_dir')
+DCM_INDEX_FIELDS = ['SeriesInstanceUID', 'SeriesNumber', 'SeriesDescription', 'ProtocolName', 'ImageType', 'Modality', 'InstanceNumber', 'DiffusionBValue']
+
+# DICOM index fields that differ between the instances of a series (i.e. that are not series level header fields)
+DCM_INSTANCE_FIELDS = ['InstanceNumber', 'DiffusionBValue']
+
+# Version of the DICOM index file format
+DCM_INDEX_VERSION = 2
+
+def _scan_dcm_tree(dcm_dir):
     '''
-    Creates a file list consisting of the first DICOM file in a parent DICOM directory. 
-    A file list is then returned.
+    Lists all (non-hidden) files in a directory tree, with their size and modification time, using 'os.scandir'
+    so that no additional system calls are needed on most file systems.
 
     Arguments:
         dcm_dir (string): Absolute path to parent DICOM data directory
 
     Returns: 
-        dcm_files (list): List of DICOM filenames, complete with their absolute paths.
+        files (list): List of (file, size, mtime) tuples, sorted by file path
+    '''
+
+    files = list()
+    dirs = [dcm_dir]
+
+    while dirs:
+        dir_ = dirs.pop()
+        try:
+            entries = list(os.scandir(dir_))
+        except (FileNotFoundError, PermissionError, NotADirectoryError):
+            continue
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                dirs.append(entry.path)
+            elif entry.is_file():
+                st = entry.stat()
+                files.append((entry.path, st.st_size, st.st_mtime_ns))
+
+    files.sort()
+
+    return files
+
+@lru_cache(maxsize=None)
+def _index_tags():
+    '''
+    Looks up the tags of the DICOM index fields (see 'DCM_INDEX_FIELDS'), once.
+
+    Arguments:
+        None
+
+    Returns:
+        tags (list): Tags of the DICOM index fields
+        last_tag (pydicom Tag): Last of the tags (reading stops after it)
     '''
 
-    # Create directory list
+    import pydicom
+
+    tags = [pydicom.tag.Tag(pydicom.datadict.tag_for_keyword(field)) for field in DCM_INDEX_FIELDS]
+
+    return tags, max(tags)
+
+def _read_index_fields(dcm_file):
+    '''
+    Reads the header fields used to index a DICOM file (see 'DCM_INDEX_FIELDS'). Only these fields are parsed, 
+    and reading stops after the last of them (before private tags, sequences, and pixel data).
+
+    Arguments:
+        dcm_file (string): Absolute path to (candidate) DICOM file
+
+    Returns: 
+        fields (dict or None): Dictionary of header fields (missing fields are omitted), None if the file is not a DICOM file
+    '''
+
+    import pydicom
+
+    [tags, last_tag] = _index_tags()
+
+    try:
+        with open(dcm_file, "rb") as file:
+            ds = pydicom.filereader.read_partial(file, stop_when=lambda tag, vr, length: tag > last_tag, specific_tags=tags)
+        fields = dict()
+        for field, tag in zip(DCM_INDEX_FIELDS, tags):
+            elem = ds.get(tag)
+            if elem is None or elem.value is None:
+                continue
+            value = elem.value
+            if isinstance(value, pydicom.multival.MultiValue):
+                value = [str(v) for v in value]
+            elif not isinstance(value, (int, float)):
+                value = str(value)
+            fields[field] = value
+    except Exception:
+        return None
+
+    return fields
+
+def index_dcm_dir(dcm_dir, index_file="", threads=0):
+    '''
+    Indexes the DICOM files in a directory tree, and groups them into series by their SeriesInstanceUID. Only the 
+    headers of the files are read (see '_read_index_fields'), in a pool of threads, and files that are not DICOM 
+    files are skipped. The directory layout does not matter: series may be spread over several directories, and 
+    directories may contain several series (e.g. flat PACS exports).
+    
+    If an index file is given, the headers of all files are kept in it, and files whose size and modification time 
+    have not changed since they were indexed are not read again.
+
+    Arguments:
+        dcm_dir (string): Absolute path to parent DICOM data directory
+        index_file (string): JSON index file, which is created if it does not exist. If left empty, no index is kept.
+        threads (int): Number of threads used to read headers. If 0 (default), four per CPU (up to 32) are used.
+
+    Returns: 
+        series (dict): Dictionary of series, keyed by SeriesInstanceUID. Each series is a dictionary with the keys:
+            files (sorted list of DICOM files), num_files, bytes (total size of the files), and the series level 
+            header fields in 'DCM_INDEX_FIELDS' (i.e. not those in 'DCM_INSTANCE_FIELDS').
+    '''
+
+    from concurrent.futures import ThreadPoolExecutor
+
     dcm_dir = os.path.abspath(dcm_dir)
-    parent_dcm_dir = os.path.join(dcm_dir,'*')
-    dcm_dir_list = glob.glob(parent_dcm_dir, recursive=True)
+
+    if not threads:
+        threads = min(32, 4 * (os.cpu_count() or 1))
+
+    # Read previous index
+    index = dict()
+    if index_file and os.path.exists(index_file):
+        try:
+            with open(index_file) as file:
+                data = json.load(file)
+            if data.get('version') == DCM_INDEX_VERSION:
+                index = data['files']
+        except (ValueError, KeyError):
+            index = dict()
+
+    files = _scan_dcm_tree(dcm_dir)
+
+    # Read headers of new or changed files
+    stale = [(file, size, mtime) for file, size, mtime in files if index.get(file, [None, None])[:2] != [size, mtime]]
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for (file, size, mtime), fields in zip(stale, pool.map(_read_index_fields, [file for file, _, _ in stale])):
+                index[file] = [size, mtime, fields]
+
+    # Group files into series
+    series = dict()
+    for file, size, mtime in files:
+        fields = index[file][2]
+        if fields is None:
+            continue
+        uid = fields.get('SeriesInstanceUID') or os.path.dirname(file)
+        if not uid in series:
+            series[uid] = {key: item for key, item in fields.items() if not key in DCM_INSTANCE_FIELDS}
+            series[uid].update({"files": list(), "num_files": 0, "bytes": 0})
+        series[uid]['files'].append(file)
+        series[uid]['num_files'] = series[uid]['num_files'] + 1
+        series[uid]['bytes'] = series[uid]['bytes'] + size
+
+    # Write index (only files under this directory are replaced)
+    if index_file and (stale or len(index) != len(files)):
+        prefix = dcm_dir + os.sep
+        current = set(file for file, _, _ in files)
+        index = {file: item for file, item in index.items() if file in current or not file.startswith(prefix)}
+        os.makedirs(os.path.dirname(os.path.abspath(index_file)), exist_ok=True)
+        tmp_file = index_file + f".tmp{os.getpid()}"
+        with open(tmp_file, "w") as file:
+            json.dump({"version": DCM_INDEX_VERSION, "files": index}, file)
+        os.replace(tmp_file, index_file)
+
+    return series
+
+def get_dcm_files(dcm_dir, index_file="", headers=None):
+    '''
+    Creates a file list consisting of one DICOM file of each DICOM series (grouped by SeriesInstanceUID, see
+    'index_dcm_dir') in a parent DICOM directory. A series is converted from the directory of its listed file 
+    (see 'get_series_files'), so series that are spread over several directories are skipped (with a message), 
+    rather than converted in part. A file list is then returned.
+
+    Arguments:
+        dcm_dir (string): Absolute path to parent DICOM data directory
+        index_file (string): JSON index file of the DICOM headers (see 'index_dcm_dir'). If left empty, no index is kept.
+        headers (dict): If given, the series level header fields (see 'DCM_INDEX_FIELDS') of the listed DICOM files are
+            added to this dictionary, keyed by DICOM filename.
+
+    Returns: 
+        dcm_files (list): List of DICOM filenames, complete with their absolute paths.
+    '''
+
+    series = index_dcm_dir(dcm_dir, index_file=index_file)
 
     # Initilized dcm_file list
     dcm_files = list()
 
-    # Iterate through files in the dicom directory list
-    for dir_ in dcm_dir_list:
-    # print(dir_)
-        for root, dirs, files in os.walk(dir_):
-            tmp_dcm_file = files[0] # only need the first dicom file
-            tmp_dcm_dir = root
-            tmp_file = os.path.join(tmp_dcm_dir, tmp_dcm_file)
-
-            dcm_files.append(tmp_file)
-            break
+    for uid, info in series.items():
+        dirs = sorted(set(os.path.dirname(file) for file in info['files']))
+        if len(dirs) > 1:
+            print(f"Skipping DICOM series {uid}: its files are spread over several directories ({', '.join(dirs)})", file=sys.stderr)
+            continue
+        dcm_files.append(info['files'][0])
+        if headers is not None:
+            headers[dcm_files[-1]] = {key: item for key, item in info.items() if key in DCM_INDEX_FIELDS}
 
     return dcm_files
 
+@lru_cache(maxsize=4096)
+def _index_fields(dcm_file, size, mtime):
+    '''
+    Reads (and memoizes) the header fields used to index a DICOM file (see '_read_index_fields'). The size and 
+    modification time are part of the cache key so that files that are re-written on disk are read again.
+
+    Arguments:
+        dcm_file (string): Absolute path to (candidate) DICOM file
+        size (int): Size (in bytes) of the file
+        mtime (int): Modification time (in ns) of the file
+
+    Returns: 
+        fields (dict or None): Dictionary of header fields (missing fields are omitted), None if the file is not a DICOM file
+    '''
+
+    return _read_index_fields(dcm_file)
+
+def _series_uid(dcm_file, size, mtime):
+    '''
+    Reads the SeriesInstanceUID of a DICOM file (see '_index_fields').
+
+    Arguments:
+        dcm_file (string): Absolute path to (candidate) DICOM file
+        size (int): Size (in bytes) of the file
+        mtime (int): Modification time (in ns) of the file
+
+    Returns: 
+        uid (string or None): SeriesInstanceUID (the directory of the file if it has none), None if the file is not a DICOM file
+    '''
+
+    fields = _index_fields(dcm_file, size, mtime)
+
+    if fields is None:
+        return None
+
+    return fields.get('SeriesInstanceUID') or os.path.dirname(dcm_file)
+
+def get_series_files(dcm_file):
+    '''
+    Lists the DICOM files of the series of a DICOM file, i.e. the files in the same directory with the same 
+    SeriesInstanceUID. Directories may contain several series (e.g. flat PACS exports), so these files are staged 
+    in a directory of their own for dcm2niix (see 'utils.link_series').
+
+    Arguments:
+        dcm_file (string): Absolute path to DICOM file
+
+    Returns: 
+        files (list): Sorted list of the DICOM files of the series (including 'dcm_file')
+    '''
+
+    dcm_file = os.path.abspath(dcm_file)
+    st = os.stat(dcm_file)
+    uid = _series_uid(dcm_file, st.st_size, st.st_mtime_ns)
+
+    files = [dcm_file]
+    for entry in os.scandir(os.path.dirname(dcm_file)):
+        if entry.name.startswith('.') or not entry.is_file() or entry.path == dcm_file:
+            continue
+        st = entry.stat()
+        if _series_uid(entry.path, st.st_size, st.st_mtime_ns) == uid:
+            files.append(entry.path)
+
+    return sorted(files)
+
+def get_dcm_bvals(dcm_file):
+    '''
+    Reads the b-values of a DICOM diffusion series from the DiffusionBValue (0018,9087) header field of the files 
+    of the series (see 'get_series_files'). Like 'utils.get_bvals', the unique non-zero b-values are returned.
+
+    Arguments:
+        dcm_file (string): Absolute path to DICOM file
+
+    Returns: 
+        bvals (list or None): Sorted list of the unique non-zero b-values, None if no file of the series has a DiffusionBValue field
+    '''
+
+    vals = list()
+    for file in get_series_files(dcm_file):
+        st = os.stat(file)
+        fields = _index_fields(file, st.st_size, st.st_mtime_ns) or dict()
+        if 'DiffusionBValue' in fields:
+            vals.append(float(fields['DiffusionBValue']))
+
+    if not vals:
+        return None
+
+    bvals = sorted(set(val for val in vals if val))
+
+    return bvals
+
 def is_valid_dcm(dcm_file, verbose=False):
     '''
     Checks for a valid DICOM file by inspecting the conversion type label in the DICOM file header.
@@ -86,12 +391,12 @@ def is_valid_dcm(dcm_file, verbose=False):
     '''
     
     # Read DICOM file header
-    ds = pydicom.dcmread(dcm_file)
+    ds = read_dcm_header(dcm_file)
     
     # Invalid files include secondary image captures, and are not suitable for 
     # nifti conversion as they are often not converted and cause problems.
-    # This string should be empty. If it is populated, then its likely a secondary capture.
-    conv_type = ds.ConversionType
+    # This string should be empty (or absent). If it is populated, then its likely a secondary capture.
+    conv_type = str(ds.get('ConversionType', ''))
     
     if conv_type in '':
         is_valid = True
@@ -116,7 +421,7 @@ def get_bwpppe(dcm_file):
     '''
     
     # Load data
-    ds = pydicom.dcmread(dcm_file)
+    ds = read_dcm_header(dcm_file)
     
     # Get relevant DICOM field
     try:
@@ -144,7 +449,7 @@ def get_red_fact(dcm_file):
     '''
 
     # Load dicom data
-    ds = pydicom.dcmread(dcm_file)
+    ds = read_dcm_header(dcm_file)
     red_fact = ""
     
     # Get Info
@@ -182,7 +487,7 @@ def get_mb(dcm_file):
     mb = 1
 
     # Load dicom data
-    ds = pydicom.dcmread(dcm_file)
+    ds = read_dcm_header(dcm_file)
 
     # Get image descriptor
     line = ds.SeriesDescription
@@ -193,12 +498,89 @@ def get_mb(dcm_file):
 
     return mb
 
+def get_echo_time(dcm_file):
+    '''
+    Reads the echo time (TE, in sec, as in the BIDS JSON sidecar) from the DICOM header.
+
+    Arguments:
+        dcm_file (string): Absolute path to DICOM file
+
+    Returns:
+        echo_time (float or string): Echo time (sec) as a float if it exists, otherwise the string 'unknown' is returned
+    '''
+
+    # Load data
+    ds = read_dcm_header(dcm_file)
+
+    # Gets echo time (ms)
+    try:
+        echo_time = float(ds.EchoTime) / 1000
+    except (AttributeError, TypeError, ValueError):
+        echo_time = 'unknown'
+
+    return echo_time
+
+def get_num_frames(dcm_file):
+    '''
+    Reads the number of temporal frames (dynamics) of a series from the DICOM header (NumberOfTemporalPositions).
+    
+    N.B.: Diffusion weighted volumes are not temporal positions, so this does not apply to diffusion weighted series.
+
+    Arguments:
+        dcm_file (string): Absolute path to DICOM file
+
+    Returns:
+        num_frames (int or string): Number of temporal frames if it exists, otherwise the string 'unknown' is returned
+    '''
+
+    # Load data
+    ds = read_dcm_header(dcm_file)
+
+    # Gets number of temporal positions
+    try:
+        num_frames = int(ds.NumberOfTemporalPositions)
+    except (AttributeError, TypeError, ValueError):
+        num_frames = 'unknown'
+
+    return num_frames
+
+def find_dcm_scan_tech(dcm_file, search_dict):
+    '''
+    Searches the DICOM header fields (see 'get_dcm_scan_tech') with the search terms provided by the nested dictionary.
+
+    Arguments:
+        dcm_file (string): DICOM filename with absolute filepath
+        search_dict (dict): Nested dictionary from the 'read_config' function
+
+    Returns:
+        hit (tuple or None): Tuple of (scan_type, scan, task), None if no search term matches
+        dcm_scan_tech_str (string): Value of the (last) searched header field, empty if none exists
+    '''
+
+    # Load DICOM data and read header
+    ds = read_dcm_header(dcm_file)
+    
+    # Search DICOM header for Scan Technique used, followed by the more common DICOM header fields 
+    # in the case Private Field (2001, 1020) [Scanning Technique Description MR] is empty
+    dcm_fields = [(0x2001,0x1020), 'SeriesDescription', 'ImageType', 'ProtocolName']
+    
+    hit = None
+    dcm_scan_tech_str = ""
+    for dcm_field in dcm_fields:
+        if dcm_field in ds:
+            dcm_scan_tech_str = str(ds[dcm_field].value)
+            hit = utils.search_modality(search_dict, dcm_scan_tech_str)
+        if hit:
+            break
+
+    return hit, dcm_scan_tech_str
+
 def get_dcm_scan_tech(bids_out_dir, sub, dcm_file, search_dict, meta_dict={}, ses=1, keep_unknown=True, verbose=False):
     '''
     Searches DICOM file header for scan technique/MR modality used in accordance with the search terms provided by the
     nested dictionary. The DICOM header field searched is a Philips DICOM private tag (2001,1020) [Scanning Technique 
     Description MR]. In the case that field does not match, is empty, or does not exist, then more common DICOM tags
-    are searched - and they include: Series Description, Protocol Name, and Image Type.
+    are searched - and they include: Series Description, Image Type, and Protocol Name.
     
     Note: This function is still undergoing active development.
     
@@ -213,121 +595,29 @@ def get_dcm_scan_tech(bids_out_dir, sub, dcm_file, search_dict, meta_dict={}, se
         verbose (bool): Prints the scan_type, modality, and search terms used (e.g. func - bold - rest - ['rest', 'FFE'])
     
     Returns: 
-        None
+        converted_files (tuple): Converted (BIDS named) files
     '''
 
+    import convert_source_nii as csn
+
     if not meta_dict:
         meta_dict = dict()
+
+    converted_files = list()
     
-    mod_found = False
-    
-    # Load DICOM data and read header
-    ds = pydicom.dcmread(dcm_file)
-    
-    # Search DICOM header for Scan Technique used
-    dcm_scan_tech_str = str(ds[0x2001,0x1020])
+    [hit, dcm_scan_tech_str] = find_dcm_scan_tech(dcm_file, search_dict)
     
-    for key,item in search_dict.items():
-        for dict_key,dict_item in search_dict[key].items():
-            if isinstance(dict_item,list):
-                if utils.list_in_substr(dict_item,dcm_scan_tech_str):
-                    mod_found = True
-                    if verbose:
-                        print(f"{key} - {dict_key}: {dict_item}")
-                    scan_type = key
-                    scan = dict_key
-                    [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type)
-                    if scan_type.lower() == 'dwi':
-                        csn.data_to_bids_dwi(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_dwi=scan_param_dict,ses=ses,scan_type=scan_type)
-                    elif scan_type.lower() == 'fmap':
-                        csn.data_to_bids_fmap(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_fmap=scan_param_dict,ses=ses,scan_type=scan_type)
-                    else:
-                        csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_anat=scan_param_dict,ses=ses,scan_type=scan_type)
-                    if mod_found:
-                        break
-            elif isinstance(dict_item,dict):
-                tmp_dict = search_dict[key]
-                for d_key,d_item in tmp_dict[dict_key].items():
-                    if utils.list_in_substr(d_item,dcm_scan_tech_str):
-                        mod_found = True
-                        if verbose:
-                            print(f"{key} - {dict_key} - {d_key}: {d_item}")
-                        scan_type = key
-                        scan = dict_key
-                        task = d_key
-                        [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type,task=task)
-                        if scan_type.lower() == 'func':
-                            csn.data_to_bids_func(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,task=task,meta_dict_com=com_param_dict,meta_dict_func=scan_param_dict,ses=ses,scan_type=scan_type)
-                        elif scan_type.lower() == 'dwi':
-                            csn.data_to_bids_dwi(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_dwi=scan_param_dict,ses=ses,scan_type=scan_type)
-                        elif scan_type.lower() == 'fmap':
-                            csn.data_to_bids_fmap(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_fmap=scan_param_dict,ses=ses,scan_type=scan_type)
-                        else:
-                            csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_anat=scan_param_dict,ses=ses,scan_type=scan_type)
-                        if mod_found:
-                            break
-                            
-        if mod_found:
-            break
-    
-    # Secondary look in the case Private Field (2001, 1020) [Scanning Technique Description MR] is empty
-    if not mod_found:
-        # Define list of DICOM header fields
-        dcm_fields = ['SeriesDescription', 'ImageType', 'ProtocolName']
-        
-        for dcm_field in dcm_fields:
-            dcm_scan_tech_str = str(eval(f"ds.{dcm_field}")) # This makes me dangerously uncomfortable
-            
-            for key,item in search_dict.items():
-                for dict_key,dict_item in search_dict[key].items():
-                    if isinstance(dict_item,list):
-                        if utils.list_in_substr(dict_item,dcm_scan_tech_str):
-                            mod_found = True
-                            if verbose:
-                                print(f"{key} - {dict_key}: {dict_item}")
-                            scan_type = key
-                            scan = dict_key
-                            [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type)
-                            if scan_type.lower() == 'dwi':
-                                csn.data_to_bids_dwi(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_dwi=scan_param_dict,ses=ses,scan_type=scan_type)
-                            elif scan_type.lower() == 'fmap':
-                                csn.data_to_bids_fmap(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_fmap=scan_param_dict,ses=ses,scan_type=scan_type)
-                            else:
-                                csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_anat=scan_param_dict,ses=ses,scan_type=scan_type)
-                            if mod_found:
-                                break
-                    elif isinstance(dict_item,dict):
-                        tmp_dict = search_dict[key]
-                        for d_key,d_item in tmp_dict[dict_key].items():
-                            if utils.list_in_substr(d_item,dcm_scan_tech_str):
-                                mod_found = True
-                                if verbose:
-                                    print(f"{key} - {dict_key} - {d_key}: {d_item}")
-                                scan_type = key
-                                scan = dict_key
-                                task = d_key
-                                [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type,task=task)
-                                if scan_type.lower() == 'func':
-                                    csn.data_to_bids_func(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,task=task,meta_dict_com=com_param_dict,meta_dict_func=scan_param_dict,ses=ses,scan_type=scan_type)
-                                elif scan_type.lower() == 'dwi':
-                                    csn.data_to_bids_dwi(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_dwi=scan_param_dict,ses=ses,scan_type=scan_type)
-                                elif scan_type.lower() == 'fmap':
-                                    csn.data_to_bids_fmap(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_fmap=scan_param_dict,ses=ses,scan_type=scan_type)
-                                else:
-                                    csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_anat=scan_param_dict,ses=ses,scan_type=scan_type)
-                                if mod_found:
-                                    break
-
-            if mod_found:
-                break
-                
-    if not mod_found:
+    if hit:
+        [scan_type, scan, task] = hit
+        if verbose:
+            print(f"{scan_type} - {scan} - {task}: {dcm_scan_tech_str}")
+        converted_files = csn.data_to_bids(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan_type=scan_type,scan=scan,task=task,meta_dict=meta_dict,ses=ses)
+    else:
         if verbose:
             print("unknown modality")
         if keep_unknown:
             scan_type = 'unknown_modality'
             scan = 'unknown'
-            csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com={},meta_dict_anat={},ses=ses,scan_type=scan_type)
+            converted_files = csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=dcm_file,sub=sub,scan=scan,meta_dict_com={},meta_dict_anat={},ses=ses,scan_type=scan_type)
         
-    return None
-
+    return converted_files
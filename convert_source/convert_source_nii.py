@@ -5,9 +5,13 @@ NifTi specific functions for convert_source. Primarily intended for renaming Nif
 
 # Import packages and modules
 import os
+import gzip
+import math
+import struct
 import shutil
 import random
-import nibabel as nib
+import tempfile
+from functools import lru_cache
 
 # Import third party packages and modules
 import convert_source_dcm as cdm
@@ -16,6 +20,137 @@ import utils
 
 # define functions
 
+class NiiHeader(object):
+    '''
+    Fields of a NifTi-1 or NifTi-2 header that convert_source uses, read from the first 540 bytes of the image file (which
+    are the only bytes decompressed for gzipped images). The byte order and NifTi version are determined from the header 
+    size field.
+    
+    Attributes:
+        nii_file (string): Absolute filepath to NifTi image file
+        version (int): NifTi version (1 or 2)
+        dims (list): Image dimensions (e.g. [x, y, z, t]), from 'dim'
+        pixdim (list): Raw 'pixdim' field (8 values: qfac, voxel sizes, and TR for 4D images)
+        datatype (int): NifTi datatype code
+        vox_offset (int): Offset of the image data (in bytes)
+        qform_code (int): qform code
+        sform_code (int): sform code
+        qform (list): qform affine (4x4, list of rows), from the quaternion parameters
+        sform (list): sform affine (4x4, list of rows), from 'srow_x', 'srow_y', and 'srow_z'
+    '''
+
+    # Header sizes (sizeof_hdr) of NifTi-1 and NifTi-2 headers
+    _sizes = {348: 1, 540: 2}
+
+    # Field formats (without byte order) and offsets, in the order: dim, datatype, pixdim, vox_offset, qform_code, 
+    # sform_code, quatern_b/c/d and qoffset_x/y/z, and srow_x/y/z
+    _fields = {1: [('8h', 40), ('h', 70), ('8f', 76), ('f', 108), ('h', 252), ('h', 254), ('6f', 256), ('12f', 280)],
+               2: [('8q', 16), ('h', 12), ('8d', 104), ('q', 168), ('i', 344), ('i', 348), ('6d', 352), ('12d', 400)]}
+
+    def __init__(self, nii_file):
+        '''
+        Reads and parses a NifTi-1 or NifTi-2 header.
+        
+        Arguments:
+            nii_file (string): Absolute filepath to NifTi image file (gzipped or not)
+        '''
+
+        self.nii_file = nii_file
+
+        with open(nii_file, 'rb') as f:
+            gzipped = f.read(2) == b'\x1f\x8b'
+
+        if gzipped:
+            with gzip.open(nii_file, 'rb') as f:
+                data = f.read(540)
+        else:
+            with open(nii_file, 'rb') as f:
+                data = f.read(540)
+
+        self.version = 0
+        for byte_order in ['<', '>']:
+            if len(data) >= 4 and struct.unpack(byte_order + 'i', data[:4])[0] in self._sizes:
+                self.version = self._sizes[struct.unpack(byte_order + 'i', data[:4])[0]]
+                break
+
+        if not self.version or len(data) < [348, 540][self.version - 1]:
+            raise ValueError(f"Not a NifTi-1 or NifTi-2 file: {nii_file}")
+
+        values = [struct.unpack_from(byte_order + fmt, data, offset) for fmt, offset in self._fields[self.version]]
+        [dim, [datatype], pixdim, [vox_offset], [qform_code], [sform_code], quatern, srow] = values
+
+        self.dims = list(dim[1:dim[0] + 1])
+        self.pixdim = list(pixdim)
+        self.datatype = datatype
+        self.vox_offset = int(vox_offset)
+        self.qform_code = qform_code
+        self.sform_code = sform_code
+        self.sform = [list(srow[0:4]), list(srow[4:8]), list(srow[8:12]), [0.0, 0.0, 0.0, 1.0]]
+        self.qform = self._quatern_to_affine(quatern, pixdim)
+
+    @staticmethod
+    def _quatern_to_affine(quatern, pixdim):
+        '''
+        Computes the qform affine from the quaternion parameters and voxel sizes (NifTi method 2).
+        
+        Arguments:
+            quatern (tuple): quatern_b, quatern_c, quatern_d, qoffset_x, qoffset_y, and qoffset_z
+            pixdim (tuple): Raw 'pixdim' field
+            
+        Returns:
+            affine (list): qform affine (4x4, list of rows)
+        '''
+        [b, c, d, x, y, z] = quatern
+        a = 1.0 - (b * b + c * c + d * d)
+        if a < 1e-7:
+            # 180 degree rotation: normalize (b, c, d)
+            norm = math.sqrt(b * b + c * c + d * d)
+            [a, b, c, d] = [0.0, b / norm, c / norm, d / norm]
+        else:
+            a = math.sqrt(a)
+        qfac = -1.0 if pixdim[0] < 0 else 1.0
+        zooms = [pixdim[1], pixdim[2], pixdim[3] * qfac]
+        rot = [[a * a + b * b - c * c - d * d, 2 * b * c - 2 * a * d, 2 * b * d + 2 * a * c],
+               [2 * b * c + 2 * a * d, a * a + c * c - b * b - d * d, 2 * c * d - 2 * a * b],
+               [2 * b * d - 2 * a * c, 2 * c * d + 2 * a * b, a * a + d * d - c * c - b * b]]
+        affine = [[row[i] * zooms[i] for i in range(3)] + [offset] for row, offset in zip(rot, [x, y, z])]
+        affine.append([0.0, 0.0, 0.0, 1.0])
+        return affine
+
+@lru_cache(maxsize=512)
+def _read_nii_header(nii_file, mtime):
+    '''
+    Reads (and memoizes) a NifTi header. The modification time is part of the cache key so that files that are
+    re-written on disk are read again.
+
+    Arguments:
+        nii_file (string): Absolute filepath to NifTi image file
+        mtime (int): Modification time (in ns) of the NifTi image file
+
+    Returns:
+        hdr (NiiHeader): Parsed NifTi header
+    '''
+
+    return NiiHeader(nii_file)
+
+def read_nii_header(nii_file):
+    '''
+    Reads the header of a NifTi-1 or NifTi-2 image file (see 'NiiHeader'), without loading the image. Only the header is
+    decompressed for gzipped images. Headers are memoized in a bounded LRU cache keyed by the file path and modification
+    time, so repeated lookups of the same file (e.g. its TR and number of frames) read the file once.
+
+    Arguments:
+        nii_file (string): Absolute filepath to NifTi image file
+
+    Returns:
+        hdr (NiiHeader): Parsed NifTi header
+    '''
+
+    nii_file = os.path.abspath(nii_file)
+    mtime = os.stat(nii_file).st_mtime_ns
+
+    return _read_nii_header(nii_file, mtime)
+
 def get_nii_tr(nii_file):
     '''
     Reads the NifTi file header and returns the repetition time (TR, sec) as a value if it is not zero, otherwise this 
@@ -28,11 +163,11 @@ def get_nii_tr(nii_file):
         tr (float or string): Repetition time (TR, sec), if not zero, otherwise 'unknown' is returned.
     '''
     
-    # Load nifti file
-    img = nib.load(nii_file)
+    # Read nifti header
+    hdr = read_nii_header(nii_file)
     
     # Store nifti image TR
-    tr = float(img.header['pixdim'][4])
+    tr = float(hdr.pixdim[4])
     
     # Check if TR is likely
     if tr != 0:
@@ -54,9 +189,8 @@ def get_num_frames(nii_file):
     '''
     
     try:
-        img = nib.load(nii_file)
-        dims = img.header.get_data_shape()
-        num_frames = dims[3]
+        hdr = read_nii_header(nii_file)
+        num_frames = hdr.dims[3]
     except IndexError:
         num_frames = 1
         pass
@@ -77,835 +211,798 @@ def get_data_params(file,json_file="", bval_file=""):
         info (dict): Dictionary of key mapped items/values
     '''
     
-    # Create empty dictionary
-    tmp_dict = dict()
+    with utils.trace_span('get_data_params', file):
+        # Create empty dictionary
+        tmp_dict = dict()
     
-    # Check and write bvalue(s) to file
-    if bval_file:
-        bval_list = utils.get_bvals(bval_file)
-        tmp_dict.update({"bval":bval_list})
+        # Check file type (by extension or header, as directory names may contain e.g. 'par')
+        [path, filename, ext] = utils.file_parts(file)
     
-    # Check file type
-    if '.dcm' in file.lower():
-        red_fact = cdm.get_red_fact(file)
-        mb = cdm.get_mb(file)
-        scan_time = cdm.get_scan_time(file)
-        [eff_echo_sp, tot_read_time]  = utils.calc_read_time(file,json_file)
-        source_format = "DICOM"
-        tmp_dict.update({"ParallelReductionFactorInPlane": red_fact,
-                         "MultibandAccelerationFactor": mb,
-                         "EffectiveEchoSpacing": eff_echo_sp,
-                         "TotalReadoutTime": tot_read_time,
-                         "AcquisitionDuration": scan_time,
-                         "SourceDataFormat": source_format})
-    elif 'PAR' in file.upper():
-        wfs = csp.get_wfs(file)
-        red_fact = csp.get_red_fact(file)
-        mb = csp.get_mb(file)
-        scan_time = csp.get_scan_time(file)
-        etl = csp.get_etl(file)
-        [eff_echo_sp, tot_read_time]  = utils.calc_read_time(file,json_file)
-        source_format = "PAR REC"
-        tmp_dict.update({"WaterFatShift": wfs,
-                         "ParallelAcquisitionTechnique": 'SENSE',
-                         "ParallelReductionFactorInPlane": red_fact,
-                         "MultibandAccelerationFactor": mb,
-                         "EffectiveEchoSpacing": eff_echo_sp,
-                         "TotalReadoutTime": tot_read_time,
-                         "AcquisitionDuration": scan_time,
-                         "EchoTrainLength": etl,
-                         "SourceDataFormat": source_format})
-    elif 'nii' in file.lower():
-        tr = get_nii_tr(file)
-        source_format = "NIFTI"
-        tmp_dict.update({"RepetitionTime": tr,
-                         "SourceDataFormat": source_format})
-    else:
-        pass
+        if utils.is_dcm_file(file):
+            red_fact = cdm.get_red_fact(file)
+            mb = cdm.get_mb(file)
+            scan_time = cdm.get_scan_time(file)
+            [eff_echo_sp, tot_read_time]  = utils.calc_read_time(file,json_file)
+            source_format = "DICOM"
+            tmp_dict.update({"ParallelReductionFactorInPlane": red_fact,
+                             "MultibandAccelerationFactor": mb,
+                             "EffectiveEchoSpacing": eff_echo_sp,
+                             "TotalReadoutTime": tot_read_time,
+                             "AcquisitionDuration": scan_time,
+                             "SourceDataFormat": source_format})
+        elif ext.upper() == '.PAR':
+            wfs = csp.get_wfs(file)
+            red_fact = csp.get_red_fact(file)
+            mb = csp.get_mb(file)
+            scan_time = csp.get_scan_time(file)
+            etl = csp.get_etl(file)
+            [eff_echo_sp, tot_read_time]  = utils.calc_read_time(file,json_file)
+            image_info = csp.get_par_image_info(file)
+            if image_info["bvals"]:
+                tmp_dict.update({"bval":image_info["bvals"]})
+            source_format = "PAR REC"
+            tmp_dict.update({"WaterFatShift": wfs,
+                             "ParallelAcquisitionTechnique": 'SENSE',
+                             "ParallelReductionFactorInPlane": red_fact,
+                             "MultibandAccelerationFactor": mb,
+                             "EffectiveEchoSpacing": eff_echo_sp,
+                             "TotalReadoutTime": tot_read_time,
+                             "AcquisitionDuration": scan_time,
+                             "EchoTrainLength": etl,
+                             "SourceDataFormat": source_format})
+        elif '.nii' in ext.lower():
+            tr = get_nii_tr(file)
+            source_format = "NIFTI"
+            tmp_dict.update({"RepetitionTime": tr,
+                             "SourceDataFormat": source_format})
+        else:
+            pass
+
+        # Check and write bvalue(s) to file
+        # N.B.: PAR REC b-values are read from the PAR image definition table above
+        if bval_file and not "bval" in tmp_dict:
+            bval_list = utils.get_bvals(bval_file)
+            tmp_dict.update({"bval":bval_list})
         
     info = dict()
     info.update(tmp_dict)
     
     return info
 
-def data_to_bids_anat(bids_out_dir, file, sub, scan, meta_dict_com=dict(), meta_dict_anat=dict(), ses=1, scan_type='anat'):
+def data_to_bids(bids_out_dir, file, sub, scan_type, scan, task="", meta_dict=dict(), ses=1):
     '''
-    Renames converted NifTi-2 files to conform with the BIDS naming convension (in the case of anatomical files).
-    This function accepts any image file (DICOM, PAR REC, and NifTi-2). If the image file is a raw data file (e.g. DICOM, PAR REC)
-    it is converted to NifTi first, then renamed. The output BIDS directory need not exist at runtime.
+    Converts and renames an image file to BIDS with the 'data_to_bids_*' function of its scan type (func, dwi, fmap,
+    otherwise anat), with the metadata for that scan type (and task) from the metadata dictionary.
     
     Arguments:
         bids_out_dir (string): Path to output BIDS directory. 
         file (string): Filepath to image file.
         sub (int or string): Subject ID
-        scan (string): Modality (e.g. T1w, T2w, or SWI)
-        meta_dict_com (dict): Metadata dictionary for common image metadata
-        meta_dict_anat (dict): Metadata dictionary for common anatomical image specific metadata
+        scan_type (string): BIDS sub-directory scan type (e.g. anat, func, fmap, dwi, etc.)
+        scan (string): Modality (e.g. T1w, bold, dwi, etc.)
+        task (string): Task for functional image data, empty otherwise
+        meta_dict (dict): Nested metadata dictionary from the 'read_config' function
         ses (int or string): Session ID
-        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat (default), func, fmap, dwi, etc.
         
     Returns:
-        out_nii (string): Absolute filepath to gzipped output NifTi-2 file
-        out_json (string): Absolute filepath to corresponding JSON file
+        converted_files (tuple): Converted (BIDS named) files, None if the file could not be converted
     '''
 
-    # Use try-except statement here in the case of invalid/incomplete image files that will throw errors in dcm2niix
-    try:
-        # Create Output Directory Variables
-        # Zeropad subject ID if possible
-        try:
-            sub = '{:03}'.format(int(sub))
-        except ValueError:
-            pass
-        # Zeropad session ID if possible
-        try:
-            ses = '{:03}'.format(int(ses))
-        except ValueError:
-            pass
+    [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type,task=task)
 
-        out_dir = os.path.join(bids_out_dir, f"sub-{sub}", f"ses-{ses}", f"{scan_type}")
-
-        # Make output directory
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-
-        # Get absolute filepaths
-        bids_out_dir = os.path.abspath(bids_out_dir)
-        out_dir = os.path.abspath(out_dir)
-
-        # Create temporary output names/directories
-        n = 10000 # maximum N for random number generator
-        tmp_out_dir = os.path.join(bids_out_dir, f"sub-{sub}", 'tmp_dir' + str(random.randint(0, n)))
-        tmp_basename = 'tmp_basename' + str(random.randint(0, n))
-
-        if not os.path.exists(tmp_out_dir):
-            os.makedirs(tmp_out_dir)
-
-        # Convert image file
-        # Check file extension in file
-        if '.nii.gz' in file:
-            nii_file = utils.cp_file(file, tmp_out_dir, tmp_basename)
-            [path,filename,ext] = utils.file_parts(file)
-            json_file = os.path.join(path,filename + '.json')
-            try:
-                json_file = utils.cp_file(json_file, tmp_out_dir, tmp_basename)
-            except FileNotFoundError:
-                json_file = os.path.join(tmp_out_dir, tmp_basename + '.json')
-                pass
-        elif '.nii' in file:
-            nii_file = utils.cp_file(file, tmp_out_dir, tmp_basename)
-            nii_file = utils.gzip_file(nii_file)
-            [path,filename,ext] = utils.file_parts(file)
-            json_file = os.path.join(path,filename + '.json')
-            try:
-                json_file = utils.cp_file(json_file, tmp_out_dir, tmp_basename)
-            except FileNotFoundError:
-                json_file = os.path.join(tmp_out_dir, tmp_basename + '.json')
-                pass
-        elif '.dcm' in file or '.PAR' in file:
-            [nii_file, json_file] = utils.convert_anat(file,tmp_out_dir,tmp_basename)
-        else:
-            [nii_file, json_file] = utils.convert_anat(file,tmp_out_dir,tmp_basename)
+    if scan_type.lower() == 'func' and task:
+        converted_files = data_to_bids_func(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,task=task,meta_dict_com=com_param_dict,meta_dict_func=scan_param_dict,ses=ses,scan_type=scan_type)
+    elif scan_type.lower() == 'dwi':
+        converted_files = data_to_bids_dwi(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_dwi=scan_param_dict,ses=ses,scan_type=scan_type)
+    elif scan_type.lower() == 'fmap':
+        converted_files = data_to_bids_fmap(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_fmap=scan_param_dict,ses=ses,scan_type=scan_type)
+    else:
+        converted_files = data_to_bids_anat(bids_out_dir=bids_out_dir,file=file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_anat=scan_param_dict,ses=ses,scan_type=scan_type)
 
-        # Get additional sequence/modality parameters
-        if os.path.exists(json_file):
-            meta_dict_params = get_data_params(file, json_file)
-        else:
-            tmp_json = ""
-            meta_dict_params = get_data_params(file, tmp_json)
+    return converted_files
 
-        # Update JSON file
-        info = dict()
-        info = utils.dict_multi_update(info,**meta_dict_params)
-        info = utils.dict_multi_update(info,**meta_dict_com)
-        info = utils.dict_multi_update(info,**meta_dict_anat)
+def get_dwi_acq(info):
+    '''
+    Creates the acquisition label of a diffusion weighted image, in order to differentiate between DWI scans
+    with different b-values (and echo times): the 'acq' key of the JSON sidecar, followed by the b-values, and
+    the echo time (in ms), e.g. 'b0b1000TE88'.
 
-        json_file = utils.update_json(json_file,info)
+    Arguments:
+        info (dict): JSON sidecar dictionary
 
-        nii_file = os.path.abspath(nii_file)
-        json_file = os.path.abspath(json_file)
+    Returns:
+        acq (string): Acquisition label
+    '''
 
-        info = dict()
-        info = utils.read_json(json_file)
+    # Non-standard acquisition/naming keys
+    try:
+        bvals = info['bval']
+    except KeyError:
+        bvals = list()
+        pass
+    try:
+        echo_time = info['EchoTime']
+        echo_time = int(echo_time * 1000)
+    except KeyError:
+        echo_time = ""
+        pass
 
-        # Append w to T1/T2 if not already done
-        if scan in 'T1' or scan in 'T2':
-            scan = scan + 'w'
+    if bvals:
+        vals = ""
+        for val in bvals:
+            vals = vals + 'b' + str(int(val))
+    else:
+        vals = 'b0'
 
-        # Query dictionary for acquisition/naming keys
-        try:
-            acq = info['acq']
-        except KeyError:
-            acq = ""
-            pass
-        try:
-            ce = info['ce']
-        except KeyError:
-            ce = ""
-            pass
-        try:
-            rec = info['rec']
-        except KeyError:
-            rec = ""
-            pass
+    acq = info.get('acq', "")
+
+    if echo_time:
+        acq = f"{acq}{vals}TE{echo_time}"
+    else:
+        acq = f"{acq}{vals}"
+
+    return acq
+
+# Naming policies of the 'data_to_bids_*' functions (see 'name_series'):
+#   convert (function): Converts raw image data (see e.g. 'utils.convert_anat')
+#   entities (list): BIDS entities before the run number, in filename order. The values are read from the JSON sidecar
+#                    (the task is an argument).
+#   post_run (list): BIDS entities after the run number (also used to number runs)
+#   acq (function): Derives the acquisition label from the JSON sidecar, None to use the 'acq' key of the sidecar
+#   suffixes (list): Suffixes of the output images (in the order of the converted images), the scan if empty
+#   run_scan (string): Scan used to number runs, the scan if empty
+#   w_suffix (bool): Append w to T1/T2 scans
+#   sbref (bool): Single volume images are single-band references (scan 'sbref', without bval and bvec files)
+#   bvals (bool): The series has bval and bvec files
+#   image_types (list): PAR REC image types of the converted images (in the order of the suffixes), if several. Used
+#                       to plan conversions (see 'inspect_series').
+NAMING_POLICIES = {"anat": {"convert": utils.convert_anat,
+                            "entities": ["acq", "ce", "rec"],
+                            "post_run": [],
+                            "acq": None,
+                            "suffixes": [],
+                            "run_scan": "",
+                            "w_suffix": True,
+                            "sbref": False,
+                            "bvals": False,
+                            "image_types": []},
+                   "func": {"convert": utils.convert_anat,
+                            "entities": ["task", "acq", "ce", "dir", "rec"],
+                            "post_run": ["echo"],
+                            "acq": None,
+                            "suffixes": [],
+                            "run_scan": "",
+                            "w_suffix": False,
+                            "sbref": True,
+                            "bvals": False,
+                            "image_types": []},
+                   "fmap": {"convert": utils.convert_fmap,
+                            "entities": ["acq"],
+                            "post_run": [],
+                            "acq": None,
+                            "suffixes": ["fieldmap", "magnitude"],
+                            "run_scan": "fieldmap",
+                            "w_suffix": False,
+                            "sbref": False,
+                            "bvals": False,
+                            "image_types": [1, 0]},
+                   "dwi": {"convert": utils.convert_dwi,
+                           "entities": ["acq", "dir"],
+                           "post_run": [],
+                           "acq": get_dwi_acq,
+                           "suffixes": [],
+                           "run_scan": "",
+                           "w_suffix": False,
+                           "sbref": True,
+                           "bvals": True,
+                           "image_types": []}}
+
+# Keyword arguments of 'utils.reserve_run' for BIDS entities (if not the entity)
+RUN_KEYS = {"dir": "dirs"}
+
+class SeriesJob(object):
+    '''
+    Conversion of a series to BIDS. The job is passed through the stages of the conversion engine (see 'STAGES'),
+    or those of a planned conversion (see 'PLAN_STAGES'), which fill in its attributes.
+
+    Attributes:
+        bids_out_dir (string): Path to output BIDS directory
+        file (string): Filepath to image file
+        sub (string): Subject ID (zero-padded if possible)
+        ses (string): Session ID (zero-padded if possible)
+        scan (string): Modality (e.g. T1w, bold, dwi, or sbref)
+        task (string): Task for functional image data, empty otherwise
+        scan_type (string): BIDS sub-directory scan type
+        policy (dict): Naming policy (see 'NAMING_POLICIES')
+        metadata (list): Metadata dictionaries (common, and scan type specific metadata)
+        runs (utils.RunPlan): Run plan of a planned conversion, None to reserve run numbers (see 'utils.reserve_run')
+        out_dir (string): Output directory (locate)
+        tmp_out_dir (string): Temporary (work) directory (stage)
+        tmp_basename (string): Temporary file basename (stage)
+        images (list): Converted images (convert)
+        sidecars (list): JSON sidecars of the converted images, which need not exist, None if there is no converter
+            sidecar (convert)
+        bval (string): bval file, empty if none (convert)
+        bvec (string): bvec file, empty if none (convert)
+        header (dict): Sidecar keys read from the source data headers, for planned conversions (inspect)
+        unresolved (list): BIDS entities that cannot be determined from the source data headers, for planned 
+            conversions (inspect)
+        frames (int or string): Number of volumes of the (first) image, 'unknown' if it cannot be determined (convert)
+        info (list): JSON sidecar dictionaries of the images (enrich)
+        out_names (list): Output filenames (without extension) of the images (name)
+        outputs (tuple): Converted (BIDS named) files (commit)
+    '''
+
+    def __init__(self, bids_out_dir, file, sub, scan, policy, task="", meta_dict_com=dict(), meta_dict_scan=dict(), ses=1, scan_type='anat', runs=None):
+        self.bids_out_dir = bids_out_dir
+        self.file = file
+        self.sub = sub
+        self.ses = ses
+        self.scan = scan
+        self.task = task
+        self.scan_type = scan_type
+        self.policy = NAMING_POLICIES[policy]
+        self.metadata = [meta_dict_com, meta_dict_scan]
+        self.runs = runs
+        self.out_dir = ""
+        self.tmp_out_dir = ""
+        self.tmp_basename = ""
+        self.images = list()
+        self.sidecars = list()
+        self.bval = ""
+        self.bvec = ""
+        self.header = dict()
+        self.unresolved = list()
+        self.frames = 'unknown'
+        self.info = list()
+        self.out_names = list()
+        self.outputs = None
+
+def locate_series(job):
+    '''
+    Stage: determines the output directory of the series (nothing is written).
 
-        # Create output filename
-        out_name = f"sub-{sub}" + f"_ses-{ses}"
-        name_run_dict = dict()
+    Arguments:
+        job (SeriesJob): Conversion job
 
-        if acq:
-            out_name = out_name + f"_acq-{acq}"
-            tmp_dict = {"acq":f"{acq}"}
-            name_run_dict.update(tmp_dict)
+    Returns:
+        job (SeriesJob): Conversion job
+    '''
+
+    # Zeropad subject ID if possible
+    try:
+        job.sub = '{:03}'.format(int(job.sub))
+    except ValueError:
+        pass
+    # Zeropad session ID if possible
+    try:
+        job.ses = '{:03}'.format(int(job.ses))
+    except ValueError:
+        pass
 
-        if ce:
-            out_name = out_name + f"_ce-{ce}"
-            tmp_dict = {"ce":f"{ce}"}
-            name_run_dict.update(tmp_dict)
+    out_dir = os.path.join(job.bids_out_dir, f"sub-{job.sub}", f"ses-{job.ses}", f"{job.scan_type}")
 
-        if rec:
-            out_name = out_name + f"_rec-{rec}"
-            tmp_dict = {"rec":f"{rec}"}
-            name_run_dict.update(tmp_dict)
+    # Get absolute filepaths
+    job.bids_out_dir = os.path.abspath(job.bids_out_dir)
+    job.out_dir = os.path.abspath(out_dir)
 
-        # Get Run number
-        run = utils.get_num_runs(out_dir, scan=scan, **name_run_dict)
-        run = '{:02}'.format(run)
+    return job
 
-        if run:
-            out_name = out_name + f"_run-{run}"
+def stage_series(job):
+    '''
+    Stage: determines the output directory of the series (see 'locate_series'), and creates it and a temporary (work)
+    directory for the series.
 
-        out_name = out_name + f"_{scan}"
+    Arguments:
+        job (SeriesJob): Conversion job
 
+    Returns:
+        job (SeriesJob): Conversion job
+    '''
 
-        out_nii = os.path.join(out_dir, out_name + '.nii.gz')
-        out_json = os.path.join(out_dir, out_name + '.json')
+    locate_series(job)
 
-        os.rename(nii_file, out_nii)
-        os.rename(json_file, out_json)
+    # Make output directory
+    os.makedirs(job.out_dir, exist_ok=True)
 
-        # remove temporary directory and leftover files
-        shutil.rmtree(tmp_out_dir)
+    # Create temporary output names/directories (unique, as series may be converted in parallel)
+    n = 10000 # maximum N for random number generator
+    job.tmp_out_dir = tempfile.mkdtemp(prefix='tmp_dir', dir=os.path.join(job.bids_out_dir, f"sub-{job.sub}"))
+    job.tmp_basename = 'tmp_basename' + str(random.randint(0, n))
 
-        return out_nii,out_json
-    except FileNotFoundError:
-        print(f"Error: unable to convert {file}")
-        pass
+    return job
 
-def data_to_bids_func(bids_out_dir, file, sub, scan, task = 'rest', meta_dict_com=dict(), meta_dict_func=dict(), ses=1, scan_type='func'):
+def convert_series(job):
     '''
-    Renames converted NifTi-2 files to conform with the BIDS naming convension (in the case of functional files).
-    This function accepts any image file (DICOM, PAR REC, and NifTi-2). If the image file is a raw data file (e.g. DICOM, PAR REC)
-    it is converted to NifTi first, then renamed. The output BIDS directory need not exist at runtime.
-    
+    Stage: converts raw image data (DICOM, PAR REC) to NifTi in the temporary directory, or links NifTi image
+    data (and copies their JSON sidecar, and bval and bvec files) to the temporary directory. Single volume
+    images are single-band references if the naming policy says so.
+
     Arguments:
-        bids_out_dir (string): Path to output BIDS directory. 
-        file (string): Filepath to image file.
-        sub (int or string): Subject ID
-        scan (string): Modality (e.g. bold or cbv)
-        task (string): Task for the fMR image data
-        meta_dict_com (dict): Metadata dictionary for common image metadata
-        meta_dict_func (dict): Metadata dictionary for common functional image specific metadata
-        ses (int or string): Session ID
-        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat, func (default), fmap, dwi, etc.
-        
+        job (SeriesJob): Conversion job
+
     Returns:
-        out_nii (string): Absolute filepath to gzipped output 4D NifTi-2 file
-        out_json (string): Absolute filepath to corresponding JSON file
+        job (SeriesJob): Conversion job
     '''
 
-    # Use try-except statement here in the case of invalid/incomplete image files that will throw errors in dcm2niix
-    try:
-        # Create Output Directory Variables
-        # Zeropad subject ID if possible
-        try:
-            sub = '{:03}'.format(int(sub))
-        except ValueError:
-            pass
-        # Zeropad session ID if possible
+    file = job.file
+    policy = job.policy
+
+    # Check file extension in file
+    if '.nii' in file:
+        nii_file = utils.link_file(file, job.tmp_out_dir, job.tmp_basename)
+        if not '.nii.gz' in file:
+            nii_file = utils.compress_file(nii_file)
+        [path,filename,ext] = utils.file_parts(file)
+        json_file = os.path.join(path,filename + '.json')
         try:
-            ses = '{:03}'.format(int(ses))
-        except ValueError:
+            json_file = utils.cp_file(json_file, job.tmp_out_dir, job.tmp_basename)
+        except FileNotFoundError:
+            json_file = os.path.join(job.tmp_out_dir, job.tmp_basename + '.json')
             pass
+        job.images = [nii_file]
+        job.sidecars = [json_file]
+        # bval and bvec files are copied should they exist
+        if policy['bvals'] and os.path.exists(os.path.join(path,filename + '.bval')) and os.path.exists(os.path.join(path,filename + '.bvec')):
+            job.bval = os.path.join(path,filename + '.bval')
+            job.bvec = os.path.join(path,filename + '.bvec')
+    elif policy['bvals']:
+        [nii_file, json_file, job.bval, job.bvec] = policy['convert'](file,job.tmp_out_dir,job.tmp_basename)
+        job.images = [nii_file]
+        job.sidecars = [json_file]
+    else:
+        # Converted images, and their sidecars, in pairs
+        outputs = policy['convert'](file,job.tmp_out_dir,job.tmp_basename)
+        job.images = list(outputs[0::2])
+        job.sidecars = list(outputs[1::2])
 
-        out_dir = os.path.join(bids_out_dir, f"sub-{sub}", f"ses-{ses}", f"{scan_type}")
-
-        # Make output directory
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-
-        # Get absolute filepaths
-        bids_out_dir = os.path.abspath(bids_out_dir)
-        out_dir = os.path.abspath(out_dir)
-
-        # Create temporary output names/directories
-        n = 10000 # maximum N for random number generator
-        tmp_out_dir = os.path.join(bids_out_dir, f"sub-{sub}", 'tmp_dir' + str(random.randint(0, n)))
-        tmp_basename = 'tmp_basename' + str(random.randint(0, n))
-
-        if not os.path.exists(tmp_out_dir):
-            os.makedirs(tmp_out_dir)
-
-        # Convert image file
-        # Check file extension in file
-        if '.nii.gz' in file:
-            nii_file = utils.cp_file(file, tmp_out_dir, tmp_basename)
-            [path,filename,ext] = utils.file_parts(file)
-            json_file = os.path.join(path,filename + '.json')
-            try:
-                json_file = utils.cp_file(json_file, tmp_out_dir, tmp_basename)
-            except FileNotFoundError:
-                json_file = os.path.join(tmp_out_dir, tmp_basename + '.json')
-                pass
-        elif '.nii' in file:
-            nii_file = utils.cp_file(file, tmp_out_dir, tmp_basename)
-            nii_file = utils.gzip_file(nii_file)
-            [path,filename,ext] = utils.file_parts(file)
-            json_file = os.path.join(path,filename + '.json')
-            try:
-                json_file = utils.cp_file(json_file, tmp_out_dir, tmp_basename)
-            except FileNotFoundError:
-                json_file = os.path.join(tmp_out_dir, tmp_basename + '.json')
-                pass
-        elif '.dcm' in file or '.PAR' in file:
-            [nii_file, json_file] = utils.convert_anat(file,tmp_out_dir,tmp_basename)
-        else:
-            [nii_file, json_file] = utils.convert_anat(file,tmp_out_dir,tmp_basename)
+    if not all(job.images):
+        raise FileNotFoundError(f"No converted image: {file}")
 
-        # Get additional sequence/modality parameters
-        if os.path.exists(json_file):
-            meta_dict_params = get_data_params(file, json_file)
-        else:
-            tmp_json = ""
-            meta_dict_params = get_data_params(file, tmp_json)
+    job.frames = get_num_frames(job.images[0])
 
-        # Update JSON file
-        info = dict()
-        info = utils.dict_multi_update(info,**meta_dict_params)
-        info = utils.dict_multi_update(info,**meta_dict_com)
-        info = utils.dict_multi_update(info,**meta_dict_func)
+    # Decide if file is a single-band reference
+    if policy['sbref'] and job.frames == 1:
+        job.scan = 'sbref'
+        job.bval = ""
+        job.bvec = ""
 
-        json_file = utils.update_json(json_file,info)
+    # Copy bval and bvec files of NifTi image data
+    if '.nii' in file and job.bval and job.bvec:
+        job.bval = utils.cp_file(job.bval, job.tmp_out_dir, job.tmp_basename)
+        job.bvec = utils.cp_file(job.bvec, job.tmp_out_dir, job.tmp_basename)
 
-        nii_file = os.path.abspath(nii_file)
-        json_file = os.path.abspath(json_file)
+    return job
 
-        info = dict()
-        info = utils.read_json(json_file)
+def inspect_series(job):
+    '''
+    Stage: header-only counterpart of 'convert_series', used to plan a conversion (see 'PLAN_STAGES'). Determines the 
+    images a conversion would produce, their number of volumes, and the sidecar keys the converter would read from 
+    the headers (i.e. the echo time), from the source data headers only: image data are neither read nor converted. 
+    The source file takes the place of each image (and of the bval and bvec files of raw diffusion data). Single 
+    volume images are single-band references if the naming policy says so.
+    
+    N.B.: The number of volumes of DICOM data is the number of temporal positions in the DICOM header, which is 
+    unknown for diffusion weighted data, in which case the image is not planned as a single-band reference. The 
+    b-values of DICOM data are read from the DiffusionBValue header field of the files of the series (see 
+    'convert_source_dcm.get_dcm_bvals'). If it is missing, the acquisition label is unresolved.
 
-        # Decide if file is 4D timeseries or single-band reference
-        num_frames = get_num_frames(nii_file)
-        if num_frames == 1:
-            scan = 'sbref'
+    Arguments:
+        job (SeriesJob): Conversion job
 
-        # Query dictionary for acquisition/naming keys
-        try:
-            acq = info['acq']
-        except KeyError:
-            acq = ""
-            pass
-        try:
-            ce = info['ce']
-        except KeyError:
-            ce = ""
-            pass
-        try:
-            direction = info['dir']
-        except KeyError:
-            direction = ""
-            pass
-        try:
-            rec = info['rec']
-        except KeyError:
-            rec = ""
-            pass
-        try:
-            echo = info['echo']
-        except KeyError:
-            echo = ""
-            pass
+    Returns:
+        job (SeriesJob): Conversion job
+    '''
 
-        # Create output filename    
-        out_name = f"sub-{sub}" + f"_ses-{ses}" + f"_task-{task}"
+    file = job.file
+    policy = job.policy
 
-        name_run_dict = dict()
-        tmp_dict = {"task":f"{task}"}
-        name_run_dict.update(tmp_dict)
+    [path,filename,ext] = utils.file_parts(file)
 
-        if acq:
-            out_name = out_name + f"_acq-{acq}"
-            tmp_dict = {"acq":f"{acq}"}
-            name_run_dict.update(tmp_dict)
+    # Check file extension in file
+    if '.nii' in file:
+        job.images = [file]
+        job.sidecars = [os.path.join(path,filename + '.json')]
+        job.frames = get_num_frames(file)
+        if policy['bvals'] and os.path.exists(os.path.join(path,filename + '.bval')) and os.path.exists(os.path.join(path,filename + '.bvec')):
+            job.bval = os.path.join(path,filename + '.bval')
+            job.bvec = os.path.join(path,filename + '.bvec')
+    else:
+        if ext.upper() == '.PAR':
+            image_info = csp.get_par_image_info(file)
+            image_defs = csp.read_par_image_table(file)
+            job.frames = image_info['num_volumes']
+            if image_defs.size:
+                job.header = {"EchoTime": float(image_defs['echo_time'][0]) / 1000.0}
+            job.images = [file if image_type in image_info['image_types'] else "" for image_type in policy['image_types']] or [file]
+        else:
+            if not policy['bvals']:
+                job.frames = cdm.get_num_frames(file)
+            echo_time = cdm.get_echo_time(file)
+            if echo_time != 'unknown':
+                job.header = {"EchoTime": echo_time}
+            if policy['bvals']:
+                bvals = cdm.get_dcm_bvals(file)
+                if bvals is None:
+                    job.unresolved.append('acq')
+                else:
+                    job.header["bval"] = bvals
+            job.images = [file] * (len(policy['suffixes']) or 1)
+        job.sidecars = [None] * len(job.images)
+        if policy['bvals']:
+            job.bval = file
+            job.bvec = file
 
-        if ce:
-            out_name = out_name + f"_ce-{ce}"
-            tmp_dict = {"ce":f"{ce}"}
-            name_run_dict.update(tmp_dict)
+    if not all(job.images):
+        raise FileNotFoundError(f"No converted image: {file}")
 
-        if direction:
-            out_name = out_name + f"_dir-{direction}"
-            tmp_dict = {"dirs":f"{direction}"}
-            name_run_dict.update(tmp_dict)
+    # Decide if file is a single-band reference
+    if policy['sbref'] and job.frames == 1:
+        job.scan = 'sbref'
+        job.bval = ""
+        job.bvec = ""
 
-        if rec:
-            out_name = out_name + f"_rec-{rec}"
-            tmp_dict = {"rec":f"{rec}"}
-            name_run_dict.update(tmp_dict)
+    return job
 
-        if echo:
-            tmp_dict = {"echo":f"{echo}"}
-            name_run_dict.update(tmp_dict)
+def enrich_series(job):
+    '''
+    Stage: gets the additional sequence/modality parameters of the series (see 'get_data_params'), and builds the
+    JSON sidecars of the images in memory (see 'utils.build_sidecar').
 
-        # Get Run number
-        run = utils.get_num_runs(out_dir, scan=scan, **name_run_dict)
-        run = '{:02}'.format(run)
+    Arguments:
+        job (SeriesJob): Conversion job
 
-        if run:
-            out_name = out_name + f"_run-{run}"
+    Returns:
+        job (SeriesJob): Conversion job
+    '''
 
-        if echo:
-            out_name = out_name + f"_echo-{echo}"
+    json_file = job.sidecars[0]
+    if json_file is None or not os.path.exists(json_file):
+        json_file = ""
 
-        out_name = out_name + f"_{scan}"
+    # bval file (not the source file of a planned conversion, see 'inspect_series')
+    bval = job.bval
+    if bval == job.file or not os.path.exists(bval):
+        bval = ""
 
+    meta_dict_params = get_data_params(job.file, json_file, bval)
 
-        out_nii = os.path.join(out_dir, out_name + '.nii.gz')
-        out_json = os.path.join(out_dir, out_name + '.json')
+    job.info = [utils.build_sidecar(sidecar, job.header, meta_dict_params, *job.metadata) for sidecar in job.sidecars]
 
-        os.rename(nii_file, out_nii)
-        os.rename(json_file, out_json)
+    return job
 
-        # remove temporary directory and leftover files
-        shutil.rmtree(tmp_out_dir)
+def name_series(job):
+    '''
+    Stage: creates the BIDS output filenames of the series from its naming policy, and the acquisition/naming keys
+    in its JSON sidecar. The run number is allocated in the order of the series (see 'utils.wait_commit_turn'), or
+    planned (see 'utils.RunPlan').
 
-        return out_nii,out_json
-    except FileNotFoundError:
-        print(f"Error: unable to convert {file}")
-        pass
+    Arguments:
+        job (SeriesJob): Conversion job
 
-def data_to_bids_fmap(bids_out_dir, file, sub, scan='fieldmap', meta_dict_com=dict(), meta_dict_fmap=dict(), ses=1, scan_type='fmap'):
+    Returns:
+        job (SeriesJob): Conversion job
     '''
-    Renames converted NifTi-2 files to conform with the BIDS naming convension (in the case of fieldmap files).
-    This function accepts any image file (DICOM, PAR REC, and NifTi-2). If the image file is a raw data file (e.g. DICOM, PAR REC)
-    it is converted to NifTi first, then renamed. The output BIDS directory need not exist at runtime.
-    
-    N.B.: This function is mainly designed to handle fieldmap data case 3 from bids-specifications document. Furhter support for 
-    the additional cases requires test/validation data. 
-    BIDS-specifications document located here: 
-    https://github.com/bids-standard/bids-specification/blob/master/src/04-modality-specific-files/01-magnetic-resonance-imaging-data.md
-    
+
+    policy = job.policy
+    info = job.info[0]
+
+    # Append w to T1/T2 if not already done
+    if policy['w_suffix'] and (job.scan in 'T1' or job.scan in 'T2'):
+        job.scan = job.scan + 'w'
+
+    # Query dictionary for acquisition/naming keys
+    values = dict()
+    for entity in policy['entities'] + policy['post_run']:
+        if entity in job.unresolved:
+            values[entity] = '?'
+        elif entity == 'task':
+            values[entity] = job.task
+        elif entity == 'acq' and policy['acq']:
+            values[entity] = policy['acq'](info)
+        else:
+            values[entity] = info.get(entity, "")
+
+    # Create output filename
+    out_name = f"sub-{job.sub}" + f"_ses-{job.ses}"
+    name_run_dict = dict()
+
+    for entity in policy['entities'] + policy['post_run']:
+        if values[entity]:
+            name_run_dict[RUN_KEYS.get(entity, entity)] = f"{values[entity]}"
+            if entity in policy['entities']:
+                out_name = out_name + f"_{entity}-{values[entity]}"
+
+    # Get Run number (waits for earlier series when converting in parallel)
+    if job.runs is None:
+        utils.wait_commit_turn()
+        run = utils.reserve_run(job.bids_out_dir, job.out_dir, scan=policy['run_scan'] or job.scan, **name_run_dict, source=job.file)
+    else:
+        run = job.runs.reserve(job.out_dir, scan=policy['run_scan'] or job.scan, **name_run_dict, source=job.file)
+    run = '{:02}'.format(run)
+
+    if run:
+        out_name = out_name + f"_run-{run}"
+
+    for entity in policy['post_run']:
+        if values[entity]:
+            out_name = out_name + f"_{entity}-{values[entity]}"
+
+    suffixes = policy['suffixes'] or [job.scan]
+    job.out_names = [out_name + f"_{suffix}" for suffix in suffixes[:len(job.images)]]
+
+    return job
+
+def get_out_files(job):
+    '''
+    Creates the BIDS output filepaths of a named series (see 'name_series').
+
     Arguments:
-        bids_out_dir (string): Path to output BIDS directory. 
-        file (string): Filepath to image file.
-        sub (int or string): Subject ID
-        scan (string): Modality (e.g. fieldmap, magnitude, or phasediff)
-        meta_dict_com (dict): Metadata dictionary for common image metadata
-        meta_dict_fmap (dict): Metadata dictionary for common fieldmap image specific metadata
-        ses (int or string): Session ID
-        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat, func, fmap (default), dwi, etc.
-        
+        job (SeriesJob): Conversion job
+
     Returns:
-        out_nii_fmap (string): Absolute filepath to gzipped output NifTi-2 fieldmap image file
-        out_nii_mag (string): Absolute filepath to gzipped output NifTi-2 magnitude image file
-        out_json_fmap (string): Absolute filepath to correspond fieldmap image JSON sidecare
-        out_json_mag (string): Absolute filepath to correspond magnitude image JSON sidecare
+        out_niis (list): Output NifTi images
+        out_jsons (list): Output JSON sidecars
+        out_bvals (list): Output bval and bvec files (if any)
     '''
 
-    # Use try-except statement here in the case of invalid/incomplete image files that will throw errors in dcm2niix
-    try:
-        # Create Output Directory Variables
-        # Zeropad subject ID if possible
-        try:
-            sub = '{:03}'.format(int(sub))
-        except ValueError:
-            pass
-        # Zeropad session ID if possible
-        try:
-            ses = '{:03}'.format(int(ses))
-        except ValueError:
-            pass
+    out_files = [os.path.join(job.out_dir, out_name) for out_name in job.out_names]
 
-        out_dir = os.path.join(bids_out_dir, f"sub-{sub}", f"ses-{ses}", f"{scan_type}")
-
-        # Make output directory
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-
-        # Get absolute filepaths
-        bids_out_dir = os.path.abspath(bids_out_dir)
-        out_dir = os.path.abspath(out_dir)
-
-        # Create temporary output names/directories
-        n = 10000 # maximum N for random number generator
-        tmp_out_dir = os.path.join(bids_out_dir, f"sub-{sub}", 'tmp_dir' + str(random.randint(0, n)))
-        tmp_basename = 'tmp_basename' + str(random.randint(0, n))
-
-        if not os.path.exists(tmp_out_dir):
-            os.makedirs(tmp_out_dir)
-
-        # Convert image file
-        # Check file extension in file
-        if '.nii.gz' in file:
-            nii_file = utils.cp_file(file, tmp_out_dir, tmp_basename)
-            [path,filename,ext] = utils.file_parts(file)
-            json_file = os.path.join(path,filename + '.json')
-            try:
-                json_file = utils.cp_file(json_file, tmp_out_dir, tmp_basename)
-            except FileNotFoundError:
-                json_file = os.path.join(tmp_out_dir, tmp_basename + '.json')
-                pass
-            json_fmap = json_file
-            json_mag = json_file
-            nii_fmap = nii_file
-            nii_mag = nii_file
-        elif '.nii' in file:
-            nii_file = utils.cp_file(file, tmp_out_dir, tmp_basename)
-            nii_file = utils.gzip_file(nii_file)
-            [path,filename,ext] = utils.file_parts(file)
-            json_file = os.path.join(path,filename + '.json')
-            try:
-                json_file = utils.cp_file(json_file, tmp_out_dir, tmp_basename)
-            except FileNotFoundError:
-                json_file = os.path.join(tmp_out_dir, tmp_basename + '.json')
-                pass
-            json_fmap = json_file
-            json_mag = json_file
-            nii_fmap = nii_file
-            nii_mag = nii_file
-        elif '.dcm' in file or '.PAR' in file:
-            [nii_fmap, json_fmap, nii_mag, json_mag] = utils.convert_fmap(file,tmp_out_dir,tmp_basename)
-        else:
-            [nii_fmap, json_fmap, nii_mag, json_mag] = utils.convert_fmap(file,tmp_out_dir,tmp_basename)
+    out_niis = [out_file + '.nii.gz' for out_file in out_files]
+    out_jsons = [out_file + '.json' for out_file in out_files]
+    out_bvals = [out_files[0] + ext for ext, file in [('.bval', job.bval), ('.bvec', job.bvec)] if file]
 
-        # Get additional sequence/modality parameters
-        if os.path.exists(json_fmap):
-            meta_dict_params = get_data_params(file, json_fmap)
-        else:
-            tmp_json = ""
-            meta_dict_params = get_data_params(file, tmp_json)
+    return out_niis, out_jsons, out_bvals
 
-        # Update JSON file
-        info = dict()
-        info = utils.dict_multi_update(info,**meta_dict_params)
-        info = utils.dict_multi_update(info,**meta_dict_com)
-        info = utils.dict_multi_update(info,**meta_dict_fmap)
+def commit_series(job):
+    '''
+    Stage: moves the converted images (and bval and bvec files) to their BIDS filenames, writes their JSON sidecars,
+    and removes the temporary directory.
 
-        json_fmap = utils.update_json(json_fmap,info)
-        json_mag = utils.update_json(json_mag,info)
+    Arguments:
+        job (SeriesJob): Conversion job
 
-        nii_fmap = os.path.abspath(nii_fmap)
-        nii_mag = os.path.abspath(nii_mag)
+    Returns:
+        job (SeriesJob): Conversion job, with the converted (BIDS named) files: images, JSON sidecars, and bval and
+            bvec files (if any)
+    '''
 
-        json_fmap = os.path.abspath(json_fmap)
-        json_mag = os.path.abspath(json_mag)
+    [out_niis, out_jsons, out_bvals] = get_out_files(job)
 
-        info = dict()
-        info = utils.read_json(json_fmap)
+    with utils.trace_span('rename', job.images[0]):
+        for image, out_nii in zip(job.images, out_niis):
+            os.rename(image, out_nii)
 
-        # Query dictionary for acquisition/naming keys
-        try:
-            acq = info['acq']
-        except KeyError:
-            acq = ""
-            pass
+        for file, out_file in zip([file for file in [job.bval, job.bvec] if file], out_bvals):
+            os.rename(file, out_file)
 
-        # Create output filename    
-        out_name = f"sub-{sub}" + f"_ses-{ses}"
-        name_run_dict = dict()
+    for info, out_json in zip(job.info, out_jsons):
+        utils.write_json(out_json, info)
 
-        if acq:
-            out_name = out_name + f"_acq-{acq}"
-            tmp_dict = {"acq":f"{acq}"}
-            name_run_dict.update(tmp_dict)
+    # Remove temporary directory and leftover files
+    shutil.rmtree(job.tmp_out_dir)
 
-        # Get Run number
-        run = utils.get_num_runs(out_dir, scan=scan_type, **name_run_dict)
-        run = '{:02}'.format(run)
+    job.outputs = tuple(out_niis + out_jsons + out_bvals)
 
-        if run:
-            out_name = out_name + f"_run-{run}"
+    return job
 
-        # out_name = out_name + f"_{scan}"
+# Stages of the conversion engine, in order. Stages up to (but excluding) 'name_series' run concurrently for series
+# that are converted in parallel, the naming and commit stages run in the order of the series.
+STAGES = [stage_series, convert_series, enrich_series, name_series, commit_series]
 
-        out_nii_fmap = os.path.join(out_dir, out_name + '_fieldmap' + '.nii.gz')
-        out_nii_mag = os.path.join(out_dir, out_name + '_magnitude' + '.nii.gz')
+# Stages of a planned conversion (see 'plan_series'), which only read the source data headers and write nothing.
+PLAN_STAGES = [locate_series, inspect_series, enrich_series, name_series]
 
-        out_json_fmap = os.path.join(out_dir, out_name + '_fieldmap' + '.json')
-        out_json_mag = os.path.join(out_dir, out_name + '_magnitude' + '.json')
+def series_to_bids(bids_out_dir, file, sub, scan, policy='anat', task="", meta_dict_com=dict(), meta_dict_scan=dict(), ses=1, scan_type='anat'):
+    '''
+    Converts and renames an image file to BIDS, by running it through the stages of the conversion engine (see 'STAGES').
+    This function accepts any image file (DICOM, PAR REC, and NifTi-2). If the image file is a raw data file (e.g. DICOM, PAR REC)
+    it is converted to NifTi first, then renamed. The output BIDS directory need not exist at runtime.
 
-        if not 'nii' in file:
-            os.rename(nii_fmap, out_nii_fmap)
-            os.rename(nii_mag, out_nii_mag)
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory.
+        file (string): Filepath to image file.
+        sub (int or string): Subject ID
+        scan (string): Modality (e.g. T1w, bold, dwi, etc.)
+        policy (string): Naming policy (see 'NAMING_POLICIES'): anat (default), func, fmap, or dwi
+        task (string): Task for functional image data, empty otherwise
+        meta_dict_com (dict): Metadata dictionary for common image metadata
+        meta_dict_scan (dict): Metadata dictionary for scan type specific metadata
+        ses (int or string): Session ID
+        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat (default), func, fmap, dwi, etc.
 
-            os.rename(json_fmap, out_json_fmap)
-            os.rename(json_mag, out_json_mag)
+    Returns:
+        outputs (tuple): Converted (BIDS named) files: images, JSON sidecars, and bval and bvec files (if any). None
+            if the file could not be converted.
+    '''
 
-            # Remove temporary directory and leftover files
-            shutil.rmtree(tmp_out_dir)
-            return out_nii_fmap, out_nii_mag, out_json_fmap, out_json_mag
-        else:
-            os.rename(nii_fmap, out_nii_fmap)
-            os.rename(json_fmap, out_json_fmap)
+    job = SeriesJob(bids_out_dir, file, sub, scan, policy, task=task, meta_dict_com=meta_dict_com, meta_dict_scan=meta_dict_scan, ses=ses, scan_type=scan_type)
 
-            # Remove temporary directory and leftover files
-            shutil.rmtree(tmp_out_dir)
-            return out_nii_fmap, out_json_fmap
+    # Use try-except statement here in the case of invalid/incomplete image files that will throw errors in dcm2niix.
+    # Other errors (e.g. dcm2niix timeouts) are raised, and reported as a failure of the series by the caller. The 
+    # temporary directory is removed in either case.
+    try:
+        for stage in STAGES:
+            with utils.trace_span(stage.__name__, file):
+                stage(job)
     except FileNotFoundError:
         print(f"Error: unable to convert {file}")
-        pass
+        return None
+    finally:
+        if job.tmp_out_dir:
+            shutil.rmtree(job.tmp_out_dir, ignore_errors=True)
 
-def data_to_bids_dwi(bids_out_dir, file, sub, scan='dwi', meta_dict_com=dict(), meta_dict_dwi=dict(), ses=1, scan_type='dwi'):
+    return job.outputs
+
+def plan_series(bids_out_dir, file, sub, scan, policy='anat', task="", meta_dict_com=dict(), meta_dict_scan=dict(), ses=1, scan_type='anat', runs=None):
     '''
-    Renames converted NifTi-2 files to conform with the BIDS naming convension (in the case of diffuion image files).
-    This function accepts any image file (DICOM, PAR REC, and NifTi-2). If the image file is a raw data file (e.g. DICOM, PAR REC)
-    it is converted to NifTi first, then renamed. The output BIDS directory need not exist at runtime. If the original
-    data format is NifTi, bval and bvec files will be copied over should they exist, otherwise, they will not be
-    generated.
+    Plans the conversion of an image file to BIDS (see 'series_to_bids'), by running it through the stages of a planned
+    conversion (see 'PLAN_STAGES'): only the headers of the source data are read, and nothing is written.
     
     Arguments:
-        bids_out_dir (string): Path to output BIDS directory. 
+        bids_out_dir (string): Path to output BIDS directory.
         file (string): Filepath to image file.
         sub (int or string): Subject ID
-        scan (string): Modality (e.g. dwi, dki, etc)
+        scan (string): Modality (e.g. T1w, bold, dwi, etc.)
+        policy (string): Naming policy (see 'NAMING_POLICIES'): anat (default), func, fmap, or dwi
+        task (string): Task for functional image data, empty otherwise
         meta_dict_com (dict): Metadata dictionary for common image metadata
-        meta_dict_dwi (dict): Metadata dictionary for common diffusion image specific metadata
+        meta_dict_scan (dict): Metadata dictionary for scan type specific metadata
         ses (int or string): Session ID
-        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat, func, fmap, dwi (default), etc.
-        
+        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat (default), func, fmap, dwi, etc.
+        runs (utils.RunPlan): Run plan shared by the series of the conversion (a new run plan if None)
+
     Returns:
-        out_nii (string): Absolute filepath to gzipped output diffusion weighted NifTi-2 file
-        out_json (string): Absolute filepath to corresponding JSON file
-        out_bval (string): Absolute filepath to corresponding b-values file
-        out_bvec (string): Absolute filepath to corresponding b-vectors file
+        job (SeriesJob): Planned conversion job, with the (BIDS named) files the conversion would produce in 'outputs'
     '''
 
-    # Use try-except statement here in the case of invalid/incomplete image files that will throw errors in dcm2niix
-    try:
-        # Create Output Directory Variables
-        # Zeropad subject ID if possible
-        try:
-            sub = '{:03}'.format(int(sub))
-        except ValueError:
-            pass
-        # Zeropad session ID if possible
-        try:
-            ses = '{:03}'.format(int(ses))
-        except ValueError:
-            pass
+    if runs is None:
+        runs = utils.RunPlan()
 
-        out_dir = os.path.join(bids_out_dir, f"sub-{sub}", f"ses-{ses}", f"{scan_type}")
-
-        # Make output directory
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-
-        # Get absolute filepaths
-        bids_out_dir = os.path.abspath(bids_out_dir)
-        out_dir = os.path.abspath(out_dir)
-
-        # Create temporary output names/directories
-        n = 10000 # maximum N for random number generator
-        tmp_out_dir = os.path.join(bids_out_dir, f"sub-{sub}", 'tmp_dir' + str(random.randint(0, n)))
-        tmp_basename = 'tmp_basename' + str(random.randint(0, n))
-
-        if not os.path.exists(tmp_out_dir):
-            os.makedirs(tmp_out_dir)
-
-        # Convert image file
-        # Check file extension in file
-        if '.nii.gz' in file:
-            nii_file = utils.cp_file(file, tmp_out_dir, tmp_basename)
-            [path,filename,ext] = utils.file_parts(file)
-            json_file = os.path.join(path,filename + '.json')
-            bval = os.path.join(path,filename + '.bval*')
-            bvec = os.path.join(path,filename + '.bvec*')
-            try:
-                json_file = utils.cp_file(json_file, tmp_out_dir, tmp_basename)
-                # Decide if file is DWI or single-band reference
-                num_frames = get_num_frames(nii_file)
-                if num_frames == 1:
-                    scan = 'sbref'; bval = ""; bvec = ""
-                else:
-                    bval = utils.cp_file(bval, tmp_out_dir, tmp_basename)
-                    bvec = utils.cp_file(bvec, tmp_out_dir, tmp_basename)
-            except FileNotFoundError:
-                json_file = os.path.join(tmp_out_dir, tmp_basename + '.json')
-                bval = os.path.join(tmp_out_dir, tmp_basename + '.bval')
-                bvec = os.path.join(tmp_out_dir, tmp_basename + '.bvec')
-                # Decide if file is DWI or single-band reference
-                num_frames = get_num_frames(nii_file)
-                if num_frames == 1:
-                    scan = 'sbref'; bval = ""; bvec = ""
-                pass
-        elif '.nii' in file:
-            nii_file = utils.cp_file(file, tmp_out_dir, tmp_basename)
-            nii_file = utils.gzip_file(nii_file)
-            [path,filename,ext] = utils.file_parts(file)
-            json_file = os.path.join(path,filename + '.json')
-            bval = os.path.join(path,filename + '.bval*')
-            bvec = os.path.join(path,filename + '.bvec*')
-            try:
-                json_file = utils.cp_file(json_file, tmp_out_dir, tmp_basename)
-                # Decide if file is DWI or single-band reference
-                num_frames = get_num_frames(nii_file)
-                if num_frames == 1:
-                    scan = 'sbref'; bval = ""; bvec = ""
-                else:
-                    bval = utils.cp_file(bval, tmp_out_dir, tmp_basename)
-                    bvec = utils.cp_file(bvec, tmp_out_dir, tmp_basename)
-            except FileNotFoundError:
-                json_file = os.path.join(tmp_out_dir, tmp_basename + '.json')
-                bval = os.path.join(tmp_out_dir, tmp_basename + '.bval')
-                bvec = os.path.join(tmp_out_dir, tmp_basename + '.bvec')
-                # Decide if file is DWI or single-band reference
-                num_frames = get_num_frames(nii_file)
-                if num_frames == 1:
-                    scan = 'sbref'; bval = ""; bvec = ""
-                pass
-        elif '.dcm' in file or '.PAR' in file:
-            [nii_file, json_file, bval, bvec] = utils.convert_dwi(file,tmp_out_dir,tmp_basename)
-            # Decide if file is DWI or single-band reference
-            num_frames = get_num_frames(nii_file)
-            if num_frames == 1:
-                scan = 'sbref'; bval = ""; bvec = ""
-        else:
-            [nii_file, json_file, bval, bvec] = utils.convert_dwi(file,tmp_out_dir,tmp_basename)
-            # Decide if file is DWI or single-band reference
-            num_frames = get_num_frames(nii_file)
-            if num_frames == 1:
-                scan = 'sbref'; bval = ""; bvec = ""
-
-        # Get additional sequence/modality parameters
-        if os.path.exists(json_file) and os.path.exists(bval):
-            meta_dict_params = get_data_params(file, json_file, bval)
-        elif os.path.exists(bval):
-            tmp_json = ""
-            meta_dict_params = get_data_params(file, tmp_json, bval)
-        elif os.path.exists(json_file):
-            tmp_bval = ""
-            meta_dict_params = get_data_params(file, json_file, tmp_bval)
-        else:
-            tmp_json = ""
-            tmp_bval = ""
-            meta_dict_params = get_data_params(file, tmp_json, tmp_bval)
+    job = SeriesJob(bids_out_dir, file, sub, scan, policy, task=task, meta_dict_com=meta_dict_com, meta_dict_scan=meta_dict_scan, ses=ses, scan_type=scan_type, runs=runs)
 
-        # Update JSON file
-        info = dict()
-        info = utils.dict_multi_update(info,**meta_dict_params)
-        info = utils.dict_multi_update(info,**meta_dict_com)
-        info = utils.dict_multi_update(info,**meta_dict_dwi)
+    for stage in PLAN_STAGES:
+        with utils.trace_span(stage.__name__, file):
+            stage(job)
 
-        json_file = utils.update_json(json_file,info)
+    [out_niis, out_jsons, out_bvals] = get_out_files(job)
+    job.outputs = tuple(out_niis + out_jsons + out_bvals)
 
-        nii_file = os.path.abspath(nii_file)
-        json_file = os.path.abspath(json_file)
+    return job
 
-        info = dict()
-        info = utils.read_json(json_file)
+def plan_to_bids(bids_out_dir, file, sub, scan_type, scan, task="", meta_dict=dict(), ses=1, runs=None):
+    '''
+    Plans the conversion of an image file to BIDS (see 'plan_series') with the naming policy of its scan type, as 
+    'data_to_bids' would convert it.
+    
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory. 
+        file (string): Filepath to image file.
+        sub (int or string): Subject ID
+        scan_type (string): BIDS sub-directory scan type (e.g. anat, func, fmap, dwi, etc.)
+        scan (string): Modality (e.g. T1w, bold, dwi, etc.)
+        task (string): Task for functional image data, empty otherwise
+        meta_dict (dict): Nested metadata dictionary from the 'read_config' function
+        ses (int or string): Session ID
+        runs (utils.RunPlan): Run plan shared by the series of the conversion
+        
+    Returns:
+        job (SeriesJob): Planned conversion job
+    '''
 
-        if bval and bvec:
-            bval = os.path.abspath(bval)
-            bvec = os.path.abspath(bvec)
+    [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type,task=task)
 
-        # Query dictionary for acquisition/naming keys
-        try:
-            acq = info['acq']
-        except KeyError:
-            acq = ""
-            pass
-        try:
-            direction = info['dir']
-        except KeyError:
-            direction = ""
-            pass
+    if scan_type.lower() == 'func' and task:
+        policy = 'func'
+    elif scan_type.lower() in ['dwi', 'fmap']:
+        policy = scan_type.lower()
+    else:
+        policy = 'anat'
 
-        # Non-standard acquisition/naming keys
-        # Used in order to differentiate between DWI scans for multiple bvalues
-        try:
-            bvals = info['bval']
-        except KeyError:
-            bvals = list()
-            pass
-        try:
-            echo_time = info['EchoTime']
-            echo_time = int(echo_time * 1000)
-        except KeyError:
-            echo_time = ""
-            pass
+    job = plan_series(bids_out_dir, file, sub, scan, policy=policy, task=task if policy == 'func' else "", meta_dict_com=com_param_dict, meta_dict_scan=scan_param_dict, ses=ses, scan_type=scan_type, runs=runs)
 
-        # Create output filename    
-        out_name = f"sub-{sub}" + f"_ses-{ses}"
-        name_run_dict = dict()
+    return job
 
-        if bvals:
-            vals = ""
-            for val in bvals:
-                vals = vals + 'b' + str(int(val))
-        else:
-            vals = 'b0'
-
-        if vals and acq and echo_time:
-            out_name = out_name + f"_acq-{acq}{vals}TE{echo_time}"
-            tmp_dict = {"acq":f"{acq}{vals}TE{echo_time}"}
-        elif vals and acq:
-            out_name = out_name + f"_acq-{acq}{vals}"
-            tmp_dict = {"acq":f"{acq}{vals}"}
-        elif vals and echo_time:
-            out_name = out_name + f"_acq-{vals}TE{echo_time}"
-            tmp_dict = {"acq":f"{vals}TE{echo_time}"}
-        elif acq and echo_time:
-            out_name = out_name + f"_acq-{acq}TE{echo_time}"
-            tmp_dict = {"acq":f"{acq}TE{echo_time}"}
-        elif acq:
-            out_name = out_name + f"_acq-{acq}"
-            tmp_dict = {"acq":f"{acq}"}
-        elif vals:
-            out_name = out_name + f"_acq-{vals}"
-            tmp_dict = {"acq":f"{vals}"}
-        elif echo_time:
-            out_name = out_name + f"_acq-TE{echo_time}"
-            tmp_dict = {"acq":f"TE{echo_time}"}
-        else:
-            tmp_dict = dict()
+def data_to_bids_anat(bids_out_dir, file, sub, scan, meta_dict_com=dict(), meta_dict_anat=dict(), ses=1, scan_type='anat'):
+    '''
+    Renames converted NifTi-2 files to conform with the BIDS naming convension (in the case of anatomical files).
+    This function accepts any image file (DICOM, PAR REC, and NifTi-2). If the image file is a raw data file (e.g. DICOM, PAR REC)
+    it is converted to NifTi first, then renamed. The output BIDS directory need not exist at runtime.
 
-        name_run_dict.update(tmp_dict)
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory.
+        file (string): Filepath to image file.
+        sub (int or string): Subject ID
+        scan (string): Modality (e.g. T1w, T2w, or SWI)
+        meta_dict_com (dict): Metadata dictionary for common image metadata
+        meta_dict_anat (dict): Metadata dictionary for common anatomical image specific metadata
+        ses (int or string): Session ID
+        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat (default), func, fmap, dwi, etc.
 
-        if direction:
-            out_name = out_name + f"_dir-{direction}"
-            tmp_dict = {"dirs":f"{direction}"}
-            name_run_dict.update(tmp_dict)
+    Returns:
+        out_nii (string): Absolute filepath to gzipped output NifTi-2 file
+        out_json (string): Absolute filepath to corresponding JSON file
+    '''
 
-        # Get Run number
-        run = utils.get_num_runs(out_dir, scan=scan, **name_run_dict)
-        run = '{:02}'.format(run)
+    return series_to_bids(bids_out_dir, file, sub, scan, policy='anat', meta_dict_com=meta_dict_com, meta_dict_scan=meta_dict_anat, ses=ses, scan_type=scan_type)
 
-        if run:
-            out_name = out_name + f"_run-{run}"
+def data_to_bids_func(bids_out_dir, file, sub, scan, task = 'rest', meta_dict_com=dict(), meta_dict_func=dict(), ses=1, scan_type='func'):
+    '''
+    Renames converted NifTi-2 files to conform with the BIDS naming convension (in the case of functional files).
+    This function accepts any image file (DICOM, PAR REC, and NifTi-2). If the image file is a raw data file (e.g. DICOM, PAR REC)
+    it is converted to NifTi first, then renamed. The output BIDS directory need not exist at runtime.
 
-        out_name = out_name + f"_{scan}"
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory.
+        file (string): Filepath to image file.
+        sub (int or string): Subject ID
+        scan (string): Modality (e.g. bold or cbv)
+        task (string): Task for the fMR image data
+        meta_dict_com (dict): Metadata dictionary for common image metadata
+        meta_dict_func (dict): Metadata dictionary for common functional image specific metadata
+        ses (int or string): Session ID
+        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat, func (default), fmap, dwi, etc.
 
-        out_nii = os.path.join(out_dir, out_name + '.nii.gz')
-        out_json = os.path.join(out_dir, out_name + '.json')
+    Returns:
+        out_nii (string): Absolute filepath to gzipped output 4D NifTi-2 file
+        out_json (string): Absolute filepath to corresponding JSON file
+    '''
 
-        out_bval = os.path.join(out_dir, out_name + '.bval')
-        out_bvec = os.path.join(out_dir, out_name + '.bvec')
+    return series_to_bids(bids_out_dir, file, sub, scan, policy='func', task=task, meta_dict_com=meta_dict_com, meta_dict_scan=meta_dict_func, ses=ses, scan_type=scan_type)
 
-        os.rename(nii_file, out_nii)
-        os.rename(json_file, out_json)
+def data_to_bids_fmap(bids_out_dir, file, sub, scan='fieldmap', meta_dict_com=dict(), meta_dict_fmap=dict(), ses=1, scan_type='fmap'):
+    '''
+    Renames converted NifTi-2 files to conform with the BIDS naming convension (in the case of fieldmap files).
+    This function accepts any image file (DICOM, PAR REC, and NifTi-2). If the image file is a raw data file (e.g. DICOM, PAR REC)
+    it is converted to NifTi first, then renamed. The output BIDS directory need not exist at runtime.
+
+    N.B.: This function is mainly designed to handle fieldmap data case 3 from bids-specifications document. Furhter support for
+    the additional cases requires test/validation data.
+    BIDS-specifications document located here:
+    https://github.com/bids-standard/bids-specification/blob/master/src/04-modality-specific-files/01-magnetic-resonance-imaging-data.md
 
-        if bval:
-            os.rename(bval,out_bval)
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory.
+        file (string): Filepath to image file.
+        sub (int or string): Subject ID
+        scan (string): Modality (e.g. fieldmap, magnitude, or phasediff)
+        meta_dict_com (dict): Metadata dictionary for common image metadata
+        meta_dict_fmap (dict): Metadata dictionary for common fieldmap image specific metadata
+        ses (int or string): Session ID
+        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat, func, fmap (default), dwi, etc.
 
-        if bvec:
-            os.rename(bvec,out_bvec)
+    Returns:
+        out_nii_fmap (string): Absolute filepath to gzipped output NifTi-2 fieldmap image file
+        out_nii_mag (string): Absolute filepath to gzipped output NifTi-2 magnitude image file (not for NifTi image data)
+        out_json_fmap (string): Absolute filepath to correspond fieldmap image JSON sidecare
+        out_json_mag (string): Absolute filepath to correspond magnitude image JSON sidecare (not for NifTi image data)
+    '''
 
-        # remove temporary directory and leftover files
-        shutil.rmtree(tmp_out_dir)
+    return series_to_bids(bids_out_dir, file, sub, scan, policy='fmap', meta_dict_com=meta_dict_com, meta_dict_scan=meta_dict_fmap, ses=ses, scan_type=scan_type)
 
-        if bval and bvec:
-            return out_nii,out_json,out_bval,out_bvec
-        elif not bval and bvec:
-            return out_nii,out_json
-    except FileNotFoundError:
-        print(f"Error: unable to convert {file}")
-        pass
+def data_to_bids_dwi(bids_out_dir, file, sub, scan='dwi', meta_dict_com=dict(), meta_dict_dwi=dict(), ses=1, scan_type='dwi'):
+    '''
+    Renames converted NifTi-2 files to conform with the BIDS naming convension (in the case of diffuion image files).
+    This function accepts any image file (DICOM, PAR REC, and NifTi-2). If the image file is a raw data file (e.g. DICOM, PAR REC)
+    it is converted to NifTi first, then renamed. The output BIDS directory need not exist at runtime. If the original
+    data format is NifTi, bval and bvec files will be copied over should they exist, otherwise, they will not be
+    generated.
+
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory.
+        file (string): Filepath to image file.
+        sub (int or string): Subject ID
+        scan (string): Modality (e.g. dwi, dki, etc)
+        meta_dict_com (dict): Metadata dictionary for common image metadata
+        meta_dict_dwi (dict): Metadata dictionary for common diffusion image specific metadata
+        ses (int or string): Session ID
+        scan_type (string): BIDS sub-directory scan type. Valid options include, but are not limited to: anat, func, fmap, dwi (default), etc.
+
+    Returns:
+        out_nii (string): Absolute filepath to gzipped output diffusion weighted NifTi-2 file
+        out_json (string): Absolute filepath to corresponding JSON file
+        out_bval (string): Absolute filepath to corresponding b-values file (not for single-band references)
+        out_bvec (string): Absolute filepath to corresponding b-vectors file (not for single-band references)
+    '''
+
+    return series_to_bids(bids_out_dir, file, sub, scan, policy='dwi', meta_dict_com=meta_dict_com, meta_dict_scan=meta_dict_dwi, ses=ses, scan_type=scan_type)
@@ -5,55 +5,340 @@ PAR REC specific functions for convert_source. Primarily intended for converting
 
 # Import packages and modules
 import re
+import os
+import json
+import gzip
+from functools import lru_cache
 
 # Import third party packages and modules
 import utils
-import convert_source_nii as csn
 
-# Define functions
+# Define classes and functions
 
-def get_etl(par_file):
+class ParHeader(object):
     '''
-    Gets EPI factor (Echo Train Length) from Philips' PAR Header.
+    Parsed general information block of a Philips PAR header. The PAR file is read once, line by line, and
+    reading stops at the image definition table as only the general information is needed. Field values are
+    stored as strings in 'fields' (keyed by the field name with repeated whitespace removed, e.g. 'EPI factor <0,1=no EPI>'),
+    and the fields used by convert_source are available as typed attributes.
     
-    N.B.: This is done via a regEx search as the PAR header is not assumed to change significantly between scanners.
+    N.B.: Reduction and multi-band factors are read from the header text via regEx as the PAR header does not store these explicitly.
     
-    Arguments:
+    Attributes:
         par_file (string): Absolute filepath to PAR header file
+        version (string): PAR file version (e.g. 'V4.2'), empty if not found
+        fields (dict): Dictionary of field names mapped to their (string) values
+        protocol_name (string): Protocol name
+        technique (string): Scan technique (e.g. 'FEEPI', 'T1TFE')
+        etl (int or string): EPI factor (Echo Train Length), 'unknown' if not in header
+        wfs (float or string): Water Fat Shift (pixels), 'unknown' if not in header
+        scan_time (float or string): Acquisition duration (scan time, in s), 'unknown' if not in header
+        red_fact (float): Parallel reduction factor in-plane value (e.g. SENSE factor), 1 if not found
+        mb (int): Multi-band acceleration factor, 1 if not found
+    '''
+
+    # Sections that follow the general information block
+    _stop_regexp = re.compile(r'# === (PIXEL VALUES|IMAGE INFORMATION)')
+    _field_regexp = re.compile(r'\.\s+(.*?)\s*:\s*(.*?)\s*$')
+    _version_regexp = re.compile(r'.*image export tool\s+(V[0-9.]+)', re.I)
+    _red_fact_regexp = re.compile(r' SENSE *?([0-9.-]+)')
+    _mb_regexp = re.compile(r' MB *?([0-9.-]+)')
+
+    def __init__(self, par_file):
+        '''
+        Reads and parses the general information block of a PAR header.
+        
+        Arguments:
+            par_file (string): Absolute filepath to PAR header file
+        '''
+
+        self.par_file = par_file
+        self.version = ""
+        self.fields = dict()
+        
+        red_fact = ""
+        mb = ""
+
+        with open(par_file) as f:
+            for line in f:
+                if self._stop_regexp.match(line):
+                    break
+                if not self.version:
+                    match = self._version_regexp.match(line)
+                    if match:
+                        self.version = match.group(1)
+                if not red_fact:
+                    match = self._red_fact_regexp.search(line)
+                    if match:
+                        red_fact = match.group(1)
+                if not mb:
+                    match = self._mb_regexp.search(line)
+                    if match:
+                        mb = match.group(1)
+                match = self._field_regexp.match(line)
+                if match:
+                    name = " ".join(match.group(1).split())
+                    self.fields[name] = match.group(2)
+
+        self.protocol_name = self.fields.get("Protocol name", "")
+        self.technique = self.fields.get("Technique", "")
+        self.etl = self._get_number("EPI factor <0,1=no EPI>", int)
+        self.wfs = self._get_number("Water Fat shift [pixels]", float)
+        self.scan_time = self._get_number("Scan Duration [sec]", float)
+
+        if red_fact:
+            self.red_fact = float(red_fact)
+        else:
+            self.red_fact = float(1)
+
+        if mb:
+            self.mb = int(mb)
+        else:
+            self.mb = 1
+
+    def _get_number(self, name, num_type=float):
+        '''
+        Returns the (first) number stored in a header field.
         
+        Arguments:
+            name (string): Field name
+            num_type (type): Type to cast the value to (e.g. int or float)
+            
+        Returns:
+            value (int, float or string): Field value, 'unknown' if the field is not in the header
+        '''
+        match = re.search(r'[0-9.-]+', self.fields.get(name, ""))
+        if match:
+            return num_type(float(match.group()))
+        return 'unknown'
+
+@lru_cache(maxsize=512)
+def _read_par_header(par_file, mtime):
+    '''
+    Reads (and memoizes) the general information block of a PAR header. The modification time is part of
+    the cache key so that files that are re-written on disk are read again.
+
+    Arguments:
+        par_file (string): Absolute filepath to PAR header file
+        mtime (int): Modification time (in ns) of the PAR file
+
     Returns:
-        etl (float): Echo Train Length
+        par_hdr (ParHeader): Parsed PAR header
     '''
-    regexp = re.compile(r'.    EPI factor        <0,1=no EPI>     :   .*?([0-9.-]+)')  # Search string for RegEx
+    return ParHeader(par_file)
+
+def read_par_header(par_file):
+    '''
+    Reads the general information block of a PAR header once and returns the parsed header object. Headers
+    are memoized keyed by the file path and modification time, so the PAR helper functions share a single read
+    of each file. If a header object is passed instead of a filename, it is returned as is.
+
+    Arguments:
+        par_file (string or ParHeader): Absolute filepath to PAR header file, or a previously parsed header
+
+    Returns:
+        par_hdr (ParHeader): Parsed PAR header
+    '''
+
+    if isinstance(par_file, ParHeader):
+        return par_file
+
+    par_file = os.path.abspath(par_file)
+    mtime = os.stat(par_file).st_mtime_ns
+
+    return _read_par_header(par_file, mtime)
+
+# Image definition table columns (PAR V4.2) as (name, type, number of columns). PAR V4 files end after
+# 'inversion_delay', PAR V4.1 files end after 'diffusion'.
+PAR_IMAGE_DEFS = [('slice', int, 1),
+                  ('echo', int, 1),
+                  ('dynamic', int, 1),
+                  ('phase', int, 1),
+                  ('image_type', int, 1),
+                  ('sequence', int, 1),
+                  ('rec_index', int, 1),
+                  ('pixel_bits', int, 1),
+                  ('scan_percentage', int, 1),
+                  ('recon_resolution', int, 2),
+                  ('rescale_intercept', float, 1),
+                  ('rescale_slope', float, 1),
+                  ('scale_slope', float, 1),
+                  ('window_center', int, 1),
+                  ('window_width', int, 1),
+                  ('angulation', float, 3),
+                  ('offcentre', float, 3),
+                  ('slice_thickness', float, 1),
+                  ('slice_gap', float, 1),
+                  ('display_orientation', int, 1),
+                  ('slice_orientation', int, 1),
+                  ('fmri_status', int, 1),
+                  ('image_type_ed_es', int, 1),
+                  ('pixel_spacing', float, 2),
+                  ('echo_time', float, 1),
+                  ('dyn_scan_begin_time', float, 1),
+                  ('trigger_time', float, 1),
+                  ('b_value', float, 1),
+                  ('averages', int, 1),
+                  ('flip_angle', float, 1),
+                  ('cardiac_frequency', int, 1),
+                  ('min_rr_interval', int, 1),
+                  ('max_rr_interval', int, 1),
+                  ('turbo_factor', int, 1),
+                  ('inversion_delay', float, 1),
+                  ('b_value_number', int, 1),
+                  ('gradient_number', int, 1),
+                  ('contrast_type', int, 1),
+                  ('anisotropy_type', int, 1),
+                  ('diffusion', float, 3),
+                  ('label_type', int, 1)]
+
+@lru_cache(maxsize=32)
+def _read_par_image_table(par_file, mtime):
+    '''
+    Reads (and memoizes) the image definition table of a PAR header. The modification time is part of
+    the cache key so that files that are re-written on disk are read again.
+
+    Arguments:
+        par_file (string): Absolute filepath to PAR header file
+        mtime (int): Modification time (in ns) of the PAR file
+
+    Returns:
+        image_defs (numpy structured array): One record per image in the REC file
+    '''
+
+    import numpy as np
+
+    # Collect the image table lines
+    lines = list()
+    in_table = False
     with open(par_file) as f:
         for line in f:
-            match = regexp.match(line)
-            if match:
-                etl = match.group(1)
-                etl = int(etl)
-    return etl
+            if line.startswith('# === IMAGE INFORMATION ==='):
+                in_table = True
+                continue
+            if in_table:
+                if line.startswith('# === END'):
+                    break
+                if line.strip() and not line.startswith('#'):
+                    lines.append(line)
+
+    # Parse all of the lines in one (vectorized) pass
+    if lines:
+        table = np.loadtxt(lines, dtype=np.float64, ndmin=2)
+    else:
+        table = np.empty((0, sum(n for _, _, n in PAR_IMAGE_DEFS)))
+
+    # Keep the columns present in this PAR version
+    image_defs = list()
+    num_cols = 0
+    for name, type_, n in PAR_IMAGE_DEFS:
+        if num_cols + n > table.shape[1]:
+            break
+        image_defs.append((name, type_, n, num_cols))
+        num_cols = num_cols + n
+
+    dtype = [(name, type_, (n,)) if n > 1 else (name, type_) for name, type_, n, _ in image_defs]
+    image_table = np.empty(table.shape[0], dtype=dtype)
+    for name, type_, n, col in image_defs:
+        if n > 1:
+            image_table[name] = table[:, col:col + n]
+        else:
+            image_table[name] = table[:, col]
+
+    return image_table
+
+def read_par_image_table(par_file):
+    '''
+    Reads the image definition table of a PAR header (one line per image in the REC file) into a NumPy structured
+    array in a single vectorized pass. Field names are those listed in PAR_IMAGE_DEFS (e.g. 'slice', 'dynamic',
+    'echo_time', 'b_value', 'diffusion', 'scale_slope'). Tables are memoized keyed by the file path and modification time.
+
+    Arguments:
+        par_file (string): Absolute filepath to PAR header file
+
+    Returns:
+        image_defs (numpy structured array): One record per image in the REC file
+    '''
+
+    par_file = os.path.abspath(par_file)
+    mtime = os.stat(par_file).st_mtime_ns
+
+    return _read_par_image_table(par_file, mtime)
+
+def get_par_image_info(par_file):
+    '''
+    Derives acquisition structure from the PAR image definition table: the number of dynamics, the unique echo times,
+    the unique non-zero b-values, the slice ordering (slice numbers in the order they are stored in the REC file 
+    for the first volume), the image types, and the number of volumes (of the first image type and echo, i.e. of
+    one converted image).
+
+    Arguments:
+        par_file (string): Absolute filepath to PAR header file
+
+    Returns:
+        info (dict): Dictionary with the keys 'num_dynamics' (int), 'echo_times' (list of floats, in ms), 'bvals' (list
+            of floats), 'slice_order' (list of ints), 'image_types' (list of ints) and 'num_volumes' (int)
+    '''
+
+    import numpy as np
+
+    image_defs = read_par_image_table(par_file)
+
+    num_dynamics = int(np.unique(image_defs['dynamic']).size)
+    echo_times = np.unique(image_defs['echo_time']).tolist()
+
+    if 'b_value' in image_defs.dtype.names:
+        bvals = image_defs['b_value']
+        bvals = np.unique(bvals[bvals != 0]).tolist()
+    else:
+        bvals = list()
+
+    # Slices of the first volume, in REC file order
+    if image_defs.size:
+        first = image_defs[np.argsort(image_defs['rec_index'], kind='stable')]
+        num_slices = np.unique(first['slice']).size
+        slice_order = first['slice'][:num_slices].tolist()
+        image_types = np.unique(image_defs['image_type']).tolist()
+        num_volumes = int(np.count_nonzero((image_defs['slice'] == image_defs['slice'][0]) & 
+                                           (image_defs['image_type'] == image_defs['image_type'][0]) & 
+                                           (image_defs['echo'] == image_defs['echo'][0])))
+    else:
+        slice_order = list()
+        image_types = list()
+        num_volumes = 0
+
+    info = {"num_dynamics": num_dynamics,
+            "echo_times": echo_times,
+            "bvals": bvals,
+            "slice_order": slice_order,
+            "image_types": image_types,
+            "num_volumes": num_volumes}
+
+    return info
+
+def get_etl(par_file):
+    '''
+    Gets EPI factor (Echo Train Length) from Philips' PAR Header.
+    
+    Arguments:
+        par_file (string): Absolute filepath to PAR header file
+        
+    Returns:
+        etl (int or string): Echo Train Length, 'unknown' if not in header
+    '''
+    return read_par_header(par_file).etl
 
 def get_wfs(par_file):
     '''
     Gets Water Fat Shift from Philips' PAR Header.
     
-    N.B.: This is done via a regEx search as the PAR header is not assumed to change significantly between scanners.
-    
     Arguments:
         par_file (string): Absolute filepath to PAR header file
         
     Returns:
-        wfs (float): Water Fat Shift
+        wfs (float or string): Water Fat Shift, 'unknown' if not in header
     '''
-    regexp = re.compile(
-        r'.    Water Fat shift \[pixels\]           :   .*?([0-9.-]+)')  # Search string for RegEx, escape the []
-    with open(par_file) as f:
-        for line in f:
-            match = regexp.match(line)
-            if match:
-                wfs = match.group(1)
-                wfs = float(wfs)
-    return wfs
+    return read_par_header(par_file).wfs
 
 def get_red_fact(par_file):
     '''
@@ -61,85 +346,255 @@ def get_red_fact(par_file):
     for Philips MR scanners. This reduction factor is assumed to be 1 if a value cannot be found from witin
     the PAR REC header.
     
-    N.B.: This is done via a regEx search as the PAR header is not assumed to change significantly between scanners.
-    
     Arguments:
         par_file (string): Absolute filepath to PAR header file
         
     Returns:
         red_fact (float): parallel reduction factor in-plane value (e.g. SENSE factor)
     '''
-    
-    # Read file
-    red_fact = ""
-    regexp = re.compile(r' SENSE *?([0-9.-]+)')
-    with open(par_file) as f:
-        for line in f:
-            match = regexp.search(line)
-            if match:
-                red_fact = match.group(1)
-                red_fact = float(red_fact)
-            else:
-                red_fact = float(1)
-
-    return red_fact
+    return read_par_header(par_file).red_fact
 
 def get_mb(par_file):
     '''
     Extracts multi-band acceleration factor from from Philips' PAR Header.
     
-    N.B.: This is done via a regEx search as the PAR header does not normally store this value.
-    
     Arguments:
         par_file (string): Absolute filepath to PAR header file
         
     Returns:
         mb (int): multi-band acceleration factor
     '''
-
-    # Initialize mb to 1
-    mb = 1
-    
-    regexp = re.compile(r' MB *?([0-9.-]+)')
-    with open(par_file) as f:
-        for line in f:
-            match = regexp.search(line)
-            if match:
-                mb = match.group(1)
-                mb = int(mb)
-
-    return mb
+    return read_par_header(par_file).mb
 
 def get_scan_time(par_file):
     '''
     Gets the acquisition duration (scan time, in s) from the PAR header.
     
-    N.B.: This is done via a regEx search as the PAR header is not assumed to change significantly between scanners.
-    
     Arguments:
         par_file (string): Absolute filepath to PAR header file
         
     Returns:
         scan_time (float or string): Acquisition duration (scan time, in s). If not in header, return is a string 'unknown'
     '''
+    return read_par_header(par_file).scan_time
+
+# Output file name suffixes of PAR REC image types (magnitude, real, imaginary, phase)
+PAR_TYPE_SUFFIXES = {0: "", 1: "_real", 2: "_imaginary", 3: "_ph"}
+
+def get_rec_file(par_file):
+    '''
+    Finds the REC (image data) file of a PAR header file.
     
-    scan_time = 'unknown'
+    Arguments:
+        par_file (string): Absolute filepath to PAR header file
+        
+    Returns:
+        rec_file (string): Absolute filepath to REC file, empty if not found
+    '''
+
+    [path, filename, ext] = utils.file_parts(par_file)
+
+    for rec_ext in ['.REC', '.rec']:
+        rec_file = os.path.join(path, filename + rec_ext)
+        if os.path.exists(rec_file):
+            return rec_file
+
+    return ""
+
+def par_sidecar(hdr):
+    '''
+    Creates a BIDS sidecar dictionary from a PAR header, with the acquisition parameters dcm2niix writes for PAR REC data.
     
-    regexp = re.compile(
-        r'.    Scan Duration \[sec\]                :   .*?([0-9.-]+)')  # Search string for RegEx, escape the []
+    Arguments:
+        hdr (nibabel PARRECHeader): PAR header
+        
+    Returns:
+        info (dict): Sidecar dictionary
+    '''
+
+    import numpy as np
+    import nibabel as nib
+
+    general = hdr.general_info
+    image_defs = hdr.image_defs
+
+    info = {"Modality": "MR",
+            "Manufacturer": "Philips",
+            "ProtocolName": general['protocol_name'],
+            "SeriesDescription": general['protocol_name'],
+            "ScanningSequence": general['tech'],
+            "SliceThickness": float(image_defs['slice thickness'][0]),
+            "RepetitionTime": float(np.atleast_1d(general['repetition_time'])[0]) / 1000.0,
+            "EchoTime": float(image_defs['echo_time'][0]) / 1000.0,
+            "FlipAngle": float(image_defs['image_flip_angle'][0]),
+            "WaterFatShift": float(general['water_fat_shift']),
+            "EchoTrainLength": int(general['epi_factor']),
+            "PhilipsRescaleSlope": float(image_defs['rescale slope'][0]),
+            "PhilipsRescaleIntercept": float(image_defs['rescale intercept'][0]),
+            "PhilipsScaleSlope": float(image_defs['scale slope'][0]),
+            "ConversionSoftware": "nibabel",
+            "ConversionSoftwareVersion": nib.__version__}
+
+    return info
+
+def par_to_nii(par_file, basename, out_dir, cprss_lvl=6):
+    '''
+    Converts PAR REC data to (gzipped) NifTi in process, without loading the whole REC file. The REC file is memory-mapped,
+    the slices are sorted with the PAR image definition table (as parsed by nibabel), and the image is written one volume 
+    at a time. Images with one scale factor are stored unscaled, with the scale factor in the NifTi header. Otherwise, 
+    the per-slice (display value) scale factors are applied to each volume, and the image is stored as float32. As with 
+    nibabel's parrec2nii, images are reoriented to LAS+ and DTI trace volumes are discarded. Images with several image 
+    types (e.g. B0 maps) are split by image type, as with dcm2niix (e.g. the real image gets the '_real' suffix). A JSON 
+    sidecar (see 'par_sidecar') is written for each image.
+    
+    N.B.: The NifTi images are streamed into gzip, unless the 'parallel' gzip engine is selected (see 'utils.set_conversion_opts'),
+    in which case they are written uncompressed and then gzipped with 'utils.pgzip_file'.
+    
+    Arguments:
+        par_file (string): Absolute filepath to PAR header file
+        basename (string): Output file(s) basename
+        out_dir (string): Absolute path to output directory (must exist at runtime)
+        cprss_lvl (int): Compression level [1 - 9] - 1 is fastest, 9 is smallest (default: 6)
+        
+    Returns:
+        nii_files (list): Output NifTi images
+        bvals (array or None): b-values of the (kept) volumes, None if not a diffusion acquisition
+        bvecs (array or None): Gradient directions (in the output image orientation), None if not a diffusion acquisition
+    '''
+
+    import numpy as np
+    import nibabel as nib
+    from nibabel.orientations import io_orientation, inv_ornt_aff, apply_orientation
+
     with open(par_file) as f:
-        for line in f:
-            match = regexp.match(line)
-            if match:
-                scan_time = match.group(1)
-                scan_time = float(scan_time)
+        hdr = nib.parrec.PARRECHeader.from_fileobj(f, permit_truncated=True, strict_sort=True)
+
+    rec_file = get_rec_file(par_file)
+    if not rec_file:
+        raise FileNotFoundError(f"REC file not found for: {par_file}")
+
+    # REC images, shape (x, y, images), in REC file order
+    rec = np.memmap(rec_file, dtype=hdr.get_data_dtype(), mode='r', shape=hdr.get_rec_shape(), order='F')
+
+    shape = hdr.get_data_shape()
+    num_slices = shape[2]
+    num_vols = shape[3] if len(shape) > 3 else 1
+    indices = np.asarray(hdr.get_sorted_slice_indices()).reshape((num_vols, num_slices))
+
+    # Scale factors, per (sorted) slice
+    image_defs = hdr.image_defs
+    slopes = image_defs['rescale slope'][indices]
+    inters = image_defs['rescale intercept'][indices]
+
+    # Reorient to LAS+
+    affine = hdr.get_affine()
+    ornt = io_orientation(np.diag([-1, 1, 1, 1]).dot(affine))
+    affine = np.dot(affine, inv_ornt_aff(ornt, shape[:3]))
+
+    # Reoriented (volume) shape and voxel sizes
+    zooms = hdr.get_zooms()
+    out_shape = [0, 0, 0]
+    out_zooms = [0, 0, 0]
+    for in_ax, (out_ax, flip) in enumerate(ornt):
+        out_shape[int(out_ax)] = shape[in_ax]
+        out_zooms[int(out_ax)] = zooms[in_ax]
+
+    # Discard DTI trace volumes
+    vols = np.ones(num_vols, dtype=bool)
+    [bvals, bvecs] = hdr.get_bvals_bvecs()
+    if bvecs is not None:
+        vols = np.logical_not(np.logical_and(bvals != 0, (bvecs == 0).all(axis=1)))
+        bvecs = np.dot(bvecs, np.linalg.inv(inv_ornt_aff(ornt, shape[:3]))[:3, :3].T)
+        bvals = bvals[vols]
+        bvecs = bvecs[vols]
+
+    # Image types of the volumes
+    vol_types = hdr.get_volume_labels().get('image_type_mr')
+    if vol_types is None:
+        vol_types = np.zeros(num_vols, dtype=int)
+    vol_types = np.asarray(vol_types)
+
+    info = par_sidecar(hdr)
+    pgzip = utils.CONVERSION_OPTS['gzip_engine'] == 'parallel'
+    nii_files = list()
+
+    for type_ in np.unique(vol_types):
+        type_vols = np.flatnonzero(np.logical_and(vols, vol_types == type_))
+        image = basename + PAR_TYPE_SUFFIXES.get(int(type_), f"_t{int(type_)}")
+
+        single_scale = len(np.unique(slopes[type_vols])) == 1 and len(np.unique(inters[type_vols])) == 1
+        if single_scale:
+            dtype = hdr.get_data_dtype()
+        else:
+            dtype = np.dtype('<f4')
+
+        nii_hdr = nib.Nifti1Header()
+        nii_hdr.set_data_dtype(dtype)
+        if len(type_vols) > 1:
+            nii_hdr.set_data_shape(out_shape + [len(type_vols)])
+            nii_hdr.set_zooms(out_zooms + [zooms[3]])
+        else:
+            nii_hdr.set_data_shape(out_shape)
+            nii_hdr.set_zooms(out_zooms)
+        nii_hdr.set_xyzt_units('mm', 'sec')
+        nii_hdr.set_sform(affine, code=1)
+        nii_hdr.set_qform(affine, code=1)
+        nii_hdr.set_data_offset(352)
+        if single_scale:
+            nii_hdr.set_slope_inter(float(slopes[type_vols[0], 0]), float(inters[type_vols[0], 0]))
+
+        nii_file = os.path.join(out_dir, image + '.nii')
+        if pgzip:
+            f = open(nii_file, 'wb')
+        else:
+            nii_file = nii_file + '.gz'
+            f = gzip.open(nii_file, 'wb', compresslevel=cprss_lvl)
+
+        with f:
+            nii_hdr.write_to(f)
+            f.write(b'\x00' * (352 - f.tell()))
+            for vol in type_vols:
+                data = rec[..., indices[vol]]
+                if not single_scale:
+                    data = data * slopes[vol].astype(np.float32) + inters[vol].astype(np.float32)
+                data = apply_orientation(data, ornt)
+                f.write(data.astype(dtype, copy=False).tobytes(order='F'))
+
+        if pgzip:
+            nii_file = utils.pgzip_file(nii_file, cprss_lvl=cprss_lvl, threads=utils.CONVERSION_OPTS['gzip_threads'])
+
+        with open(os.path.join(out_dir, image + '.json'), 'w') as json_file:
+            json.dump(info, json_file, indent=4)
+
+        nii_files.append(nii_file)
+
+    return nii_files, bvals, bvecs
+
+def find_par_scan_tech(par_file, search_dict):
+    '''
+    Searches the scan technique of a PAR header with the search terms provided by the nested dictionary.
+
+    Arguments:
+        par_file (string): PAR filename with absolute filepath
+        search_dict (dict): Nested dictionary from the 'read_config' function
+
+    Returns:
+        hit (tuple or None): Tuple of (scan_type, scan, task), None if no search term matches
+        par_scan_tech_str (string): Scan technique read from the PAR header
+    '''
+
+    # Read scan technique from the PAR header
+    par_scan_tech_str = read_par_header(par_file).technique
+    
+    # Search Scan Technique with search terms
+    hit = utils.search_modality(search_dict, par_scan_tech_str)
 
-    return scan_time
+    return hit, par_scan_tech_str
 
 def get_par_scan_tech(bids_out_dir, sub, par_file, search_dict, meta_dict={}, ses=1, keep_unknown=True, verbose=False):
     '''
     Searches PAR file header for scan technique/MR modality used in accordance with the search terms provided by the
-    nested dictionary. A regular expression (regEx) search string is defined and searched for conventional PAR headers.
+    nested dictionary. The scan technique is read from the (parsed) PAR header.
     
     Note: This function is still undergoing active development.
 
@@ -154,74 +609,29 @@ def get_par_scan_tech(bids_out_dir, sub, par_file, search_dict, meta_dict={}, se
         verbose (bool): Prints the scan_type, modality, and search terms used (e.g. func - bold - rest - ['rest', 'FFE'])
     
     Returns: 
-        None
+        converted_files (tuple): Converted (BIDS named) files
     '''
 
+    import convert_source_nii as csn
+
     if not meta_dict:
         meta_dict = dict()
+
+    converted_files = list()
     
-    mod_found = False
-    
-    # Define regEx search string
-    regexp = re.compile(r'.    Technique                          :  .*', re.M | re.I)
-    
-    # Open and search PAR header file
-    with open(par_file) as f:
-        for line in f:
-            match_ = regexp.match(line)
-            if match_:
-                par_scan_tech_str = match_.group()
+    [hit, par_scan_tech_str] = find_par_scan_tech(par_file, search_dict)
     
-    # Search Scan Technique with search terms
-    for key,item in search_dict.items():
-        for dict_key,dict_item in search_dict[key].items():
-            if isinstance(dict_item,list):
-                if utils.list_in_substr(dict_item,par_scan_tech_str):
-                    mod_found = True
-                    if verbose:
-                        print(f"{key} - {dict_key}: {dict_item}")
-                    scan_type = key
-                    scan = dict_key
-                    [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type)
-                    if scan_type.lower() == 'dwi':
-                        csn.data_to_bids_dwi(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_dwi=scan_param_dict,ses=ses,scan_type=scan_type)
-                    elif scan_type.lower() == 'fmap':
-                        csn.data_to_bids_fmap(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_fmap=scan_param_dict,ses=ses,scan_type=scan_type)
-                    else:
-                        csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_anat=scan_param_dict,ses=ses,scan_type=scan_type)
-                    if mod_found:
-                        break
-            elif isinstance(dict_item,dict):
-                tmp_dict = search_dict[key]
-                for d_key,d_item in tmp_dict[dict_key].items():
-                    if utils.list_in_substr(d_item,par_scan_tech_str):
-                        mod_found = True
-                        if verbose:
-                            print(f"{key} - {dict_key} - {d_key}: {d_item}")
-                        scan_type = key
-                        scan = dict_key
-                        task = d_key
-                        [com_param_dict, scan_param_dict] = utils.get_metadata(dictionary=meta_dict,scan_type=scan_type,task=task)
-                        if scan_type.lower() == 'func':
-                            csn.data_to_bids_func(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan=scan,task=task,meta_dict_com=com_param_dict,meta_dict_func=scan_param_dict,ses=ses,scan_type=scan_type)
-                        elif scan_type.lower() == 'dwi':
-                            csn.data_to_bids_dwi(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_dwi=scan_param_dict,ses=ses,scan_type=scan_type)
-                        elif scan_type.lower() == 'fmap':
-                            csn.data_to_bids_fmap(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_fmap=scan_param_dict,ses=ses,scan_type=scan_type)
-                        else:
-                            csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan=scan,meta_dict_com=com_param_dict,meta_dict_anat=scan_param_dict,ses=ses,scan_type=scan_type)
-                        if mod_found:
-                            break
-                            
-        if mod_found:
-            break
-            
-    if not mod_found:
+    if hit:
+        [scan_type, scan, task] = hit
+        if verbose:
+            print(f"{scan_type} - {scan} - {task}: {par_scan_tech_str}")
+        converted_files = csn.data_to_bids(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan_type=scan_type,scan=scan,task=task,meta_dict=meta_dict,ses=ses)
+    else:
         if verbose:
             print("unknown modality")
         if keep_unknown:
             scan_type = 'unknown_modality'
             scan = 'unknown'
-            csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan=scan,meta_dict_com={},meta_dict_anat={},ses=ses,scan_type=scan_type)
+            converted_files = csn.data_to_bids_anat(bids_out_dir=bids_out_dir,file=par_file,sub=sub,scan=scan,meta_dict_com={},meta_dict_anat={},ses=ses,scan_type=scan_type)
         
-    return None
+    return converted_files
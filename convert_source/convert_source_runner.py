@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+'''
+Asynchronous runner of dcm2niix (or other converter) processes for convert_source. Jobs are launched up to a
+concurrency limit, their output is captured per job, hung jobs are killed after a wall-clock timeout, and
+transient failures are retried.
+'''
+
+# Import packages and modules
+import os
+import signal
+import asyncio
+import time
+from collections import namedtuple
+
+# Define functions
+
+# Result of a job:
+#   cmd (list): Command that was run
+#   status (int): Exit status of the last attempt (negative if killed by a signal, e.g. on timeout)
+#   stdout (string): Captured standard output (of the last attempt)
+#   stderr (string): Captured standard error (of the last attempt)
+#   elapsed (float): Wall-clock time (in seconds) of all attempts
+#   attempts (int): Number of attempts
+#   timed_out (bool): True if the last attempt was killed after the timeout
+RunResult = namedtuple('RunResult', ['cmd', 'status', 'stdout', 'stderr', 'elapsed', 'attempts', 'timed_out'])
+
+# dcm2niix exit statuses of failures that may succeed when retried:
+# output folder not writable (7), and rename error (9)
+DCM2NIIX_TRANSIENT = {7, 9}
+
+def is_transient(status):
+    '''
+    Determines whether a failed job may succeed when retried: dcm2niix statuses in DCM2NIIX_TRANSIENT, and processes
+    killed by a signal (e.g. by the out-of-memory killer). Timeouts are not transient, as a series that hangs
+    (e.g. corrupt data) usually hangs again.
+
+    Arguments:
+        status (int): Exit status
+
+    Returns:
+        transient (bool): True if the job may be retried
+    '''
+
+    return status in DCM2NIIX_TRANSIENT or status < 0
+
+async def _read_stream(stream, lines, on_line=None):
+    '''
+    Reads a process output stream line by line until it is closed.
+
+    Arguments:
+        stream (asyncio.StreamReader): Output stream
+        lines (list): List that the (decoded) lines are appended to
+        on_line (function): Called with each line as it is read (optional)
+
+    Returns:
+        None
+    '''
+
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        line = line.decode(errors='replace')
+        lines.append(line)
+        if on_line:
+            on_line(line)
+
+    return None
+
+class Dcm2niixRunner(object):
+    '''
+    Runs converter (dcm2niix) jobs with asyncio. At most 'max_jobs' jobs run at the same time. Each job is
+    killed (with its process group, e.g. pigz) if it runs for longer than 'timeout' seconds, and is retried up to
+    'retries' times, with exponential backoff, if it fails with a transient status (see 'is_transient').
+
+    Usage:
+        runner = Dcm2niixRunner(max_jobs=4, timeout=600)
+        results = runner.run_many([cmd_1, cmd_2])       # blocking
+
+        # or, in a coroutine, to overlap jobs with other work:
+        job = runner.submit(cmd)
+        ...
+        result = await job
+
+    Attributes:
+        max_jobs (int): Maximum number of concurrent jobs
+        timeout (float): Wall-clock timeout (in seconds) of each attempt, no timeout if 0
+        retries (int): Maximum number of retries of transient failures
+        retry_delay (float): Delay (in seconds) before the first retry, doubled for each further retry
+        on_output (function): Called with (cmd, stream name, line) for each line of output as it is read (optional)
+    '''
+
+    def __init__(self, max_jobs=0, timeout=0, retries=0, retry_delay=1.0, on_output=None):
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.on_output = on_output
+        self._semaphores = dict()
+
+    def _semaphore(self):
+        '''
+        Returns the semaphore of the running event loop (asyncio primitives are bound to a loop).
+        '''
+
+        loop = asyncio.get_running_loop()
+        if not loop in self._semaphores:
+            self._semaphores = {loop: asyncio.Semaphore(self.max_jobs)}
+
+        return self._semaphores[loop]
+
+    async def _run_once(self, cmd):
+        '''
+        Runs a command once, with the timeout.
+
+        Arguments:
+            cmd (list): Command (executable and arguments)
+
+        Returns:
+            status (int): Exit status
+            stdout (string): Captured standard output
+            stderr (string): Captured standard error
+            timed_out (bool): True if the process was killed after the timeout
+        '''
+
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=True)
+
+        stdout = list()
+        stderr = list()
+        if self.on_output:
+            on_stdout = lambda line: self.on_output(cmd, 'stdout', line)
+            on_stderr = lambda line: self.on_output(cmd, 'stderr', line)
+        else:
+            on_stdout = None
+            on_stderr = None
+
+        job = asyncio.gather(_read_stream(proc.stdout, stdout, on_stdout), _read_stream(proc.stderr, stderr, on_stderr), proc.wait())
+        timed_out = False
+
+        try:
+            await asyncio.wait_for(job, self.timeout or None)
+        except asyncio.TimeoutError:
+            timed_out = True
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+
+        return proc.returncode, "".join(stdout), "".join(stderr), timed_out
+
+    async def run(self, cmd):
+        '''
+        Runs a job (waiting for a free slot if 'max_jobs' jobs are running), and retries transient failures.
+
+        Arguments:
+            cmd (list): Command (executable and arguments)
+
+        Returns:
+            result (RunResult): Result of the job
+        '''
+
+        cmd = [str(arg) for arg in cmd]
+        start = time.perf_counter()
+        attempts = 0
+
+        async with self._semaphore():
+            while True:
+                attempts = attempts + 1
+                try:
+                    [status, stdout, stderr, timed_out] = await self._run_once(cmd)
+                except (BlockingIOError, MemoryError) as err:
+                    # The process could not be started (e.g. process or memory limits)
+                    if attempts > self.retries:
+                        raise
+                    [status, stdout, stderr, timed_out] = [-1, "", str(err), False]
+                if status == 0 or timed_out or not is_transient(status) or attempts > self.retries:
+                    break
+                await asyncio.sleep(self.retry_delay * 2**(attempts - 1))
+
+        return RunResult(cmd=cmd, status=status, stdout=stdout, stderr=stderr, elapsed=time.perf_counter() - start,
+                         attempts=attempts, timed_out=timed_out)
+
+    def submit(self, cmd):
+        '''
+        Schedules a job on the running event loop.
+
+        Arguments:
+            cmd (list): Command (executable and arguments)
+
+        Returns:
+            job (asyncio.Task): Awaitable, resolves to the result of the job (RunResult)
+        '''
+
+        return asyncio.ensure_future(self.run(cmd))
+
+    def run_many(self, cmds):
+        '''
+        Runs jobs (at most 'max_jobs' at a time) and waits for all of them. Must not be called from a coroutine.
+
+        Arguments:
+            cmds (list): List of commands
+
+        Returns:
+            results (list): List of results (RunResult), in the same order as 'cmds'
+        '''
+
+        async def run_all():
+            return await asyncio.gather(*[self.submit(cmd) for cmd in cmds])
+
+        return asyncio.run(run_all())
+
+def run_command(cmd, timeout=0, retries=0, on_output=None):
+    '''
+    Runs a single job and waits for it (see 'Dcm2niixRunner'). Must not be called from a coroutine.
+
+    Arguments:
+        cmd (list): Command (executable and arguments)
+        timeout (float): Wall-clock timeout (in seconds) of each attempt, no timeout if 0
+        retries (int): Maximum number of retries of transient failures
+        on_output (function): Called with (cmd, stream name, line) for each line of output as it is read (optional)
+
+    Returns:
+        result (RunResult): Result of the job
+    '''
+
+    return Dcm2niixRunner(max_jobs=1, timeout=timeout, retries=retries, on_output=on_output).run_many([cmd])[0]
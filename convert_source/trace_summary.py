@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#
+# -*- coding: utf-8 -*-
+# title           : trace_summary.py
+# description     : Summarizes a timing trace of convert_source.py (see the '--trace' option)
+# usage           : trace_summary.py [-h,--help] trace.jsonl
+# python_version  : 3.7.4
+#==============================================================================
+
+# Import packages and modules
+import sys
+import argparse
+
+# Import third party packages and modules
+import utils
+
+# Define functions
+
+def print_summary(summary, key="stage"):
+    '''
+    Prints a trace summary (see 'utils.summarize_trace') as a table.
+
+    Arguments:
+        summary (list): Trace summary
+        key (string): Field the summary is grouped by (column title)
+
+    Returns:
+        None
+    '''
+
+    width = max([len(key)] + [len(str(group["name"])) for group in summary])
+
+    print(f"{key:<{width}}  {'count':>7}  {'total (s)':>10}  {'mean (s)':>10}  {'max (s)':>10}  {'MB':>10}  {'errors':>6}")
+    for group in summary:
+        print(f"{str(group['name']):<{width}}  {group['count']:>7}  {group['total']:>10.3f}  {group['mean']:>10.4f}  "
+              f"{group['max']:>10.3f}  {group['bytes'] / 1024**2:>10.1f}  {group['errors']:>6}")
+
+    return None
+
+if __name__ == "__main__":
+
+    # Argument parser
+    parser = argparse.ArgumentParser(description="Prints the stages (or series) of a convert_source.py timing trace (see '--trace') with the most total time. "
+                                                 "N.B.: Stages nest (e.g. 'convert_image_data' is part of 'convert_modality'), so their totals overlap.")
+
+    parser.add_argument('trace',
+                        type=str,
+                        metavar="trace.jsonl",
+                        help="Trace file written by convert_source.py --trace.")
+    parser.add_argument('-n', '--top',
+                        type=int,
+                        dest="top",
+                        metavar="N",
+                        default=10,
+                        help="Number of stages (or series) to print, all if 0. [default: 10]")
+    parser.add_argument('-series', '--series',
+                        dest="series",
+                        default=False,
+                        action="store_true",
+                        help="Group by series (source file) instead of by stage. [default: False]")
+
+    args = parser.parse_args()
+
+    key = "series" if args.series else "stage"
+    records = utils.read_trace(args.trace)
+
+    if not records:
+        sys.exit(f"No trace records in {args.trace}")
+
+    print_summary(utils.summarize_trace(records, key=key, top=args.top), key=key)
@@ -6,19 +6,264 @@ Utility functions for convert_source.
 # Import packages and modules
 import json
 import os
+import re
 import shutil
 import glob
-import subprocess
+import sys
 import gzip
-import numpy as np
-import platform
+import zlib
+import time
+import struct
+import hashlib
+from collections import deque
+from functools import lru_cache
 
-# Import third party packages and modules
-import convert_source_dcm as cdm
-import convert_source_par as csp
+# N.B.: utils is imported by all convert_source modules, so it does not import them (or numpy, nibabel, and
+# pydicom) at module level: they are imported by the functions that use them, which keeps the CLI startup fast.
 
 # Define functions
 
+# Conversion options shared by the conversion functions of this process (see 'set_conversion_opts')
+CONVERSION_OPTS = {"gzip_engine": "zlib",
+                   "gzip_threads": 0,
+                   "link_strategy": "copy",
+                   "cache_dir": "",
+                   "cache_size": 0,
+                   "backends": {},
+                   "trace_file": "",
+                   "dcm2niix_timeout": 0,
+                   "dcm2niix_retries": 0,
+                   "dcm2niix_stream": False}
+
+# Valid choices of the conversion options that have a fixed set of choices
+CONVERSION_OPT_CHOICES = {"gzip_engine": ["zlib", "parallel"],
+                          "link_strategy": ["copy", "hardlink", "reflink", "symlink"]}
+
+def set_conversion_opts(**kwargs):
+    '''
+    Sets conversion options for the current process. These are typically set once from the command line options
+    and passed on to worker processes (see 'get_conversion_opts'). Available options:
+    
+        gzip_engine (string): Engine used to gzip NifTi files: 'zlib' (default, single-threaded) or 'parallel' (multi-threaded).
+            With 'parallel', dcm2niix writes uncompressed NifTi files which are then gzipped by 'pgzip_file'.
+        gzip_threads (int): Number of threads of the 'parallel' gzip engine, the number of CPUs if 0 (default)
+        link_strategy (string): How existing NifTi images are placed in the BIDS directory (see 'link_file'): 
+            'copy' (default), 'hardlink', 'reflink', or 'symlink'
+        cache_dir (string): Directory of the cache of dcm2niix outputs (see 'convert_image_data'), no cache if empty (default)
+        cache_size (int): Maximum size (in bytes) of the cache, the least recently used entries are evicted. Unbounded if 0 (default).
+        backends (dict): Converter backend names (see 'convert_source_backend'), keyed by source data type ('DCM', 'PAR') 
+            or 'default'. dcm2niix is used for source data types without a backend (default).
+        trace_file (string): JSON lines file that timing spans are appended to (see 'trace_span'), no tracing if empty (default)
+        dcm2niix_timeout (float): Wall-clock timeout (in seconds) of dcm2niix for each series, after which dcm2niix is killed 
+            (see 'convert_image_data'). No timeout if 0 (default).
+        dcm2niix_retries (int): Number of times dcm2niix is retried after a transient failure (see 'convert_source_runner.is_transient'), 
+            0 by default
+        dcm2niix_stream (bool): Prints the output of dcm2niix line by line as it is written, each line prefixed with the name 
+            of the source file of the series, instead of once dcm2niix exits (see 'convert_image_data'). False by default.
+    
+    Arguments:
+        **kwargs (key,value pairs): Option names and values
+        
+    Returns:
+        None
+    '''
+    
+    for key,item in kwargs.items():
+        if not key in CONVERSION_OPTS:
+            raise KeyError(f"Unknown conversion option: {key}")
+        if key in CONVERSION_OPT_CHOICES and not item in CONVERSION_OPT_CHOICES[key]:
+            raise ValueError(f"Invalid value for conversion option {key}: {item}. Valid options are: {CONVERSION_OPT_CHOICES[key]}")
+        CONVERSION_OPTS[key] = item
+        
+    return None
+
+def get_conversion_opts():
+    '''
+    Returns (a copy of) the conversion options of the current process (see 'set_conversion_opts').
+    
+    Arguments:
+        None
+        
+    Returns:
+        opts (dict): Conversion options
+    '''
+    
+    return dict(CONVERSION_OPTS)
+
+# Series (source file) traced by the current process (see 'set_trace_series')
+TRACE_SERIES = {"file": ""}
+
+# File descriptors of the trace file, keyed by (trace file, process ID)
+_TRACE_FDS = dict()
+
+class TraceSpan(object):
+    '''
+    Timing span of a conversion stage (see 'trace_span'). On exit, a JSON line with the stage, series, file, 
+    start time (UNIX time, in s), duration (in s), bytes processed, process ID, and whether the stage raised an 
+    exception, is appended to the trace file. The number of bytes can be set in the 'with' block.
+    '''
+
+    __slots__ = ("stage", "file", "bytes", "start", "_t0")
+
+    def __init__(self, stage, file="", nbytes=0):
+        self.stage = stage
+        self.file = file
+        self.bytes = nbytes
+
+    def __enter__(self):
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._t0
+        record = {"stage": self.stage,
+                  "series": TRACE_SERIES['file'],
+                  "file": str(self.file),
+                  "start": round(self.start, 6),
+                  "duration": round(duration, 6),
+                  "bytes": int(self.bytes),
+                  "pid": os.getpid(),
+                  "error": exc_type is not None}
+        _write_trace(record)
+        return False
+
+class _NullSpan(object):
+    '''
+    Span that records nothing, used when tracing is disabled. Evaluates to False, so that the bytes of a span 
+    are only computed when tracing.
+    '''
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __bool__(self):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+def trace_span(stage, file="", nbytes=0):
+    '''
+    Returns a context manager that times a conversion stage, and appends it to the trace file (see 'set_conversion_opts').
+    If tracing is disabled, a shared span that records nothing is returned.
+    
+    Usage:
+        with trace_span('convert_image_data', file) as span:
+            ...
+            if span:
+                span.bytes = os.path.getsize(file)
+    
+    Arguments:
+        stage (string): Stage name
+        file (string): File processed by the stage
+        nbytes (int): Number of bytes processed by the stage
+        
+    Returns:
+        span (TraceSpan or _NullSpan): Span
+    '''
+
+    if not CONVERSION_OPTS['trace_file']:
+        return NULL_SPAN
+
+    return TraceSpan(stage, file, nbytes)
+
+def set_trace_series(file=""):
+    '''
+    Sets the series (source file) that subsequent spans of the current process are attributed to (see 'trace_span').
+    
+    Arguments:
+        file (string): Source file of the series, empty outside of a series
+        
+    Returns:
+        None
+    '''
+
+    TRACE_SERIES['file'] = file
+
+    return None
+
+def _write_trace(record):
+    '''
+    Appends a record to the trace file as a JSON line. Each record is written with a single (appending) write,
+    so that the records of concurrent worker processes are not interleaved.
+    
+    Arguments:
+        record (dict): Trace record
+        
+    Returns:
+        None
+    '''
+
+    trace_file = CONVERSION_OPTS['trace_file']
+    key = (trace_file, os.getpid())
+
+    if not key in _TRACE_FDS:
+        _TRACE_FDS[key] = os.open(trace_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    os.write(_TRACE_FDS[key], (json.dumps(record) + "\n").encode())
+
+    return None
+
+def read_trace(trace_file):
+    '''
+    Reads the records of a trace file (see 'trace_span').
+    
+    Arguments:
+        trace_file (string): Trace (JSON lines) file
+        
+    Returns:
+        records (list): List of trace records (dictionaries)
+    '''
+
+    records = list()
+
+    with open(trace_file) as file:
+        for line in file:
+            if line.strip():
+                records.append(json.loads(line))
+
+    return records
+
+def summarize_trace(records, key="stage", top=10):
+    '''
+    Summarizes trace records by stage (or series), sorted by total time. 
+    
+    N.B.: Spans nest (e.g. 'convert_image_data' is part of 'convert_modality'), so the totals of different 
+    stages overlap.
+    
+    Arguments:
+        records (list): Trace records (see 'read_trace')
+        key (string): Record field to group by: 'stage' (default) or 'series'
+        top (int): Number of groups returned, all if 0
+        
+    Returns:
+        summary (list): List of dictionaries with the keys: name, count, total, mean, max, bytes, and errors
+    '''
+
+    groups = dict()
+
+    for record in records:
+        group = groups.setdefault(record.get(key, ""), {"name": record.get(key, ""), "count": 0, "total": 0.0, "max": 0.0, "bytes": 0, "errors": 0})
+        group["count"] = group["count"] + 1
+        group["total"] = group["total"] + record["duration"]
+        group["max"] = max(group["max"], record["duration"])
+        group["bytes"] = group["bytes"] + record.get("bytes", 0)
+        group["errors"] = group["errors"] + int(bool(record.get("error")))
+
+    summary = sorted(groups.values(), key=lambda group: group["total"], reverse=True)
+    for group in summary:
+        group["mean"] = group["total"] / group["count"]
+
+    if top:
+        summary = summary[:top]
+
+    return summary
+
 def file_to_screen(file):
     '''
     Reads the contents of a file and prints it to screen.
@@ -80,94 +325,1001 @@ def get_num_runs(out_dir,scan,ses="",task="",acq="",ce="",dirs="",rec="",echo=""
     run_num = len(glob.glob(runs))
     run_num = run_num + 1
 
-    return run_num
+    return run_num
+
+# Name of the convert_source state database (SQLite) written to the root of the BIDS output directory
+STATE_DB = '.convert_source.db'
+
+# Name of the DICOM header index file (see 'convert_source_dcm.index_dcm_dir') in the root of the BIDS output directory
+DCM_INDEX = '.convert_source_dcm_index.json'
+
+# BIDS entities (in naming order) used to key run numbers, mapped to the keyword arguments of 'reserve_run'
+RUN_ENTITIES = [('task', 'task'), ('acq', 'acq'), ('ce', 'ce'), ('dir', 'dirs'), ('rec', 'rec'), ('echo', 'echo')]
+
+def connect_state_db(bids_out_dir):
+    '''
+    Opens (and creates if necessary) the convert_source state database in the root of the BIDS output directory.
+    The connection is in autocommit mode so that transactions can be explicitly started (e.g. 'BEGIN IMMEDIATE')
+    to serialize access between processes.
+
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory
+
+    Returns:
+        conn (sqlite3 Connection): Database connection
+    '''
+    
+    import sqlite3
+
+    os.makedirs(bids_out_dir, exist_ok=True)
+    db_file = os.path.join(os.path.abspath(bids_out_dir), STATE_DB)
+
+    conn = sqlite3.connect(db_file, timeout=300, isolation_level=None)
+    conn.execute("CREATE TABLE IF NOT EXISTS run_dirs (out_dir TEXT PRIMARY KEY)")
+    conn.execute("CREATE TABLE IF NOT EXISTS runs (out_dir TEXT, run_key TEXT, run INTEGER, PRIMARY KEY (out_dir, run_key))")
+    conn.execute("CREATE TABLE IF NOT EXISTS free_runs (source TEXT, out_dir TEXT, run_key TEXT, run INTEGER, PRIMARY KEY (out_dir, run_key, run))")
+    conn.execute("CREATE TABLE IF NOT EXISTS series (source TEXT, sub TEXT, ses TEXT, size INTEGER, mtime INTEGER, config_hash TEXT, outputs TEXT, PRIMARY KEY (source, sub, ses))")
+
+    return conn
+
+def run_key(scan, task="", acq="", ce="", dirs="", rec="", echo=""):
+    '''
+    Creates the key used to allocate run numbers: the BIDS entities (other than sub, ses and run) and the suffix (scan).
+
+    Arguments:
+        scan (string): Modality/suffix (e.g. T1w, T2w, bold, dwi, etc.)
+        task (string): Task ID
+        acq (string): Acquisition ID
+        ce (string): Contrast Enhanced ID
+        dirs (string): Directions ID string
+        rec (string): Reconstruction algorithm string
+        echo (int or string): Echo number from multi-echo functional scan
+
+    Returns:
+        key (string): Run key (e.g. 'task-rest_dir-PA_bold')
+    '''
+
+    values = dict(task=task, acq=acq, ce=ce, dirs=dirs, rec=rec, echo=echo)
+    parts = [f"{entity}-{values[arg]}" for entity, arg in RUN_ENTITIES if values[arg]]
+    parts.append(f"{scan}")
+
+    return "_".join(parts)
+
+def parse_run_name(file):
+    '''
+    Parses a BIDS NifTi filename into its run key (see 'run_key') and run number.
+
+    Arguments:
+        file (string): BIDS NifTi filename (e.g. sub-001_ses-001_task-rest_run-02_bold.nii.gz)
+
+    Returns:
+        key (string): Run key, empty if the filename is not a BIDS NifTi filename
+        run (int): Run number, 1 if the filename has no run entity
+    '''
+
+    [path, filename, ext] = file_parts(file)
+
+    if not '.nii' in ext:
+        return "", 1
+
+    parts = filename.split('_')
+    scan = parts[-1]
+    entities = dict()
+    for part in parts[:-1]:
+        if '-' in part:
+            [entity, value] = part.split('-', 1)
+            entities[entity] = value
+
+    if not 'sub' in entities:
+        return "", 1
+
+    try:
+        run = int(entities.get('run', 1))
+    except ValueError:
+        run = 1
+
+    kwargs = {arg: entities.get(entity, "") for entity, arg in RUN_ENTITIES}
+    key = run_key(scan, **kwargs)
+
+    return key, run
+
+def session_dir(bids_out_dir, sub, ses):
+    '''
+    Creates the (absolute) output directory of a subject session, with the subject and session IDs zero padded 
+    as in 'convert_source_nii.locate_series'.
+
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory
+        sub (int or string): Subject ID
+        ses (int or string): Session ID
+
+    Returns:
+        ses_dir (string): Absolute path to the session directory
+    '''
+
+    ids = list()
+    for id_ in [sub, ses]:
+        try:
+            id_ = '{:03}'.format(int(id_))
+        except ValueError:
+            pass
+        ids.append(id_)
+
+    ses_dir = os.path.join(os.path.abspath(bids_out_dir), f"sub-{ids[0]}", f"ses-{ids[1]}")
+
+    return ses_dir
+
+def init_run_index(bids_out_dir, sessions=None, sources=list()):
+    '''
+    Resets the run number index of the output directories of subject sessions, so that each output directory is 
+    scanned again the next time a run number is reserved in it, and forgets the released run numbers (see 
+    'release_runs') in them and of the given source files. Only the sessions of a conversion are reset, as other 
+    processes may convert other subjects into the same BIDS directory at the same time. This should be invoked 
+    once at the start of a conversion.
+
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory
+        sessions (list): List of (subject ID, session ID) tuples. If None, the whole index is reset.
+        sources (list): Source image filenames of the conversion
+
+    Returns:
+        None
+    '''
+
+    conn = connect_state_db(bids_out_dir)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if sessions is None:
+            conn.execute("DELETE FROM runs")
+            conn.execute("DELETE FROM run_dirs")
+            conn.execute("DELETE FROM free_runs")
+        else:
+            # Output directories in (or of) the session directories, compared by prefix (not LIKE, as paths may contain '_' and '%')
+            for ses_dir in sorted(set(session_dir(bids_out_dir, sub, ses) for sub, ses in sessions)):
+                args = (ses_dir, len(ses_dir) + 1, ses_dir + os.sep)
+                for table in ['runs', 'run_dirs', 'free_runs']:
+                    conn.execute(f"DELETE FROM {table} WHERE out_dir = ? OR substr(out_dir, 1, ?) = ?", args)
+            conn.executemany("DELETE FROM free_runs WHERE source = ?", [(os.path.abspath(file),) for file in sources])
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    return None
+
+def release_runs(bids_out_dir, file, outputs):
+    '''
+    Releases the run numbers of the previous outputs of a series that is converted again (after its previous 
+    outputs are removed), so that the series is given the same run numbers (see 'reserve_run'). Released run 
+    numbers are not given to other series.
+
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory
+        file (string): Source image filename with absolute filepath
+        outputs (list): List of the (BIDS named) output files of the previous conversion of the series
+
+    Returns:
+        None
+    '''
+
+    file = os.path.abspath(file)
+    rows = list()
+    for out in outputs:
+        [key, run] = parse_run_name(out)
+        if key:
+            rows.append((file, os.path.dirname(os.path.abspath(out)), key, run))
+
+    if not rows:
+        return None
+
+    conn = connect_state_db(bids_out_dir)
+    try:
+        conn.executemany("INSERT OR REPLACE INTO free_runs (source, out_dir, run_key, run) VALUES (?, ?, ?, ?)", rows)
+    finally:
+        conn.close()
+
+    return None
+
+def reserve_run(bids_out_dir, out_dir, scan, ses="", task="", acq="", ce="", dirs="", rec="", echo="", source=""):
+    '''
+    Reserves the next run number of a scan (e.g. T1w, T2w, bold, dwi etc.) in an output directory. Unlike 
+    'get_num_runs', the output directory is only listed the first time a run number is reserved in it (the 
+    highest existing run number of each key is then kept in an index), and run numbers are counted per exact 
+    combination of BIDS entities and suffix. Reservations are atomic across processes, as the index is kept in
+    a SQLite database (see 'connect_state_db') and updated in a single (exclusive) transaction.
+    
+    A series that is converted again is given the run number of its previous outputs (if released, see 
+    'release_runs'), so that the run numbers of the other series do not change.
+
+    Arguments (required):
+        bids_out_dir (string): Path to output BIDS directory
+        out_dir (string): Absolute path to output directory
+        scan (string): Modality (e.g. T1w, T2w, bold, dwi, etc.)
+
+    Arguments (optional):
+        ses (string): Session ID (unused, the session is part of the output directory)
+        task (string): Task ID
+        acq (string): Acquisition ID
+        ce (string): Contrast Enhanced ID
+        dirs (string): Directions ID string
+        rec (string): Reconstruction algorithm string
+        echo (int or string): Echo number from multi-echo functional scan
+        source (string): Source image filename of the series, used to look up its released run numbers
+
+    Returns:
+        run_num (int): Returns the run number for the specific scan
+    '''
+
+    out_dir = os.path.abspath(out_dir)
+    key = run_key(scan, task=task, acq=acq, ce=ce, dirs=dirs, rec=rec, echo=echo)
+    source = os.path.abspath(source) if source else ""
+
+    conn = connect_state_db(bids_out_dir)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+
+        # Index existing runs the first time this directory is used
+        if conn.execute("SELECT 1 FROM run_dirs WHERE out_dir = ?", (out_dir,)).fetchone() is None:
+            runs = dict()
+            if os.path.isdir(out_dir):
+                for file in os.listdir(out_dir):
+                    [file_key, file_run] = parse_run_name(file)
+                    if file_key:
+                        runs[file_key] = max(runs.get(file_key, 0), file_run)
+            conn.executemany("INSERT OR REPLACE INTO runs (out_dir, run_key, run) VALUES (?, ?, ?)", [(out_dir, k, r) for k, r in runs.items()])
+            conn.execute("INSERT INTO run_dirs (out_dir) VALUES (?)", (out_dir,))
+
+        row = conn.execute("SELECT run FROM runs WHERE out_dir = ? AND run_key = ?", (out_dir, key)).fetchone()
+        last_run = 0 if row is None else row[0]
+
+        # Reuse a run number released by this series, or take the next one after the existing and released runs
+        free = conn.execute("SELECT run FROM free_runs WHERE source = ? AND out_dir = ? AND run_key = ? ORDER BY run", (source, out_dir, key)).fetchone()
+        if free is not None:
+            run_num = free[0]
+            conn.execute("DELETE FROM free_runs WHERE out_dir = ? AND run_key = ? AND run = ?", (out_dir, key, run_num))
+        else:
+            [last_free] = conn.execute("SELECT MAX(run) FROM free_runs WHERE out_dir = ? AND run_key = ?", (out_dir, key)).fetchone()
+            run_num = max(last_run, last_free or 0) + 1
+
+        conn.execute("INSERT OR REPLACE INTO runs (out_dir, run_key, run) VALUES (?, ?, ?)", (out_dir, key, max(last_run, run_num)))
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    return run_num
+
+class RunPlan(object):
+    '''
+    In-memory counterpart of 'reserve_run', used to plan a conversion (see the '--plan' option of convert_source.py)
+    without writing to the state database. Run numbers are allocated in the same way: each output directory is listed
+    the first time a run number is planned in it, and run numbers are then counted per run key (see 'run_key').
+    
+    Attributes:
+        runs (dict): Highest run number of each (output directory, run key) pair
+        exclude (set): Absolute filepaths of existing files that are not counted (e.g. the previous outputs of series 
+            that would be converted again, as they are removed first)
+        free_runs (dict): Released run numbers (see 'release'), keyed by (output directory, run key), as lists of 
+            (run number, source image filename) tuples
+    '''
+
+    def __init__(self, exclude=list()):
+        '''
+        Creates an empty run plan.
+        
+        Arguments:
+            exclude (list): Existing files that are not counted when output directories are listed
+        '''
+
+        self.runs = dict()
+        self.exclude = set(os.path.abspath(file) for file in exclude)
+        self.free_runs = dict()
+        self._dirs = set()
+
+    def release(self, file, outputs):
+        '''
+        Plans the release of the run numbers of the previous outputs of a series (see 'release_runs'). The previous 
+        outputs are still counted, as they are only replaced once the series has been converted again.
+
+        Arguments:
+            file (string): Source image filename with absolute filepath
+            outputs (list): List of the (BIDS named) output files of the previous conversion of the series
+
+        Returns:
+            None
+        '''
+
+        file = os.path.abspath(file)
+        for out in outputs:
+            out = os.path.abspath(out)
+            [key, run] = parse_run_name(out)
+            if key:
+                self.free_runs.setdefault((os.path.dirname(out), key), list()).append((run, file))
+
+        return None
+
+    def reserve(self, out_dir, scan, ses="", task="", acq="", ce="", dirs="", rec="", echo="", source=""):
+        '''
+        Plans the next run number of a scan in an output directory.
+
+        Arguments:
+            out_dir (string): Absolute path to output directory
+            scan (string): Modality (e.g. T1w, T2w, bold, dwi, etc.)
+            ses (string): Session ID (unused, the session is part of the output directory)
+            task (string): Task ID
+            acq (string): Acquisition ID
+            ce (string): Contrast Enhanced ID
+            dirs (string): Directions ID string
+            rec (string): Reconstruction algorithm string
+            echo (int or string): Echo number from multi-echo functional scan
+            source (string): Source image filename of the series, used to look up its released run numbers
+
+        Returns:
+            run_num (int): Run number for the specific scan
+        '''
+
+        out_dir = os.path.abspath(out_dir)
+        key = run_key(scan, task=task, acq=acq, ce=ce, dirs=dirs, rec=rec, echo=echo)
+
+        # Index existing runs the first time this directory is used
+        if not out_dir in self._dirs:
+            self._dirs.add(out_dir)
+            if os.path.isdir(out_dir):
+                for file in os.listdir(out_dir):
+                    if os.path.join(out_dir, file) in self.exclude:
+                        continue
+                    [file_key, file_run] = parse_run_name(file)
+                    if file_key:
+                        self.runs[(out_dir, file_key)] = max(self.runs.get((out_dir, file_key), 0), file_run)
+
+        last_run = self.runs.get((out_dir, key), 0)
+        free = sorted(self.free_runs.get((out_dir, key), list()))
+        mine = [run for run, file in free if source and file == os.path.abspath(source)]
+
+        if mine:
+            run_num = mine[0]
+            self.free_runs[(out_dir, key)].remove((run_num, os.path.abspath(source)))
+        else:
+            run_num = max([last_run] + [run for run, _ in free]) + 1
+        self.runs[(out_dir, key)] = max(last_run, run_num)
+
+        return run_num
+
+def source_files(file):
+    '''
+    Lists the source data files of a series. The source data of a DICOM file are the files of its series in its 
+    directory (see 'convert_source_dcm.get_series_files'), that of a PAR file is the PAR and REC file pair, and that
+    of a NifTi file is the image and its JSON, bval and bvec files.
+    
+    Arguments:
+        file (string): Source image filename with absolute filepath
+        
+    Returns:
+        files (list): Sorted list of the (existing) source data files
+    '''
+    
+    import convert_source_dcm as cdm
+    
+    [path, filename, ext] = file_parts(file)
+    
+    if is_dcm_file(file):
+        files = cdm.get_series_files(file)
+    elif ext.upper() == '.PAR':
+        files = [file] + [os.path.join(path, filename + rec) for rec in ['.REC', '.rec']]
+    else:
+        files = [file] + [os.path.join(path, filename + sidecar) for sidecar in ['.json', '.bval', '.bvec']]
+    
+    files = sorted(set(f for f in files if os.path.isfile(f)))
+    
+    return files
+
+def link_series(file, link_root):
+    '''
+    Links the source data files of a DICOM series (see 'source_files') into a new directory, which dcm2niix is 
+    given instead of the DICOM file. dcm2niix converts all series of a directory, so that it then converts the 
+    series, and only the series, whatever else the directory of the DICOM file contains (e.g. the other series 
+    of a flat PACS export). Files are symlinked, else hard linked, else copied.
+    
+    Arguments:
+        file (string): DICOM file with absolute filepath
+        link_root (string): Absolute path to the directory the new directory is created in
+        
+    Returns:
+        link_dir (string): Absolute path to the new directory, which the caller removes
+    '''
+    
+    import tempfile
+    
+    [path, filename, ext] = file_parts(file)
+    link_dir = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}_{filename}_", dir=link_root)
+    
+    for src in source_files(file):
+        dst = os.path.join(link_dir, os.path.basename(src))
+        try:
+            os.symlink(src, dst)
+        except OSError:
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+    
+    return link_dir
+
+def source_signature(file):
+    '''
+    Computes the signature (total size and latest modification time) of the source data of a series (see 
+    'source_files'), which is used to detect changed series (see 'series_state').
+    
+    Arguments:
+        file (string): Source image filename with absolute filepath
+        
+    Returns:
+        size (int): Total size (in bytes) of the source data
+        mtime (int): Latest modification time (in ns) of the source data
+    '''
+    
+    size = 0
+    mtime = 0
+    for f in source_files(file):
+        st = os.stat(f)
+        size = size + st.st_size
+        mtime = max(mtime, st.st_mtime_ns)
+    
+    return size, mtime
+
+def config_hash(*args, **kwargs):
+    '''
+    Computes a hash of the configuration of a conversion (e.g. the search and metadata dictionaries, and the 
+    conversion options), so that series are converted again if the configuration changes.
+    
+    Arguments:
+        *args: JSON serializable configuration objects
+        **kwargs (key,value pairs): JSON serializable configuration options
+        
+    Returns:
+        digest (string): SHA1 hex digest
+    '''
+    
+    data = json.dumps([args, kwargs], sort_keys=True, default=str)
+    digest = hashlib.sha1(data.encode()).hexdigest()
+    
+    return digest
+
+def in_dir(file, dir_):
+    '''
+    Checks whether a file is inside a directory (tree).
+    
+    Arguments:
+        file (string): Filepath
+        dir_ (string): Directory path
+        
+    Returns:
+        inside (boolean): True if the file is inside the directory
+    '''
+    
+    file = os.path.abspath(file)
+    dir_ = os.path.abspath(dir_)
+    
+    return file != dir_ and os.path.commonpath([file, dir_]) == dir_
+
+def remove_outputs(bids_out_dir, outputs):
+    '''
+    Removes (previous) output files of a series. Files outside the BIDS output directory are never removed.
+    
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory
+        outputs (list): List of output files
+        
+    Returns:
+        None
+    '''
+    
+    for out in outputs:
+        if not in_dir(out, bids_out_dir):
+            print(f"Not removing {out}: outside of the BIDS output directory {bids_out_dir}", file=sys.stderr)
+        elif os.path.exists(out):
+            os.remove(out)
+    
+    return None
+
+def series_state(bids_out_dir, file, sub, ses, cfg_hash=""):
+    '''
+    Looks up the conversion state of a series in the state database (see 'connect_state_db'). A series is 
+    current if it was converted before with the same configuration, its source data have not changed since 
+    (see 'source_signature'), and all its outputs still exist. Outputs are recorded relative to the BIDS output
+    directory (see 'record_series'), so that a copied or moved BIDS directory refers to its own outputs. Outputs
+    recorded as absolute paths (by earlier versions) are relocated to the BIDS output directory by their 'sub-*' 
+    directory, other recorded outputs outside the BIDS output directory are ignored (and the series is then not 
+    current).
+    
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory
+        file (string): Source image filename with absolute filepath
+        sub (int or string): Subject ID
+        ses (int or string): Session ID
+        cfg_hash (string): Configuration hash (see 'config_hash')
+        
+    Returns:
+        current (boolean): True if the series is current, and need not be converted again
+        outputs (list): List of the (BIDS named) output files of the previous conversion (in the BIDS output directory), 
+            empty if there was none
+    '''
+    
+    file = os.path.abspath(file)
+    bids_out_dir = os.path.abspath(bids_out_dir)
+    
+    conn = connect_state_db(bids_out_dir)
+    try:
+        row = conn.execute("SELECT size, mtime, config_hash, outputs FROM series WHERE source = ? AND sub = ? AND ses = ?", (file, str(sub), str(ses))).fetchone()
+    finally:
+        conn.close()
+    
+    if row is None:
+        return False, list()
+    
+    [size, mtime, prev_hash, outputs] = row
+    recorded = list()
+    for out in json.loads(outputs):
+        if os.path.isabs(out) and not in_dir(out, bids_out_dir):
+            parts = out.split(os.sep)
+            subs = [i for i, part in enumerate(parts[:-1]) if part.startswith('sub-')]
+            if subs:
+                out = os.path.join(*parts[subs[-1]:])
+        recorded.append(os.path.normpath(os.path.join(bids_out_dir, out)))
+    outputs = [out for out in recorded if in_dir(out, bids_out_dir)]
+    
+    current = (prev_hash == cfg_hash and 
+               (size, mtime) == source_signature(file) and 
+               len(outputs) > 0 and 
+               len(outputs) == len(recorded) and 
+               all(os.path.exists(out) for out in outputs))
+    
+    return current, outputs
+
+def record_series(bids_out_dir, file, sub, ses, outputs, cfg_hash=""):
+    '''
+    Records the outputs of a converted series (relative to the BIDS output directory), and the signature of its 
+    source data, in the state database (see 'series_state').
+    
+    Arguments:
+        bids_out_dir (string): Path to output BIDS directory
+        file (string): Source image filename with absolute filepath
+        sub (int or string): Subject ID
+        ses (int or string): Session ID
+        outputs (list): List of the (BIDS named) output files
+        cfg_hash (string): Configuration hash (see 'config_hash')
+        
+    Returns:
+        None
+    '''
+    
+    file = os.path.abspath(file)
+    [size, mtime] = source_signature(file)
+    outputs = json.dumps([os.path.relpath(os.path.abspath(out), os.path.abspath(bids_out_dir)) for out in outputs])
+    
+    conn = connect_state_db(bids_out_dir)
+    try:
+        conn.execute("INSERT OR REPLACE INTO series (source, sub, ses, size, mtime, config_hash, outputs) VALUES (?, ?, ?, ?, ?, ?, ?)", 
+                     (file, str(sub), str(ses), size, mtime, cfg_hash, outputs))
+    finally:
+        conn.close()
+    
+    return None
+
+# Ordered commit gate, used when series are converted in parallel worker processes (see 'batch_convert'
+# in convert_source.py). Both are None in serial mode, in which case the gate functions do nothing.
+_commit_gate = None
+_commit_task = None
+
+def init_commit_gate(condition, done):
+    '''
+    Initializes the ordered commit gate in a worker process. The gate ensures that converted series are named 
+    (and thus allocated run numbers) in the same order as they would be in serial mode.
+    
+    Arguments:
+        condition (multiprocessing Condition): Condition shared between all worker processes
+        done (multiprocessing Array): Shared array of flags (one per series) that are set once a series has finished
+        
+    Returns:
+        None
+    '''
+    
+    global _commit_gate
+    _commit_gate = (condition, done)
+    
+    return None
+
+def set_commit_task(index, group_start=0):
+    '''
+    Sets the series (task) handled by the current worker process for the ordered commit gate.
+    
+    Arguments:
+        index (int): Index of the series in the shared array of flags
+        group_start (int): Index of the first series of the same group (e.g. subject session). Only series of 
+            the same group are committed in order.
+        
+    Returns:
+        None
+    '''
+    
+    global _commit_task
+    _commit_task = (index, group_start)
+    
+    return None
+
+def wait_commit_turn():
+    '''
+    Blocks until every earlier series of the same group has finished, so that run numbers are determined in 
+    exactly the same order as in serial mode. This function should be invoked just before a run number is 
+    determined, and does nothing in serial mode.
+    
+    Arguments:
+        None
+        
+    Returns:
+        None
+    '''
+    
+    if _commit_gate is None or _commit_task is None:
+        return None
+    
+    [condition, done] = _commit_gate
+    [index, group_start] = _commit_task
+    
+    with condition:
+        condition.wait_for(lambda: all(done[group_start:index]))
+        
+    return None
+
+def release_commit_turn():
+    '''
+    Marks the series handled by the current worker process as finished and wakes up any worker process waiting
+    for its turn. Does nothing in serial mode.
+    
+    Arguments:
+        None
+        
+    Returns:
+        None
+    '''
+    
+    global _commit_task
+    
+    if _commit_gate is None or _commit_task is None:
+        return None
+    
+    [condition, done] = _commit_gate
+    [index, group_start] = _commit_task
+    
+    with condition:
+        done[index] = 1
+        condition.notify_all()
+        
+    _commit_task = None
+    
+    return None
+
+def file_parts(file):
+    '''
+    Divides file with file path into: path, filename, extension.
+    
+    Arguments:
+        file (string): File with absolute filepath
+        
+    Returns: 
+        path (string): Path of input file
+        filename (string): Filename of input file, without the extension
+        ext (string): Extension of input file
+    '''
+    
+    [path, file_with_ext] = os.path.split(file)
+    
+    # Make condition for gzipped files
+    if '.gz' in file_with_ext:
+        file_with_ext = file_with_ext[:-3]
+        [filename,ext] = os.path.splitext(file_with_ext)
+        ext = ext + '.gz'
+    else:
+        [filename,ext] = os.path.splitext(file_with_ext)
+    
+    path = str(path)
+    filename = str(filename)
+    ext = str(ext)
+    
+    return path,filename,ext
+
+@lru_cache(maxsize=4096)
+def is_dcm_file(file):
+    '''
+    Determines whether a file is a DICOM file: either it has a '.dcm' extension, or it has the 'DICM' prefix 
+    that follows the 128 byte preamble of (part 10) DICOM files. The latter are the files that are indexed as 
+    DICOM files (see 'convert_source_dcm.index_dcm_dir'), which are often extensionless (e.g. flat PACS exports).
+    
+    Arguments:
+        file (string): File with absolute filepath
+        
+    Returns: 
+        is_dcm (bool): True if the file is a DICOM file
+    '''
+    
+    [path, filename, ext] = file_parts(file)
+    
+    if ext.lower() == '.dcm':
+        return True
+    elif ext.upper() == '.PAR' or '.nii' in ext.lower():
+        return False
+    
+    try:
+        with open(file, 'rb') as f:
+            f.seek(128)
+            return f.read(4) == b'DICM'
+    except OSError:
+        return False
+
+# Default buffer size (bytes) used when streaming files through (de)compression
+GZIP_BUFFER_SIZE = 4 * 1024 * 1024
+
+def _copy_stream(in_file, out_file, buffer_size=GZIP_BUFFER_SIZE):
+    '''
+    Copies a (file) stream to another in chunks of a fixed size, so that memory use is constant.
+    
+    Arguments:
+        in_file (file object): Input stream (opened for reading in binary mode)
+        out_file (file object): Output stream (opened for writing in binary mode)
+        buffer_size (int): Chunk size in bytes
+        
+    Returns: 
+        num_bytes (int): Number of bytes copied
+    '''
+    
+    num_bytes = 0
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    
+    while True:
+        n = in_file.readinto(buffer)
+        if not n:
+            break
+        out_file.write(view[:n])
+        num_bytes = num_bytes + n
+        
+    return num_bytes
+
+def gzip_file(file,rm_orig=True,cprss_lvl=6,buffer_size=GZIP_BUFFER_SIZE,return_stats=False):
+    '''
+    Gzips file. The file is compressed as a stream (in chunks of 'buffer_size' bytes) to a temporary file, which
+    is then atomically renamed to the output file.
+    
+    Arguments:
+        file (string): Input file
+        rm_orig (boolean): If true (default), removes original file
+        cprss_lvl (int): Compression level [1 - 9] - 1 is fastest, 9 is smallest (default: 6)
+        buffer_size (int): Size (in bytes) of the chunks read from the input file (default: 4 MB)
+        return_stats (boolean): If true, the number of bytes read and written are also returned (default: False)
+        
+    Returns: 
+        out_file (string): Gzipped file
+        bytes_in (int, if return_stats): Number of (uncompressed) bytes read
+        bytes_out (int, if return_stats): Number of (compressed) bytes written
+    '''
+    
+    # Define output and temporary file
+    path,f_name_,ext_ = file_parts(file)
+    f_name = f_name_ + ext_ + ".gz"
+    out_file = os.path.join(path,f_name)
+    tmp_file = out_file + ".tmp"
+    
+    # Gzip file
+    try:
+        with open(file,"rb") as in_file, open(tmp_file,"wb") as tmp_out:
+            with gzip.GzipFile(filename=f_name_ + ext_,mode="wb",compresslevel=cprss_lvl,fileobj=tmp_out) as gz_out:
+                bytes_in = _copy_stream(in_file,gz_out,buffer_size)
+        bytes_out = os.path.getsize(tmp_file)
+        os.replace(tmp_file,out_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+            
+    if rm_orig:
+        os.remove(file)
+    
+    if return_stats:
+        return out_file, bytes_in, bytes_out
+            
+    return out_file
+
+def gunzip_file(file,rm_orig=True,buffer_size=GZIP_BUFFER_SIZE,return_stats=False):
+    '''
+    Gunzips file. The file is decompressed as a stream (in chunks of 'buffer_size' bytes) to a temporary file, which
+    is then atomically renamed to the output file.
+    
+    Arguments:
+        file (string): Input file
+        rm_orig (boolean): If true (default), removes original file
+        buffer_size (int): Size (in bytes) of the chunks read from the decompressed stream (default: 4 MB)
+        return_stats (boolean): If true, the number of bytes read and written are also returned (default: False)
+        
+    Returns: 
+        out_file (string): Gunzipped file
+        bytes_in (int, if return_stats): Number of (compressed) bytes read
+        bytes_out (int, if return_stats): Number of (uncompressed) bytes written
+    '''
+    
+    # Define output and temporary file
+    path,f_name_,ext_ = file_parts(file)
+    f_name = f_name_ + ext_[:-3]
+    out_file = os.path.join(path,f_name)
+    tmp_file = out_file + ".tmp"
+    
+    try:
+        with gzip.GzipFile(file,"rb") as in_file, open(tmp_file,"wb") as tmp_out:
+            bytes_out = _copy_stream(in_file,tmp_out,buffer_size)
+        bytes_in = os.path.getsize(file)
+        os.replace(tmp_file,out_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+            
+    if rm_orig:
+        os.remove(file)
+    
+    if return_stats:
+        return out_file, bytes_in, bytes_out
+    
+    return out_file
+
+# Block size (bytes) of the independently compressed blocks of the parallel gzip writer
+PGZIP_BLOCK_SIZE = 1024 * 1024
 
-def file_parts(file):
+# Size (bytes) of the deflate window, the tail of each block primes the compression of the next block
+DEFLATE_WINDOW = 32 * 1024
+
+def _deflate_block(data, cprss_lvl=6, zdict=b"", last=False):
     '''
-    Divides file with file path into: path, filename, extension.
+    Compresses a block of data into a raw deflate stream that can be concatenated with the (compressed) 
+    blocks before and after it. Non-final blocks end with a sync flush (byte aligned, not marked final), 
+    the final block ends the deflate stream.
     
     Arguments:
-        file (string): File with absolute filepath
+        data (bytes): Block of uncompressed data
+        cprss_lvl (int): Compression level [1 - 9]
+        zdict (bytes): Preset dictionary (the end of the previous block), empty for the first block
+        last (boolean): If true, the block is the final block of the stream
         
     Returns: 
-        path (string): Path of input file
-        filename (string): Filename of input file, without the extension
-        ext (string): Extension of input file
+        cdata (bytes): Compressed (raw deflate) data
     '''
     
-    [path, file_with_ext] = os.path.split(file)
-    
-    # Make condition for gzipped files
-    if '.gz' in file_with_ext:
-        file_with_ext = file_with_ext[:-3]
-        [filename,ext] = os.path.splitext(file_with_ext)
-        ext = ext + '.gz'
+    if zdict:
+        compressor = zlib.compressobj(cprss_lvl, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
     else:
-        [filename,ext] = os.path.splitext(file_with_ext)
-    
-    path = str(path)
-    filename = str(filename)
-    ext = str(ext)
+        compressor = zlib.compressobj(cprss_lvl, zlib.DEFLATED, -zlib.MAX_WBITS)
+        
+    cdata = compressor.compress(data)
     
-    return path,filename,ext
+    if last:
+        cdata = cdata + compressor.flush(zlib.Z_FINISH)
+    else:
+        cdata = cdata + compressor.flush(zlib.Z_SYNC_FLUSH)
+        
+    return cdata
 
-def gzip_file(file,rm_orig=True):
+def pgzip_file(file,rm_orig=True,cprss_lvl=6,threads=0,block_size=PGZIP_BLOCK_SIZE,return_stats=False):
     '''
-    Gzips file.
+    Gzips file using multiple threads (in the manner of pigz). The file is read in blocks that are compressed 
+    independently (each primed with the last 32 KB of the previous block) on a thread pool, and the compressed 
+    blocks are written in order as a single, standard, gzip member, which can be read by gzip, zlib, and nibabel.
+    At most two blocks per thread are held in memory. The output is written to a temporary file, which is then
+    atomically renamed to the output file.
     
     Arguments:
         file (string): Input file
         rm_orig (boolean): If true (default), removes original file
+        cprss_lvl (int): Compression level [1 - 9] - 1 is fastest, 9 is smallest (default: 6)
+        threads (int): Number of compression threads. If 0 (default), the number of CPUs is used.
+        block_size (int): Size (in bytes) of the independently compressed blocks (default: 1 MB)
+        return_stats (boolean): If true, the number of bytes read and written are also returned (default: False)
         
     Returns: 
         out_file (string): Gzipped file
+        bytes_in (int, if return_stats): Number of (uncompressed) bytes read
+        bytes_out (int, if return_stats): Number of (compressed) bytes written
     '''
     
-    # Define tempory file for I/O buffer stream
-    tmp_file = file
-    path,f_name_,ext_ = file_parts(tmp_file)
+    from concurrent.futures import ThreadPoolExecutor
+    
+    if not threads:
+        threads = os.cpu_count() or 1
+    
+    # Define output and temporary file
+    path,f_name_,ext_ = file_parts(file)
     f_name = f_name_ + ext_ + ".gz"
     out_file = os.path.join(path,f_name)
+    tmp_file = out_file + ".tmp"
     
-    # Gzip file
-    with open(file,"rb") as in_file:
-        data = in_file.read(); in_file.close()
-        with gzip.GzipFile(out_file,"wb") as tmp_out:
-            tmp_out.write(data)
-            tmp_out.close()
+    crc = 0
+    bytes_in = 0
+    pending = deque()
+    
+    try:
+        with open(file,"rb") as in_file, open(tmp_file,"wb") as tmp_out, ThreadPoolExecutor(max_workers=threads) as pool:
+            # gzip header: magic, deflate, no flags, modification time, no extra flags, unknown OS
+            tmp_out.write(b"\x1f\x8b\x08\x00" + struct.pack("<I", int(time.time())) + b"\x00\xff")
+            
+            zdict = b""
+            data = in_file.read(block_size)
+            
+            while True:
+                next_data = in_file.read(block_size)
+                last = len(next_data) == 0
+                
+                crc = zlib.crc32(data, crc)
+                bytes_in = bytes_in + len(data)
+                pending.append(pool.submit(_deflate_block, data, cprss_lvl, zdict, last))
+                
+                # Bound the number of blocks held in memory
+                while len(pending) >= 2 * threads:
+                    tmp_out.write(pending.popleft().result())
+                    
+                if last:
+                    break
+                
+                zdict = data[-DEFLATE_WINDOW:]
+                data = next_data
             
+            while pending:
+                tmp_out.write(pending.popleft().result())
+            
+            # gzip trailer: CRC32 and size (mod 2^32) of the uncompressed data
+            tmp_out.write(struct.pack("<II", crc & 0xffffffff, bytes_in & 0xffffffff))
+            
+        bytes_out = os.path.getsize(tmp_file)
+        os.replace(tmp_file,out_file)
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    
     if rm_orig:
         os.remove(file)
-            
+    
+    if return_stats:
+        return out_file, bytes_in, bytes_out
+    
     return out_file
 
-def gunzip_file(file,rm_orig=True):
+def compress_file(file,rm_orig=True,cprss_lvl=6):
     '''
-    Gunzips file.
+    Gzips file with the compression engine selected in the conversion options (see 'set_conversion_opts'): 
+    'zlib' (single-threaded, see 'gzip_file') or 'parallel' (multi-threaded, see 'pgzip_file').
     
     Arguments:
         file (string): Input file
         rm_orig (boolean): If true (default), removes original file
+        cprss_lvl (int): Compression level [1 - 9] - 1 is fastest, 9 is smallest (default: 6)
         
     Returns: 
-        out_file (string): Gunzipped file
+        out_file (string): Gzipped file
     '''
     
-    # Define tempory file for I/O buffer stream
-    tmp_file = file
-    path,f_name_,ext_ = file_parts(tmp_file)
-    f_name = f_name_ # + ext_[:-3]
-    out_file = os.path.join(path,f_name)
-    
-    with gzip.GzipFile(file,"rb") as in_file:
-        data = in_file.read(); in_file.close()
-        with open(out_file,"wb") as tmp_out:
-            tmp_out.write(data)
-            tmp_out.close()
-            
-    if rm_orig:
-        os.remove(file)
-    
+    with trace_span('gzip', file) as span:
+        if span:
+            span.bytes = os.path.getsize(file)
+        if CONVERSION_OPTS['gzip_engine'] == 'parallel':
+            out_file = pgzip_file(file,rm_orig=rm_orig,cprss_lvl=cprss_lvl,threads=CONVERSION_OPTS['gzip_threads'])
+        else:
+            out_file = gzip_file(file,rm_orig=rm_orig,cprss_lvl=cprss_lvl)
+        
     return out_file
 
 def read_json(json_file):
@@ -192,6 +1344,64 @@ def read_json(json_file):
         
     return data
 
+def write_json(json_file,dictionary):
+    '''
+    Writes a dictionary to a JavaScript Object Notation (JSON) file atomically: the file is written to a temporary
+    file in the same directory, which then replaces the JSON file. Readers never see a partially written file.
+    
+    Arguments:
+        json_file (string): Output file
+        dictionary (dict): Dictionary of key mapped items to write to JSON file
+        
+    Returns: 
+        json_file (string): Written JSON file
+    '''
+    
+    with trace_span('write_json', json_file) as span:
+        tmp_file = json_file + f".tmp{os.getpid()}"
+        
+        with open(tmp_file,"w") as file:
+            json.dump(dictionary,file,indent=4)
+        os.replace(tmp_file, json_file)
+        
+        if span:
+            span.bytes = os.path.getsize(json_file)
+    
+    return json_file
+
+def build_sidecar(json_file,*metadata):
+    '''
+    Builds a BIDS JSON sidecar in memory by merging the sidecar written by the converter (e.g. dcm2niix) with
+    metadata dictionaries. Later dictionaries take precedence, i.e. for the 'data_to_bids_*' functions: converter
+    sidecar < derived parameters (see 'convert_source_nii.get_data_params') < common metadata < scan type metadata.
+    The sidecar file is read once (if it exists), and is not written (see 'write_json'). As with 'update_json',
+    an empty filename (i.e. the converter returned no sidecar) raises a FileNotFoundError. If the filename is None
+    (i.e. there is no converter, as when planning a conversion), only the metadata dictionaries are merged.
+    
+    Example usage:
+    
+        info = build_sidecar(json_file, meta_dict_params, meta_dict_com, meta_dict_anat)
+    
+    Arguments:
+        json_file (string or None): Converter JSON sidecar, need not exist
+        *metadata (dict): Metadata dictionaries, in increasing order of precedence
+        
+    Returns: 
+        info (dict): Merged sidecar dictionary
+    '''
+    
+    if json_file is None:
+        info = dict()
+    elif not json_file:
+        raise FileNotFoundError(f"No JSON sidecar: '{json_file}'")
+    else:
+        info = read_json(json_file)
+    
+    for dictionary in metadata:
+        info.update(dictionary)
+    
+    return info
+
 def update_json(json_file,dictionary):
     '''
     Updates JavaScript Object Notation (JSON) file. If the file does not exist, it is created once
@@ -205,19 +1415,23 @@ def update_json(json_file,dictionary):
         json_file (string): Updated JSON file
     '''
     
-    # Check if JSON file exists, if not, then create JSON file
-    if not os.path.exists(json_file):
-        with open(json_file,"w"): pass
+    with trace_span('update_json', json_file) as span:
+        # Check if JSON file exists, if not, then create JSON file
+        if not os.path.exists(json_file):
+            with open(json_file,"w"): pass
 
-    # Read JSON file
-    data_orig = read_json(json_file)
+        # Read JSON file
+        data_orig = read_json(json_file)
+            
+        # Update original data from JSON file
+        data_orig.update(dictionary)
         
-    # Update original data from JSON file
-    data_orig.update(dictionary)
-    
-    # Write updated JSON file
-    with open(json_file,"w") as file:
-        json.dump(data_orig,file,indent=4)
+        # Write updated JSON file
+        with open(json_file,"w") as file:
+            json.dump(data_orig,file,indent=4)
+
+        if span:
+            span.bytes = os.path.getsize(json_file)
         
     return json_file
 
@@ -263,6 +1477,8 @@ def get_bvals(bval_file):
         bvals_list (list): List of unique, non-zero bvalues (as floats).
     '''
     
+    import numpy as np
+    
     vals = np.loadtxt(bval_file)
     vals_nonzero = vals[vals.astype(bool)]
     bvals_list = list(np.unique(vals_nonzero))
@@ -338,8 +1554,9 @@ def str_in_substr(sub_str_,str_):
     bool_var = False
     
     for word in sub_str_.split(","):
-        if any(word in str_ for element in str_):
+        if word in str_:
             bool_var = True
+            break
             
     return bool_var
 
@@ -361,14 +1578,296 @@ def list_in_substr(list_,str_):
         bool_var (bool): Boolean - True or False
     '''
     
-    bool_var = False
-    
-    for word in list_:
-        if any(word.lower() in str_.lower() for element in str_.lower()):
-            bool_var = True
+    str_ = str_.lower()
+    bool_var = any(word.lower() in str_ for word in list_)
             
     return bool_var
 
+class SearchDict(dict):
+    '''
+    Nested dictionary of search terms (see 'read_config' in convert_source.py) with all of the search terms compiled
+    into a single case-insensitive regular expression, so that a string is classified in one pass. Search terms are
+    prioritized in the order they are listed in the configuration file: the first listed term that is found in the
+    string determines the modality.
+    
+    N.B.: The search terms are compiled when the dictionary is created. 'compile' must be invoked again if the 
+    dictionary is modified afterwards.
+    
+    Example:
+    
+        search_dict = SearchDict({'anat': {'T1w': ['T1', 'TFE']}, 'func': {'bold': {'rest': ['rest', 'FEEPI']}}})
+        search_dict.search('sub_rest_FEEPI.PAR') would return ('func', 'bold', 'rest').
+        search_dict.search('sub_T2_TSE.PAR') would return None.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(SearchDict, self).__init__(*args, **kwargs)
+        self.compile()
+
+    def compile(self):
+        '''
+        Compiles the search terms into a single regular expression. Each search term is a (zero-width) alternative
+        in the regular expression, in order of priority, so that all (possibly overlapping) matches are found.
+        
+        Arguments:
+            None
+            
+        Returns:
+            None
+        '''
+        
+        alternatives = list()
+        self._hits = list()
+        
+        for scan_type, scans in self.items():
+            if not isinstance(scans, dict):
+                continue
+            for scan, item in scans.items():
+                if isinstance(item, dict):
+                    terms = [(task, term) for task, task_terms in item.items() for term in (task_terms or [])]
+                elif isinstance(item, list):
+                    terms = [("", term) for term in item]
+                else:
+                    terms = list()
+                for task, term in terms:
+                    if term is None or str(term) == "":
+                        continue
+                    alternatives.append(f"({re.escape(str(term))})")
+                    self._hits.append((scan_type, scan, task))
+        
+        if alternatives:
+            self._regexp = re.compile("(?=" + "|".join(alternatives) + ")", re.IGNORECASE)
+        else:
+            self._regexp = None
+            
+        return None
+
+    def search(self, str_):
+        '''
+        Searches a string for the search terms and returns the modality of the highest priority search term found.
+        
+        Arguments:
+            str_ (string): String to be searched (e.g. filename or DICOM/PAR header field)
+            
+        Returns:
+            hit (tuple or None): (scan_type, scan, task) of the matched search term (task is an empty string if 
+                the scan has no tasks), or None if no search term is found
+        '''
+        
+        if self._regexp is None:
+            return None
+        
+        best = None
+        for match in self._regexp.finditer(str_):
+            idx = match.lastindex - 1
+            if best is None or idx < best:
+                best = idx
+                if best == 0:
+                    break
+                    
+        if best is None:
+            return None
+        
+        return self._hits[best]
+
+def search_modality(search_dict, str_):
+    '''
+    Searches a string for the search terms in the nested search dictionary and returns the matching modality 
+    (see 'SearchDict'). A plain dictionary is compiled on the fly, a 'SearchDict' (as returned by 'read_config') 
+    is used as is.
+    
+    Arguments:
+        search_dict (dict): Nested dictionary from the 'read_config' function
+        str_ (string): String to be searched (e.g. filename or DICOM/PAR header field)
+        
+    Returns:
+        hit (tuple or None): (scan_type, scan, task) of the matched search term, or None if no search term is found
+    '''
+    
+    if not isinstance(search_dict, SearchDict):
+        search_dict = SearchDict(search_dict)
+        
+    return search_dict.search(str_)
+
+def _cache_key(file, conv_opts):
+    '''
+    Computes the key of a dcm2niix conversion in the output cache: a hash of the bytes of the source data (see 
+    'source_files'), the dcm2niix options, and the dcm2niix executable (so that an upgrade invalidates the cache).
+    
+    Arguments:
+        file (string): Absolute path to raw image data file
+        conv_opts (list): dcm2niix command line options (excluding the output name and directory, and the input file)
+        
+    Returns:
+        key (string): BLAKE2b hex digest
+    '''
+    
+    digest = hashlib.blake2b(digest_size=20)
+    
+    exe = shutil.which(conv_opts[0]) or conv_opts[0]
+    try:
+        exe_mtime = os.stat(exe).st_mtime_ns
+    except OSError:
+        exe_mtime = 0
+    digest.update(json.dumps([exe, exe_mtime, conv_opts[1:]]).encode())
+    
+    buffer = bytearray(GZIP_BUFFER_SIZE)
+    view = memoryview(buffer)
+    for f in source_files(file):
+        digest.update(os.path.basename(f).encode() + b"\0")
+        with open(f, "rb") as in_file:
+            while True:
+                n = in_file.readinto(buffer)
+                if not n:
+                    break
+                digest.update(view[:n])
+        digest.update(b"\0")
+    
+    return digest.hexdigest()
+
+# Stem that replaces the output basename of files stored in the cache of dcm2niix outputs
+CACHE_STEM = 'out'
+
+def _cache_copy(file, out_file):
+    '''
+    Copies a file to or from the cache of dcm2niix outputs. NifTi images are hard linked if possible, as they are
+    never modified in place, other files (e.g. JSON sidecars, which are updated in place) are copied.
+    
+    Arguments:
+        file (string): Source file
+        out_file (string): Output file
+        
+    Returns:
+        None
+    '''
+    
+    if '.nii' in os.path.basename(file):
+        try:
+            os.link(file, out_file)
+            return None
+        except OSError:
+            pass
+    
+    shutil.copyfile(file, out_file)
+    
+    return None
+
+def cache_fetch(key, out_dir, basename, cache_dir=""):
+    '''
+    Restores cached dcm2niix outputs to an output directory, renamed to the output basename (see '_cache_copy').
+    
+    Arguments:
+        key (string): Cache key (see '_cache_key')
+        out_dir (string): Absolute path to output directory
+        basename (string): Output file(s) basename
+        cache_dir (string): Cache directory. If left empty, the 'cache_dir' conversion option is used.
+        
+    Returns:
+        out_files (list): List of restored files, empty if the key is not in the cache
+    '''
+    
+    if not cache_dir:
+        cache_dir = CONVERSION_OPTS['cache_dir']
+    
+    entry = os.path.join(cache_dir, key[:2], key)
+    
+    try:
+        names = sorted(os.listdir(entry))
+    except FileNotFoundError:
+        return list()
+    
+    out_files = list()
+    for name in names:
+        out_file = os.path.join(out_dir, basename + name[len(CACHE_STEM):])
+        _cache_copy(os.path.join(entry, name), out_file)
+        out_files.append(out_file)
+    
+    # Mark entry as recently used
+    os.utime(entry)
+    
+    return out_files
+
+def cache_store(key, out_dir, basename, cache_dir="", cache_size=None):
+    '''
+    Stores dcm2niix outputs (the files in the output directory that start with the output basename) in the cache, 
+    with the basename replaced by 'out' (e.g. 'out.nii.gz', 'out_e2.json'). Entries are written to a temporary directory 
+    that is then renamed, so that concurrent conversions never see partial entries. The least recently used entries
+    are then evicted if the cache exceeds its maximum size (see 'cache_evict').
+    
+    Arguments:
+        key (string): Cache key (see '_cache_key')
+        out_dir (string): Absolute path to output directory
+        basename (string): Output file(s) basename
+        cache_dir (string): Cache directory. If left empty, the 'cache_dir' conversion option is used.
+        cache_size (int): Maximum size (in bytes) of the cache. If None, the 'cache_size' conversion option is used.
+        
+    Returns:
+        None
+    '''
+    
+    if not cache_dir:
+        cache_dir = CONVERSION_OPTS['cache_dir']
+    if cache_size is None:
+        cache_size = CONVERSION_OPTS['cache_size']
+    
+    out_files = [f for f in glob.glob(os.path.join(out_dir, basename + '*')) if os.path.isfile(f)]
+    if not out_files:
+        return None
+    
+    entry = os.path.join(cache_dir, key[:2], key)
+    tmp_entry = entry + f".tmp{os.getpid()}"
+    os.makedirs(tmp_entry, exist_ok=True)
+    
+    try:
+        for out_file in out_files:
+            name = CACHE_STEM + os.path.basename(out_file)[len(basename):]
+            _cache_copy(out_file, os.path.join(tmp_entry, name))
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # Entry stored by another process in the meantime
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+    
+    if cache_size:
+        cache_evict(cache_dir, cache_size)
+    
+    return None
+
+def cache_evict(cache_dir, cache_size):
+    '''
+    Evicts the least recently used entries of the cache of dcm2niix outputs until its size is at most 'cache_size'.
+    
+    Arguments:
+        cache_dir (string): Cache directory
+        cache_size (int): Maximum size (in bytes) of the cache
+        
+    Returns:
+        None
+    '''
+    
+    entries = list()
+    total = 0
+    
+    for prefix in os.scandir(cache_dir):
+        if not prefix.is_dir():
+            continue
+        for entry in os.scandir(prefix.path):
+            if not entry.is_dir() or '.tmp' in entry.name:
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime_ns, size, entry.path))
+            except FileNotFoundError:
+                continue
+            total = total + size
+    
+    for mtime, size, path in sorted(entries):
+        if total <= cache_size:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total = total - size
+    
+    return None
+
 def convert_image_data(file,basename,out_dir,cprss_lvl=6,bids=True,
                        anon_bids=True,gzip=True,comment=True,
                        adjacent=False,dir_search=5,nrrd=False,
@@ -378,9 +1877,16 @@ def convert_image_data(file,basename,out_dir,cprss_lvl=6,bids=True,
                        lossless=False,big_endian="optimal",xml=False):
     '''
     Converts raw image data (DICOM, PAR REC, or Bruker) to NifTi (or NRRD) using dcm2niix.
-    This is a wrapper function for dcm2niix (v1.0.20190902+). This wrapper functions has no returns, 
-    however output files are generated in a specified directory that must exist prior to the 
-    invokation of this function.
+    This is a wrapper function for dcm2niix (v1.0.20190902+). Output files are generated in a specified 
+    directory that must exist prior to the invokation of this function, and the exit status of dcm2niix
+    is returned. If the 'parallel' gzip engine is selected (see 'set_conversion_opts'),
+    dcm2niix writes uncompressed NifTi files which are then gzipped with 'pgzip_file'. If a cache directory 
+    is set (see 'set_conversion_opts'), the outputs are restored from the cache when the same source data
+    were converted before with the same options, instead of running dcm2niix (see 'cache_fetch'). dcm2niix is
+    killed (and a TimeoutError is raised) if it runs for longer than the timeout of the conversion options, and 
+    retried after transient failures (see 'convert_source_runner.Dcm2niixRunner'). The output of dcm2niix is 
+    printed once it exits, or as it is written if the 'dcm2niix_stream' option is set. DICOM series are converted
+    from a directory that only contains the files of the series (see 'link_series').
     
     Note: Most of the defaults for dcm2niix have been preserved aside from those starred (*) in the
     (optional) arguments section, in order to be BIDS compliant.
@@ -417,8 +1923,16 @@ def convert_image_data(file,basename,out_dir,cprss_lvl=6,bids=True,
         xml (bool): Slicer format features (default: False)
         
         Returns:
-            None
+            status (int): Exit status of dcm2niix, 0 if the outputs were restored from the cache
     '''
+    
+    import platform
+    import convert_source_runner as csr
+
+    # Gzip dcm2niix output with the parallel gzip engine instead
+    pgzip = gzip and CONVERSION_OPTS['gzip_engine'] == 'parallel' and not nrrd
+    if pgzip:
+        gzip = False
 
     # Empty list
     conv_cmd = list()
@@ -464,22 +1978,69 @@ def convert_image_data(file,basename,out_dir,cprss_lvl=6,bids=True,
             conv_cmd.append(bool_vars[idx])
             conv_cmd.append("y")
 
-    # Required arguments
-    # Filename
-    conv_cmd.append("-f")
-    conv_cmd.append(f"{basename}")
+    with trace_span('convert_image_data', file) as span:
+        if span:
+            span.bytes = sum(os.path.getsize(src) for src in source_files(file))
 
-    # Output directory
-    conv_cmd.append("-o")
-    conv_cmd.append(f"{out_dir}")
+        # Restore outputs from the cache
+        if CONVERSION_OPTS['cache_dir']:
+            key = _cache_key(file, conv_cmd + [f"pgzip={pgzip}"])
+            if cache_fetch(key, out_dir, basename):
+                return 0
 
-    # Image file   
-    conv_cmd.append(f"{file}")
+        # Required arguments
+        # Filename
+        conv_cmd.append("-f")
+        conv_cmd.append(f"{basename}")
 
-    # System Call to dcm2niix (assumes dcm2niix is added to system path variable)
-    subprocess.call(conv_cmd)
+        # Output directory
+        conv_cmd.append("-o")
+        conv_cmd.append(f"{out_dir}")
 
-    return None
+        # Image file, or the directory the files of a DICOM series are linked in (see 'link_series')
+        link_dir = ""
+        if is_dcm_file(file):
+            link_dir = link_series(file, out_dir)
+            conv_cmd.append(f"{link_dir}")
+        else:
+            conv_cmd.append(f"{file}")
+
+        # Run dcm2niix (assumes dcm2niix is added to system path variable), with the timeout and retries 
+        # of the conversion options. The output is printed once dcm2niix exits, so that the output of 
+        # parallel conversions is not interleaved, unless it is streamed (with the series as prefix).
+        prefix = f"[{os.path.basename(file)}] "
+        def write_line(cmd, stream, line):
+            out = sys.stdout if stream == 'stdout' else sys.stderr
+            out.write(prefix + line.rstrip('\n') + '\n')
+            out.flush()
+        on_output = write_line if CONVERSION_OPTS['dcm2niix_stream'] else None
+        try:
+            result = csr.run_command(conv_cmd, timeout=CONVERSION_OPTS['dcm2niix_timeout'], retries=CONVERSION_OPTS['dcm2niix_retries'], on_output=on_output)
+        finally:
+            if link_dir:
+                shutil.rmtree(link_dir, ignore_errors=True)
+        if not on_output:
+            sys.stdout.write(result.stdout)
+            sys.stderr.write(result.stderr)
+            sys.stdout.flush()
+        status = result.status
+
+        if result.timed_out:
+            raise TimeoutError(f"dcm2niix timed out after {CONVERSION_OPTS['dcm2niix_timeout']} s: {file}")
+
+        # Gzip (uncompressed) dcm2niix output
+        if pgzip:
+            for nii_file in glob.glob(os.path.join(out_dir, f"{basename}*.nii")):
+                with trace_span('gzip', nii_file) as gzip_span:
+                    if gzip_span:
+                        gzip_span.bytes = os.path.getsize(nii_file)
+                    pgzip_file(nii_file,cprss_lvl=cprss_lvl,threads=CONVERSION_OPTS['gzip_threads'])
+
+        # Store outputs in the cache
+        if CONVERSION_OPTS['cache_dir'] and status == 0:
+            cache_store(key, out_dir, basename)
+
+    return status
 
 def cp_file(file,work_dir="",work_name=""):
     '''
@@ -510,6 +2071,93 @@ def cp_file(file,work_dir="",work_name=""):
     
     return out_file
 
+# Linux ioctl request to clone (reflink) a file (FICLONE, from linux/fs.h)
+FICLONE = 0x40049409
+
+def _reflink(file,out_file):
+    '''
+    Clones a file (copy-on-write) on file systems that support it (e.g. btrfs, XFS). Only available on Linux.
+    
+    Arguments:
+        file (string): Source file
+        out_file (string): Output file, which must not exist
+        
+    Returns:
+        None
+    '''
+    
+    import fcntl
+    
+    with open(file,"rb") as src, open(out_file,"xb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(out_file)
+            raise
+    
+    return None
+
+def link_file(file,work_dir="",work_name="",strategy=""):
+    '''
+    Links a file, or copies it if it cannot be linked. Primarily intended for placing existing (NifTi) image 
+    data in the BIDS directory without copying the image data. Available strategies:
+    
+        copy: Copies the file (see 'cp_file')
+        hardlink: Creates a hard link, the output shares the data (and the inode) of the source file
+        reflink: Creates a copy-on-write clone, the output shares the data blocks of the source file until either is modified
+        symlink: Creates a symbolic link to the (absolute) path of the source file
+    
+    If the file cannot be linked (e.g. the source and output are on different file systems, or the file system does 
+    not support reflinks), the file is copied instead.
+    
+    NOTE: Linked outputs must not be modified in place, as hard and symbolic links would modify the source file.
+    
+    Arguments:
+        file (string): File path to source (image) file
+        work_dir (string): Absolute path to working directory (must exist at runtime prior to invoakation of this function). If left empty, then the directory of the source file is used.
+        work_name (string): Output name for (image) file. If left empty, the output name is the same as the source file.
+        strategy (string): Link strategy. If left empty, the 'link_strategy' conversion option is used (see 'set_conversion_opts').
+        
+    Returns:
+        out_file (string): Absolute path to output file.
+    '''
+    
+    if not strategy:
+        strategy = CONVERSION_OPTS['link_strategy']
+    
+    if strategy == 'copy':
+        return cp_file(file,work_dir,work_name)
+    
+    [path, filename, ext] = file_parts(file)
+    
+    if work_dir == "":
+        work_dir = path
+    else:
+        work_dir = os.path.abspath(work_dir)
+        
+    if work_name == "":
+        work_name = filename
+        
+    out_file = os.path.join(work_dir,work_name + ext)
+    
+    try:
+        if strategy == 'hardlink':
+            os.link(file,out_file)
+        elif strategy == 'reflink':
+            _reflink(file,out_file)
+        elif strategy == 'symlink':
+            os.symlink(os.path.abspath(file),out_file)
+        else:
+            raise ValueError(f"Invalid link strategy: {strategy}. Valid options are: {CONVERSION_OPT_CHOICES['link_strategy']}")
+    except (OSError, ImportError):
+        if os.path.exists(file):
+            out_file = cp_file(file,work_dir,work_name)
+        else:
+            raise
+    
+    return out_file
+
 def get_recon_mat(json_file):
     '''
     Reads ReconMatrixPE (reconstruction matrix phase encode) value from the JSON sidecar.
@@ -610,8 +2258,11 @@ def calc_read_time(file, json_file=""):
     Approaches 3 and 4 were found thorugh trial and error and yielded similar, but not the same values as approaches 1 and 2.
     '''
     
-    # check file extension
-    if 'dcm' in file:
+    import convert_source_dcm as cdm
+    import convert_source_par as csp
+    
+    # check file type
+    if is_dcm_file(file):
         calc_method = 'dcm'
     elif 'PAR' in file:
         calc_method = 'par'
@@ -689,7 +2340,7 @@ def calc_read_time(file, json_file=""):
 def convert_anat(file,work_dir,work_name):
     '''
     Converts raw anatomical (and functional) MR images to NifTi file format, with a BIDS JSON sidecar.
-    Returns a NifTi file and a JSON sidecar (file) by globbing an isolated directory.
+    Returns a NifTi file and a JSON sidecar (file) from the result of the converter backend (see 'convert_source_backend').
     
     Arguments:
         file (string): Absolute filepath to raw image data
@@ -701,25 +2352,25 @@ def convert_anat(file,work_dir,work_name):
         json_file (string): Absolute file path to JSON sidecar
     '''
     
-    # Convert (anatomical) iamge data
-    convert_image_data(file, work_name, work_dir)
+    import convert_source_backend as csb
     
-    # Get files
-    dir_path = os.path.join(work_dir, work_name)
-    nii_file = glob.glob(dir_path + '*.nii*')
-    json_file = glob.glob(dir_path + '*.json')
+    # Convert (anatomical) iamge data
+    result = csb.convert(file, work_name, work_dir)
     
-    # Convert lists to strings
-    nii_file = ''.join(nii_file)
-    json_file = ''.join(json_file)
+    # Convert lists to strings: the first (sorted) image is that of the output name, any further images of the 
+    # series (e.g. with the '_e2' suffix of dcm2niix) are not kept
+    nii_file = ''.join(result.images[:1])
+    json_file = csb.sidecar_for(nii_file, result)
+    if len(result.images) > 1:
+        print(f"Keeping only the first of {len(result.images)} converted images: {nii_file}", file=sys.stderr)
     
     return nii_file, json_file
 
 def convert_dwi(file,work_dir,work_name):
     '''
     Converts raw diffusion weigthed MR images to NifTi file format, with a BIDS JSON sidecar.
-    Returns a NifTi file, JSON sidecar (file), and (FSL-style) bval and bvec files by globbing 
-    an isolated directory.
+    Returns a NifTi file, JSON sidecar (file), and (FSL-style) bval and bvec files from the result 
+    of the converter backend (see 'convert_source_backend').
     
     Arguments:
         file (string): Absolute filepath to raw image data
@@ -733,28 +2384,26 @@ def convert_dwi(file,work_dir,work_name):
         bvec (string): Absolute file path to bvec file
     '''
     
-    # Convert diffusion iamge data
-    convert_image_data(file, work_name, work_dir)
+    import convert_source_backend as csb
     
-    # Get files
-    dir_path = os.path.join(work_dir, work_name)
-    nii_file = glob.glob(dir_path + '*.nii*')
-    json_file = glob.glob(dir_path + '*.json')
-    bval = glob.glob(dir_path + '*.bval*')
-    bvec = glob.glob(dir_path + '*.bvec*')
+    # Convert diffusion iamge data
+    result = csb.convert(file, work_name, work_dir)
     
-    # Convert lists to strings
-    nii_file = ''.join(nii_file)
-    json_file = ''.join(json_file)
-    bval = ''.join(bval)
-    bvec = ''.join(bvec)
+    # Convert lists to strings (the first image, see 'convert_anat')
+    nii_file = ''.join(result.images[:1])
+    json_file = csb.sidecar_for(nii_file, result)
+    bval = ''.join(result.bvals[:1])
+    bvec = ''.join(result.bvecs[:1])
+    if len(result.images) > 1:
+        print(f"Keeping only the first of {len(result.images)} converted images: {nii_file}", file=sys.stderr)
     
     return nii_file, json_file, bval, bvec
 
 def convert_fmap(file,work_dir,work_name):
     '''
     Converts raw precomputed fieldmap MR images to NifTi file format, with a BIDS JSON sidecar.
-    Returns two NifTi files, and their corresponding JSON sidecars (files), by globbing an isolated directory.
+    Returns two NifTi files, and their corresponding JSON sidecars (files), from the result of the converter backend
+    (see 'convert_source_backend').
     
     N.B.: This function is mainly designed to handle fieldmap data case 3 from bids-specifications document. Furhter support for 
     the additional cases requires test/validation data. 
@@ -773,15 +2422,18 @@ def convert_fmap(file,work_dir,work_name):
         json_mag (string): Absolute file path to corresponding JSON sidecar
     '''
     
+    import convert_source_backend as csb
+    
     # Convert diffusion iamge data
-    convert_image_data(file, work_name, work_dir)
+    result = csb.convert(file, work_name, work_dir)
     
-    # Get files
+    # Get files: the fieldmap is the (real) image with the 'real' suffix, 
+    # the magnitude image is the image with the output file name
     dir_path = os.path.join(work_dir, work_name)
-    nii_fmap = glob.glob(dir_path + '*real*.nii*')
-    json_fmap = glob.glob(dir_path + '*real*.json')
-    nii_mag = glob.glob(dir_path + '.nii*')
-    json_mag = glob.glob(dir_path + '.json')
+    nii_fmap = [img for img in result.images if 'real' in os.path.basename(img)[len(work_name):]]
+    json_fmap = [sidecar for sidecar in result.sidecars if 'real' in os.path.basename(sidecar)[len(work_name):]]
+    nii_mag = [img for img in result.images if img.startswith(dir_path + '.nii')]
+    json_mag = [sidecar for sidecar in result.sidecars if sidecar == dir_path + '.json']
     
     # Convert lists to strings
     nii_fmap = ''.join(nii_fmap)
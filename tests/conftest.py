@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+'''
+pytest configuration of the convert_source tests: makes the convert_source modules (and the synthetic fixtures of
+the benchmarks) importable.
+'''
+
+# Import packages and modules
+import os
+import sys
+
+# Make the convert_source modules and the benchmark fixtures importable
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for path in [os.path.join(ROOT_DIR, "benchmarks"), os.path.join(ROOT_DIR, "convert_source")]:
+    if not path in sys.path:
+        sys.path.insert(0, path)
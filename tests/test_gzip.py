@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the parallel gzip engine ('utils.pgzip_file').
+'''
+
+# Import packages and modules
+import os
+import gzip
+import zlib
+import pytest
+import numpy as np
+import nibabel as nib
+
+# Import convert_source modules
+import utils
+
+# Define functions
+
+def make_data(size, seed=0):
+    '''
+    Creates compressible bytes: runs of random bytes.
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    return np.repeat(rng.integers(0, 256, size // 8 + 1, dtype=np.uint8), 8)[:size].tobytes()
+
+@pytest.mark.parametrize("size", [0, 1000, 300 * 1024])
+@pytest.mark.parametrize("threads", [1, 4])
+def test_round_trip(tmp_path, size, threads):
+    file = os.path.join(str(tmp_path), "data.bin")
+    data = make_data(size)
+    with open(file, "wb") as f:
+        f.write(data)
+
+    [out_file, bytes_in, bytes_out] = utils.pgzip_file(file, threads=threads, block_size=64 * 1024, return_stats=True)
+
+    assert out_file == file + ".gz"
+    assert not os.path.exists(file)
+    assert not os.path.exists(out_file + ".tmp")
+    assert (bytes_in, bytes_out) == (size, os.path.getsize(out_file))
+
+    with gzip.open(out_file, "rb") as f:
+        assert f.read() == data
+
+    # A single gzip member
+    with open(out_file, "rb") as f:
+        decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        assert decomp.decompress(f.read()) == data
+        assert decomp.eof and decomp.unused_data == b""
+
+def test_keep_original(tmp_path):
+    file = os.path.join(str(tmp_path), "data.bin")
+    with open(file, "wb") as f:
+        f.write(make_data(1000))
+
+    utils.pgzip_file(file, rm_orig=False)
+
+    assert os.path.exists(file)
+
+def test_nifti(tmp_path):
+    nii_file = os.path.join(str(tmp_path), "img.nii")
+    data = np.arange(16 * 16 * 8 * 4, dtype=np.int16).reshape((16, 16, 8, 4))
+    nib.save(nib.Nifti1Image(data, np.eye(4)), nii_file)
+
+    out_file = utils.pgzip_file(nii_file, threads=4, block_size=16 * 1024)
+
+    assert out_file == nii_file + ".gz"
+    assert np.array_equal(np.asanyarray(nib.load(out_file).dataobj), data)
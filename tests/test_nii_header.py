@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the NifTi header reader ('convert_source_nii.NiiHeader' and 'convert_source_nii.read_nii_header') against
+nibabel.
+'''
+
+# Import packages and modules
+import os
+import struct
+import pytest
+import numpy as np
+import nibabel as nib
+
+# Import convert_source modules
+import convert_source_nii as csn
+
+# Define functions
+
+def make_image(file, img_class=nib.Nifti1Image, byte_order="<", shape=(6, 5, 4, 3), tr=2.5):
+    '''
+    Writes a NifTi image with an oblique affine (as qform and sform) and the given byte order.
+    '''
+
+    rot = nib.eulerangles.euler2mat(0.3, -0.2, 0.1)
+    affine = nib.affines.from_matvec(rot.dot(np.diag([1.5, 2.0, 2.5])), [-40.0, 12.5, 30.0])
+
+    img = img_class(np.arange(np.prod(shape), dtype=np.int16).reshape(shape), affine)
+    img.set_qform(affine, code=1)
+    img.set_sform(affine, code=2)
+    img.header.set_zooms((1.5, 2.0, 2.5, tr)[:len(shape)])
+    if byte_order != img.header.endianness:
+        img = img_class(img.dataobj, None, img.header.as_byteswapped(byte_order))
+    nib.save(img, file)
+
+    return file
+
+@pytest.mark.parametrize("ext", [".nii", ".nii.gz"])
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+@pytest.mark.parametrize("img_class, version", [(nib.Nifti1Image, 1), (nib.Nifti2Image, 2)])
+def test_header_matches_nibabel(tmp_path, img_class, version, byte_order, ext):
+    nii_file = make_image(os.path.join(str(tmp_path), "img" + ext), img_class=img_class, byte_order=byte_order)
+    ref_img = nib.load(nii_file)
+    ref = ref_img.header
+
+    assert ref.endianness == byte_order
+
+    hdr = csn.NiiHeader(nii_file)
+
+    assert hdr.version == version
+    assert hdr.dims == list(ref.get_data_shape())
+    assert np.allclose(hdr.pixdim, ref['pixdim'])
+    assert hdr.datatype == int(ref['datatype'])
+    assert hdr.vox_offset == ref_img.dataobj.offset
+    assert (hdr.qform_code, hdr.sform_code) == (int(ref['qform_code']), int(ref['sform_code']))
+    assert np.allclose(hdr.qform, ref.get_qform(), atol=1e-4)
+    assert np.allclose(hdr.sform, ref.get_sform(), atol=1e-4)
+
+def test_tr_and_frames(tmp_path):
+    nii_file = make_image(os.path.join(str(tmp_path), "img.nii.gz"), shape=(6, 5, 4, 7), tr=0.8)
+
+    assert csn.get_nii_tr(nii_file) == pytest.approx(0.8)
+    assert csn.get_num_frames(nii_file) == 7
+
+def test_rewritten_file_is_read_again(tmp_path):
+    nii_file = make_image(os.path.join(str(tmp_path), "img.nii"), shape=(6, 5, 4, 3))
+    assert csn.read_nii_header(nii_file).dims == [6, 5, 4, 3]
+
+    make_image(nii_file, shape=(6, 5, 4))
+    st = os.stat(nii_file)
+    os.utime(nii_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert csn.read_nii_header(nii_file).dims == [6, 5, 4]
+
+def test_not_a_nifti_file(tmp_path):
+    file = os.path.join(str(tmp_path), "img.nii")
+    with open(file, "wb") as f:
+        f.write(struct.pack("<i", 100) + bytes(400))
+
+    with pytest.raises(ValueError):
+        csn.NiiHeader(file)
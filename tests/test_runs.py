@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the allocation of BIDS run numbers: 'utils.reserve_run', 'utils.release_runs', 'utils.init_run_index', and
+their in-memory counterpart 'utils.RunPlan'.
+'''
+
+# Import packages and modules
+import os
+import sqlite3
+import multiprocessing
+
+# Import convert_source modules
+import utils
+
+# Define functions
+
+def touch(file):
+    '''
+    Creates an empty file (and its directory).
+    '''
+
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    open(file, "w").close()
+
+    return file
+
+def anat_dir(bids_out_dir, sub=1, ses=1):
+    '''
+    Returns the anat output directory of a subject session.
+    '''
+
+    return os.path.join(utils.session_dir(bids_out_dir, sub, ses), "anat")
+
+def test_reserve_run_counts_existing_runs(tmp_path):
+    bids_out_dir = str(tmp_path)
+    out_dir = anat_dir(bids_out_dir)
+    touch(os.path.join(out_dir, "sub-001_ses-001_run-02_T1w.nii.gz"))
+
+    assert utils.reserve_run(bids_out_dir, out_dir, "T1w") == 3
+    assert utils.reserve_run(bids_out_dir, out_dir, "T1w") == 4
+    assert utils.reserve_run(bids_out_dir, out_dir, "T2w") == 1
+    assert utils.reserve_run(bids_out_dir, out_dir, "T1w", acq="fast") == 1
+
+def test_reserve_run_is_atomic_across_processes(tmp_path):
+    bids_out_dir = str(tmp_path)
+    out_dir = os.path.join(utils.session_dir(bids_out_dir, 1, 1), "func")
+
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        runs = pool.starmap(utils.reserve_run, [(bids_out_dir, out_dir, "bold")] * 40)
+
+    assert sorted(runs) == list(range(1, 41))
+
+def test_released_runs_are_reused_by_their_series(tmp_path):
+    bids_out_dir = str(tmp_path)
+    out_dir = anat_dir(bids_out_dir)
+    outputs = [touch(os.path.join(out_dir, f"sub-001_ses-001_run-0{run}_T1w.nii.gz")) for run in [1, 2]]
+
+    utils.release_runs(bids_out_dir, "/data/a.PAR", outputs[1:])
+
+    assert utils.reserve_run(bids_out_dir, out_dir, "T1w", source="/data/b.PAR") == 3
+    assert utils.reserve_run(bids_out_dir, out_dir, "T1w", source="/data/a.PAR") == 2
+    assert utils.reserve_run(bids_out_dir, out_dir, "T1w", source="/data/a.PAR") == 4
+
+def test_run_plan_matches_reserve_run(tmp_path):
+    bids_out_dir = str(tmp_path)
+    out_dir = anat_dir(bids_out_dir)
+    outputs = [touch(os.path.join(out_dir, f"sub-001_ses-001_run-0{run}_T1w.nii.gz")) for run in [1, 2]]
+    sources = ["/data/b.PAR", "/data/a.PAR", "/data/a.PAR", "/data/c.PAR"]
+
+    runs = utils.RunPlan()
+    runs.release("/data/a.PAR", outputs[1:])
+    planned = [runs.reserve(out_dir, "T1w", source=source) for source in sources]
+
+    # Planning does not write to the state database
+    assert not os.path.exists(os.path.join(bids_out_dir, utils.STATE_DB))
+
+    utils.release_runs(bids_out_dir, "/data/a.PAR", outputs[1:])
+    reserved = [utils.reserve_run(bids_out_dir, out_dir, "T1w", source=source) for source in sources]
+
+    assert planned == reserved == [3, 2, 4, 5]
+
+def test_init_run_index_resets_only_its_sessions(tmp_path):
+    bids_out_dir = str(tmp_path)
+    out_dir_1 = anat_dir(bids_out_dir, sub=1)
+    out_dir_2 = anat_dir(bids_out_dir, sub=2)
+
+    utils.reserve_run(bids_out_dir, out_dir_1, "T1w")
+    utils.release_runs(bids_out_dir, "/data/1/a.PAR", [os.path.join(out_dir_1, "sub-001_ses-001_run-02_T1w.nii.gz")])
+    utils.reserve_run(bids_out_dir, out_dir_2, "T1w")
+    utils.release_runs(bids_out_dir, "/data/2/a.PAR", [os.path.join(out_dir_2, "sub-002_ses-001_run-02_T1w.nii.gz")])
+
+    utils.init_run_index(bids_out_dir, sessions=[("2", "1")], sources=["/data/2/a.PAR"])
+
+    conn = sqlite3.connect(os.path.join(bids_out_dir, utils.STATE_DB))
+    try:
+        for table in ["runs", "run_dirs", "free_runs"]:
+            out_dirs = [row[0] for row in conn.execute(f"SELECT out_dir FROM {table}")]
+            assert out_dirs == [out_dir_1]
+    finally:
+        conn.close()
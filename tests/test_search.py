@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the compiled modality search ('utils.SearchDict' and 'utils.search_modality').
+'''
+
+# Import packages and modules
+import pytest
+
+# Import convert_source modules
+import fixtures
+import utils
+import convert_source as cs
+
+# Define functions
+
+def linear_search(search_dict, str_):
+    '''
+    Reference search: the first search term (in the order of the configuration file) found in the string.
+    '''
+
+    for scan_type, scans in search_dict.items():
+        if not isinstance(scans, dict):
+            continue
+        for scan, item in scans.items():
+            if isinstance(item, dict):
+                terms = [(task, term) for task, task_terms in item.items() for term in (task_terms or [])]
+            else:
+                terms = [("", term) for term in (item or [])]
+            for task, term in terms:
+                if str(term) and str(term).lower() in str_.lower():
+                    return scan_type, scan, task
+
+    return None
+
+def test_first_listed_term_wins():
+    terms = {"anat": {"T1w": ["T1"]}, "func": {"bold": {"rest": ["rest"]}}}
+
+    assert utils.SearchDict(terms).search("s_rest_T1.PAR") == ("anat", "T1w", "")
+    assert utils.SearchDict(dict(reversed(list(terms.items())))).search("s_T1_rest.PAR") == ("func", "bold", "rest")
+
+@pytest.mark.parametrize("first, hit", [("EPI", ("fmap", "epi", "")), ("FEEPI", ("func", "bold", "rest"))])
+def test_overlapping_terms(first, hit):
+    scans = {"EPI": ("fmap", {"epi": ["EPI"]}), "FEEPI": ("func", {"bold": {"rest": ["FEEPI"]}})}
+    order = [first] + [term for term in scans if term != first]
+    search_dict = utils.SearchDict({scans[term][0]: scans[term][1] for term in order})
+
+    assert search_dict.search("s_feepi.PAR") == hit
+
+def test_no_hit():
+    assert utils.SearchDict({"anat": {"T1w": ["T1"]}}).search("s_SURVEY.PAR") is None
+    assert utils.SearchDict(dict()).search("s_SURVEY.PAR") is None
+
+def test_matches_linear_search():
+    [search_dict, exclusion_list, meta_dict] = cs.read_config(fixtures.CONFIG_FILE)
+    names = ["s_T1_TFE.PAR", "s_T2_TSE.PAR", "s_rest_FEEPI.PAR", "s_DTI_b1000.PAR", "s_B0map.PAR", "s_SURVEY.PAR", 
+             "WIP_rsfMRI_SENSE.PAR", "/data/sub_01/dwi/IM_0001.dcm", "T2W_FLAIR", "3D_T1W_TFE_sag", "unknown"]
+
+    for name in names:
+        assert search_dict.search(name) == linear_search(search_dict, name)
+        assert utils.search_modality(dict(search_dict), name) == search_dict.search(name)
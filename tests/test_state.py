@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the conversion state of series ('utils.series_state' and 'utils.record_series'), and of reruns of converted
+series (see 'convert_source.batch_convert').
+'''
+
+# Import packages and modules
+import os
+import glob
+import stat
+import shutil
+import pytest
+
+# Import convert_source modules
+import fixtures
+import utils
+import convert_source as cs
+
+# Define functions
+
+def make_series(tmp_path):
+    '''
+    Writes a PAR REC series and a (mock) output of it in a BIDS directory.
+    '''
+
+    data_dir = os.path.join(str(tmp_path), "data")
+    os.makedirs(data_dir)
+    par_file = fixtures.make_par(os.path.join(data_dir, "s_T1_TFE.PAR"))
+
+    bids_out_dir = os.path.join(str(tmp_path), "bids")
+    out_file = os.path.join(utils.session_dir(bids_out_dir, 1, 1), "anat", "sub-001_ses-001_run-01_T1w.nii.gz")
+    os.makedirs(os.path.dirname(out_file))
+    open(out_file, "w").close()
+
+    return par_file, bids_out_dir, out_file
+
+def test_recorded_series_is_current(tmp_path):
+    [par_file, bids_out_dir, out_file] = make_series(tmp_path)
+
+    assert utils.series_state(bids_out_dir, par_file, 1, 1, "a") == (False, [])
+
+    utils.record_series(bids_out_dir, par_file, 1, 1, [out_file], "a")
+
+    assert utils.series_state(bids_out_dir, par_file, 1, 1, "a") == (True, [out_file])
+    assert utils.series_state(bids_out_dir, par_file, 1, 1, "b") == (False, [out_file])
+
+def test_changed_source_is_not_current(tmp_path):
+    [par_file, bids_out_dir, out_file] = make_series(tmp_path)
+    utils.record_series(bids_out_dir, par_file, 1, 1, [out_file], "a")
+
+    # The REC file is part of the source data of a PAR file
+    rec_file = os.path.splitext(par_file)[0] + ".REC"
+    st = os.stat(rec_file)
+    os.utime(rec_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert utils.series_state(bids_out_dir, par_file, 1, 1, "a") == (False, [out_file])
+
+def test_missing_output_is_not_current(tmp_path):
+    [par_file, bids_out_dir, out_file] = make_series(tmp_path)
+    utils.record_series(bids_out_dir, par_file, 1, 1, [out_file], "a")
+    os.remove(out_file)
+
+    assert utils.series_state(bids_out_dir, par_file, 1, 1, "a")[0] is False
+
+def test_outputs_are_relative_to_bids_directory(tmp_path):
+    [par_file, bids_out_dir, out_file] = make_series(tmp_path)
+    utils.record_series(bids_out_dir, par_file, 1, 1, [out_file], "a")
+
+    copy_dir = os.path.join(str(tmp_path), "copy")
+    shutil.copytree(bids_out_dir, copy_dir)
+
+    assert utils.series_state(copy_dir, par_file, 1, 1, "a") == (True, [os.path.join(copy_dir, os.path.relpath(out_file, bids_out_dir))])
+
+def test_outputs_outside_bids_directory_are_ignored(tmp_path):
+    [par_file, bids_out_dir, out_file] = make_series(tmp_path)
+    outside_file = os.path.join(str(tmp_path), "outside.nii.gz")
+    open(outside_file, "w").close()
+
+    utils.record_series(bids_out_dir, par_file, 1, 1, [out_file, outside_file], "a")
+
+    assert utils.series_state(bids_out_dir, par_file, 1, 1, "a") == (False, [out_file])
+
+    # Previous outputs outside the BIDS directory are not removed
+    utils.remove_outputs(bids_out_dir, [outside_file])
+    assert os.path.exists(outside_file)
+
+@pytest.mark.parametrize("rerun", ["force", "changed"])
+def test_failed_rerun_keeps_previous_outputs(tmp_path, monkeypatch, rerun):
+    data_dir = os.path.join(str(tmp_path), "data")
+    os.makedirs(data_dir)
+    par_file = fixtures.make_par(os.path.join(data_dir, "s_T1_TFE.PAR"))
+    bids_out_dir = os.path.join(str(tmp_path), "bids")
+    [search_dict, exclusion_list, meta_dict] = cs.read_config(fixtures.CONFIG_FILE)
+
+    # Convert the series with the test backend
+    monkeypatch.setitem(utils.CONVERSION_OPTS, "backends", {"default": "fake"})
+    [converted_files, failed_files] = cs.batch_convert(bids_out_dir, 1, [par_file], search_dict, meta_dict=meta_dict)
+    assert converted_files and not failed_files
+    cfg_hash = cs._config_hash(search_dict, meta_dict, True)
+    assert utils.series_state(bids_out_dir, par_file, 1, 1, cfg_hash)[0]
+
+    # Convert it again with a dcm2niix that fails
+    bin_dir = os.path.join(str(tmp_path), "bin")
+    os.makedirs(bin_dir)
+    dcm2niix = os.path.join(bin_dir, "dcm2niix")
+    with open(dcm2niix, "w") as file:
+        file.write("#!/bin/sh\necho 'conversion failed' >&2\nexit 2\n")
+    os.chmod(dcm2niix, os.stat(dcm2niix).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.setitem(utils.CONVERSION_OPTS, "backends", {"default": "dcm2niix"})
+
+    if rerun == "changed":
+        with open(par_file, "a") as file:
+            file.write("\n")
+    [files, failed_files] = cs.batch_convert(bids_out_dir, 1, [par_file], search_dict, meta_dict=meta_dict, force=rerun == "force")
+
+    # The previous outputs (and their record) are kept, and the temporary directory is removed
+    assert not files
+    assert all(os.path.exists(out) for out in converted_files)
+    assert sorted(utils.series_state(bids_out_dir, par_file, 1, 1, cfg_hash)[1]) == sorted(converted_files)
+    assert not glob.glob(os.path.join(bids_out_dir, "sub-*", "tmp_dir*"))